@@ -0,0 +1,79 @@
+"""Benchmark Adam updates of CPU params.
+
+It compares the ``cpu_adam`` extension, the multi-tensor PyTorch fallback of ``CPUAdam``
+and the per-tensor PyTorch loop.
+
+Usage:
+    python benchmark_cpu_adam.py --num_tensors 64 --numel 1048576 --steps 10
+"""
+import argparse
+import time
+
+import torch
+from colossalai.nn.optimizer import CPUAdam
+
+LR, BETA1, BETA2, EPS, WEIGHT_DECAY = 1e-3, 0.9, 0.999, 1e-8, 0.01
+
+
+def make_tensors(num_tensors, numel, p_dtype, g_dtype):
+    params = [torch.rand(numel, dtype=p_dtype) for _ in range(num_tensors)]
+    grads = [torch.rand(numel, dtype=g_dtype) for _ in range(num_tensors)]
+    exp_avgs = [torch.zeros(numel) for _ in range(num_tensors)]
+    exp_avg_sqs = [torch.zeros(numel) for _ in range(num_tensors)]
+    return params, grads, exp_avgs, exp_avg_sqs
+
+
+def bench(name, update_fn, steps, numel_per_step):
+    # warm up
+    update_fn(1)
+    start = time.time()
+    for step in range(2, steps + 2):
+        update_fn(step)
+    elapsed = (time.time() - start) / steps
+    print(f'{name:>14}: {elapsed * 1000:8.2f} ms/step, {numel_per_step / elapsed / 1e9:6.2f} G params/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_tensors', type=int, default=64)
+    parser.add_argument('--numel', type=int, default=2**20)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--fp16_grad', action='store_true')
+    args = parser.parse_args()
+
+    g_dtype = torch.half if args.fp16_grad else torch.float
+    numel_per_step = args.num_tensors * args.numel
+    optim = CPUAdam([torch.nn.Parameter(torch.zeros(1))], lr=LR, weight_decay=WEIGHT_DECAY)
+    print(f'{args.num_tensors} tensors x {args.numel} elements, grad dtype {g_dtype}, '
+          f'{torch.get_num_threads()} threads')
+
+    def bias_corrections(step):
+        return 1 - BETA1**step, 1 - BETA2**step
+
+    params, grads, exp_avgs, exp_avg_sqs = make_tensors(args.num_tensors, args.numel, torch.float, g_dtype)
+
+    def loop_update(step):
+        for p, g, m, v in zip(params, grads, exp_avgs, exp_avg_sqs):
+            optim.torch_adam_update(p, g, m, v, LR, BETA1, BETA2, EPS, WEIGHT_DECAY, *bias_corrections(step), True)
+
+    def multi_tensor_update(step):
+        optim.torch_multi_tensor_adam_update(params, grads, exp_avgs, exp_avg_sqs, LR, BETA1, BETA2, EPS,
+                                             WEIGHT_DECAY, *bias_corrections(step), True)
+
+    bench('per-tensor', loop_update, args.steps, numel_per_step)
+    bench('multi-tensor', multi_tensor_update, args.steps, numel_per_step)
+
+    if optim.cpu_adam_op is None:
+        print('cpu_adam extension is not installed, skip it')
+        return
+
+    def extension_update(step):
+        for p, g, m, v in zip(params, grads, exp_avgs, exp_avg_sqs):
+            optim.cpu_adam_op.adam_update(optim.opt_id, step, LR, BETA1, BETA2, EPS, WEIGHT_DECAY, True, p, g, m, v,
+                                          -1)
+
+    bench('extension', extension_update, args.steps, numel_per_step)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,9 +8,12 @@ from torch.optim import Optimizer
 from torch.nn.modules.loss import _Loss
 from .torch_amp import convert_to_torch_amp
 from .apex_amp import convert_to_apex_amp
-from .naive_amp import convert_to_naive_amp
+from .naive_amp import convert_to_naive_amp, convert_to_bf16_amp
 
-__all__ = ['convert_to_amp', 'convert_to_naive_amp', 'convert_to_apex_amp', 'convert_to_torch_amp', 'AMP_TYPE']
+__all__ = [
+    'convert_to_amp', 'convert_to_naive_amp', 'convert_to_bf16_amp', 'convert_to_apex_amp', 'convert_to_torch_amp',
+    'AMP_TYPE'
+]
 
 
 def convert_to_amp(model: nn.Module, optimizer: Optimizer, criterion: _Loss, mode: AMP_TYPE, amp_config: Config = None):
@@ -33,6 +36,7 @@ def convert_to_amp(model: nn.Module, optimizer: Optimizer, criterion: _Loss, mod
         `apex_amp config <https://nvidia.github.io/apex/amp.html?highlight=apex%20amp>`_.
         For ``naive_amp``, please check
         `naive_amp config <https://github.com/hpcaitech/ColossalAI/blob/main/colossalai/amp/naive_amp/_fp16_optimizer.py#L42>`_.
+        For ``bf16_amp``, please check :func:`colossalai.amp.convert_to_bf16_amp`.
         For ``torch_amp``, please check
         `torch_amp config <https://github.com/pytorch/pytorch/blob/master/torch/cuda/amp/grad_scaler.py#L97>`_.
     """
@@ -48,5 +52,7 @@ def convert_to_amp(model: nn.Module, optimizer: Optimizer, criterion: _Loss, mod
         model, optimizer = convert_to_apex_amp(model, optimizer, amp_config)
     elif mode == AMP_TYPE.NAIVE:
         model, optimizer = convert_to_naive_amp(model, optimizer, amp_config)
+    elif mode == AMP_TYPE.BF16:
+        model, optimizer = convert_to_bf16_amp(model, optimizer, amp_config)
 
     return model, optimizer, criterion
@@ -8,3 +8,4 @@ class AMP_TYPE(Enum):
     APEX = 'apex'
     TORCH = 'torch'
     NAIVE = 'naive'
+    BF16 = 'bf16'
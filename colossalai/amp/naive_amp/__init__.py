@@ -1,4 +1,5 @@
 import inspect
+import torch
 import torch.nn as nn
 from torch.optim import Optimizer
 from colossalai.utils import is_no_pp_or_last_stage
@@ -7,6 +8,18 @@ from .grad_scaler import DynamicGradScaler, ConstantGradScaler
 from ._fp16_optimizer import FP16Optimizer
 
 
+def _wrap_naive_amp_model(model: nn.Module, dtype: torch.dtype):
+    if isinstance(model, nn.ModuleList):
+        # interleaved pipeline
+        module_list = []
+        for chunk, m in enumerate(model):
+            output_to_fp32 = is_no_pp_or_last_stage() and chunk == len(model) - 1
+            module_list.append(NaiveAMPModel(m, output_to_fp32=output_to_fp32, dtype=dtype))
+        return nn.ModuleList(module_list)
+    output_to_fp32 = is_no_pp_or_last_stage()
+    return NaiveAMPModel(model, output_to_fp32=output_to_fp32, dtype=dtype)
+
+
 def convert_to_naive_amp(model: nn.Module, optimizer: Optimizer, amp_config):
     """A helper function to wrap training components with naive AMP modules. In this mode,
     we forcibly cast the model weights and inputs to FP16, and cast the model outputs to FP32 to calculate loss,
@@ -27,16 +40,7 @@ def convert_to_naive_amp(model: nn.Module, optimizer: Optimizer, amp_config):
                                           Note that clipping is ignored if clip_grad == 0.
         dynamic_grad_scale (bool): whether to use dynamic grad scaler.
     """
-    if isinstance(model, nn.ModuleList):
-        # interleaved pipeline
-        module_list = []
-        for chunk, m in enumerate(model):
-            output_to_fp32 = is_no_pp_or_last_stage() and chunk == len(model) - 1
-            module_list.append(NaiveAMPModel(m, output_to_fp32=output_to_fp32))
-        model = nn.ModuleList(module_list)
-    else:
-        output_to_fp32 = is_no_pp_or_last_stage()
-        model = NaiveAMPModel(model, output_to_fp32=output_to_fp32)
+    model = _wrap_naive_amp_model(model, torch.half)
 
     use_dynamic_grad_scaler = amp_config.pop('dynamic_grad_scale', True)
     if use_dynamic_grad_scaler:
@@ -54,4 +58,31 @@ def convert_to_naive_amp(model: nn.Module, optimizer: Optimizer, amp_config):
     return model, optimizer
 
 
-__all__ = ['convert_to_naive_amp', 'NaiveAMPOptimizer', 'FP16Optimizer']
+def convert_to_bf16_amp(model: nn.Module, optimizer: Optimizer, amp_config):
+    """A helper function to wrap training components with bf16 AMP modules. In this mode,
+    we cast the model weights and inputs to BF16, and cast the model outputs to FP32 to calculate loss.
+    As bf16 has the same exponent range as fp32, loss scaling and overflow checks are skipped.
+    It works on both CPU and GPU.
+
+    Args:
+        model (:class:`torch.nn.Module`): your model object
+        optimizer (:class:`torch.optim.Optimizer`): your optimizer object
+        amp_config (:class:`colossalai.context.Config` or dict): configuration for bf16 mode amp.
+
+    Returns:
+        Tuple: A tuple (model, optimizer)
+
+    The ``amp_config`` should contain parameters below::
+
+        verbose (bool, optional): if set to `True`, will print debug info (Default: False).
+        clip_grad_norm (float, optional): clip gradients with this global L2 norm (Default 0).
+                                          Note that clipping is ignored if clip_grad == 0.
+        master_weights (bool, optional): whether to keep fp32 master weights (Default: True).
+                                         Clipping requires master weights.
+    """
+    model = _wrap_naive_amp_model(model, torch.bfloat16)
+    optimizer = NaiveAMPOptimizer(optimizer, None, **amp_config)
+    return model, optimizer
+
+
+__all__ = ['convert_to_naive_amp', 'convert_to_bf16_amp', 'NaiveAMPOptimizer', 'FP16Optimizer']
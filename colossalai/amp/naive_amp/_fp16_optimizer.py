@@ -1,42 +1,64 @@
 #!/usr/bin/env python
 # -*- encoding: utf-8 -*-
 
+from typing import Optional
+
 import torch
 import torch.distributed as dist
 
-try:
-    import colossal_C
-except:
-    print('Colossalai should be built with cuda extension to use the FP16 optimizer')
-
+from torch._utils import _flatten_dense_tensors
 from torch.optim import Optimizer
 from colossalai.core import global_context as gpc
 from colossalai.context import ParallelMode
 from colossalai.logging import get_dist_logger
-from colossalai.utils import (copy_tensor_parallel_attributes, clip_grad_norm_fp32, multi_tensor_applier)
+from colossalai.utils import copy_tensor_parallel_attributes, clip_grad_norm_fp32
 from torch.distributed import ProcessGroup
 from .grad_scaler import BaseGradScaler
-from ._utils import has_inf_or_nan, zero_gard_by_list
+from ._utils import unscale_and_check_overflow, zero_gard_by_list
 
 __all__ = ['FP16Optimizer']
 
 
-def _multi_tensor_copy_this_to_that(this, that, overflow_buf=None):
-    """
-    adapted from Megatron-LM (https://github.com/NVIDIA/Megatron-LM)
+def _split_flat_tensor(flat_tensor, tensors):
+    """Return views of ``flat_tensor`` with the shapes of ``tensors``."""
+    views = []
+    offset = 0
+    for tensor in tensors:
+        numel = tensor.numel()
+        views.append(flat_tensor[offset:offset + numel].view_as(tensor))
+        offset += numel
+    return views
 
-    Use multi-tensor-applier to copy values from one list to another.
-    We don't have a blfoat16 implementation so for now if the overflow_buf
-    is not provided, we default back to simple loop copy to be compatible
-    with bfloat16.
+
+def _get_union_process_group(*process_groups):
+    """Return a process group over the ranks connected by ``process_groups``,
+    so that one all-reduce replaces consecutive all-reduces over each of them.
+    Creating the group is collective over all ranks.
     """
-    if overflow_buf:
-        overflow_buf.fill_(0)
-        # Scaling with factor `1.0` is equivalent to copy.
-        multi_tensor_applier(colossal_C.multi_tensor_scale, overflow_buf, [this, that], 1.0)
-    else:
-        for this_, that_ in zip(this, that):
-            that_.copy_(this_)
+    process_groups = list({id(pg): pg for pg in process_groups if pg is not None}.values())
+    if len(process_groups) <= 1:
+        return process_groups[0] if process_groups else None
+
+    local_ranks = set()
+    for pg in process_groups:
+        local_ranks.update(dist.distributed_c10d._pg_group_ranks[pg].keys())
+    ranks_of_all = [None] * dist.get_world_size()
+    dist.all_gather_object(ranks_of_all, sorted(local_ranks))
+
+    # merge overlapping rank sets into connected components
+    components = []
+    for ranks in map(set, ranks_of_all):
+        for component in [c for c in components if not c.isdisjoint(ranks)]:
+            components.remove(component)
+            ranks |= component
+        components.append(ranks)
+
+    union_group = None
+    for ranks in sorted(sorted(c) for c in components):
+        group = dist.new_group(ranks)
+        if dist.get_rank() in ranks:
+            union_group = group
+    return union_group
 
 
 class FP16Optimizer(Optimizer):
@@ -44,37 +66,43 @@ class FP16Optimizer(Optimizer):
     
     Args:
         optimizer (torch.optim.Optimizer): base optimizer such as Adam or SGD
-        grad_scaler (BaseGradScaler): grad scaler for gradient chose in
+        grad_scaler (BaseGradScaler, optional): grad scaler for gradient chose in
                                       ``constant_grad_scaler`` or ``dynamic_grad_scaler``.
+                                      If None, loss scaling and overflow checks are skipped, which suits bf16.
         clip_grad_norm (float, optional): clip gradients with this global L2 norm. Default 0.
                         Note that clipping is ignored if clip_grad == 0
         verbose (bool, optional): if set to `True`, will print debug info. Default False.
+        master_weights (bool, optional): whether to keep fp32 master weights of fp16 and bf16 params.
+                        If False, these params are updated in place. Default True.
     """
 
     def __init__(self,
                  optimizer: Optimizer,
-                 grad_scaler: BaseGradScaler,
+                 grad_scaler: Optional[BaseGradScaler],
                  verbose: bool = False,
                  clip_grad_norm=0,
                  dp_process_group: ProcessGroup = None,
-                 mp_process_group: ProcessGroup = None):
+                 mp_process_group: ProcessGroup = None,
+                 master_weights: bool = True):
         # have a defaults for compatibility with pytorch optim
         self._optimizer = optimizer
         self._defaults = optimizer.defaults
 
         # fp16-related params
-        assert isinstance(grad_scaler, BaseGradScaler)
+        assert grad_scaler is None or isinstance(grad_scaler, BaseGradScaler)
         self._grad_scaler = grad_scaler
-        self._found_overflow = torch.cuda.FloatTensor([0.0])
-        self._dummy_overflow_buf = torch.cuda.IntTensor([0])
+        if grad_scaler is not None:
+            self._found_overflow = torch.zeros(1, device=grad_scaler.scale.device)
 
         # misc params
         self._clip_grad_max_norm = clip_grad_norm
+        self._master_weights = master_weights
+        assert master_weights or clip_grad_norm == 0, 'Clipping gradients requires fp32 master weights'
 
         # get process group
         def _get_process_group(parallel_mode):
-            if gpc.is_initialized(ParallelMode.DATA) and gpc.get_world_size(ParallelMode.DATA):
-                return gpc.get_group(ParallelMode.DATA)
+            if gpc.is_initialized(parallel_mode) and gpc.get_world_size(parallel_mode) > 1:
+                return gpc.get_group(parallel_mode)
             else:
                 return None
 
@@ -85,13 +113,18 @@ class FP16Optimizer(Optimizer):
 
         self._dp_process_group = dp_process_group
         self._mp_process_group = mp_process_group
+        # overflow flags are reduced over dp and mp groups with a single all-reduce
+        self._overflow_process_group = None
+        if grad_scaler is not None:
+            self._overflow_process_group = _get_union_process_group(dp_process_group, mp_process_group)
 
         # we maintain three groups of parameters
         # so that the model can have a mixture
         # of fp16 and fp32 params
         # fp16_param_groups: the fp16 params of the model
         # fp32_master_param_groups: the fp32 params cast from the fp16 param of the model
-        # fp32_param_groups: the fp32 params of the model
+        # fp32_param_groups: the fp32 params of the model,
+        #                    and the fp16 params of the model if master weights are not kept
         # NOTE:
         # 1. fp16_param_groups and fp32_master_param_groups have one-to-one correspondence
         # 2. fp32_param_groups and fp16_param_groups are exclusive of each other
@@ -99,41 +132,68 @@ class FP16Optimizer(Optimizer):
         self._fp32_master_param_groups = []
         self._fp32_param_groups = []
 
+        # the fp16 params, fp32 master params and their grads of each group live in flat buffers,
+        # and the params and grads are views of them, so that each step works on a single tensor per group
+        # NOTE: the flat buffers are None for groups without fp16 params
+        self._fp16_flat_params = []
+        self._fp32_flat_master_params = []
+        self._fp32_flat_master_grads = []
+        self._fp32_master_grad_groups = []
+
         # For all the groups in the original optimizer:
         for param_group in self._optimizer.param_groups:
             fp16_params = []
+            fp16_param_indices = []
             fp32_master_params = []
             fp32_params = []
             # For all the parameters in this group:
             for i, param in enumerate(param_group['params']):
                 if param.requires_grad:
+                    if param.dtype not in (torch.float, torch.half, torch.bfloat16):
+                        raise TypeError('Expected parameter of dtype torch.float, torch.half '
+                                        f'or torch.bfloat16, but got {param.dtype}')
+
                     # float16 params:
-                    if param.type() in ['torch.cuda.HalfTensor']:
+                    if param.dtype in (torch.half, torch.bfloat16) and master_weights:
                         fp16_params.append(param)
+                        fp16_param_indices.append(i)
 
-                        # Create a fp32 copy
-                        fp32_param = param.detach().clone().float()
-                        # Copy tensor model parallel attributes.
-                        copy_tensor_parallel_attributes(param, fp32_param)
+                    # params updated in place.
+                    else:
+                        fp32_params.append(param)
 
-                        # Replace the optimizer params with the new fp32 copy.
-                        param_group['params'][i] = fp32_param
-                        fp32_master_params.append(fp32_param)
+            fp16_flat_param, fp32_flat_master_param, fp32_flat_master_grad = None, None, None
+            fp32_master_grads = []
+            if len(fp16_params) > 0:
+                # Move fp16 params into a flat buffer
+                fp16_flat_param = _flatten_dense_tensors([param.data for param in fp16_params])
+                for param, fp16_view in zip(fp16_params, _split_flat_tensor(fp16_flat_param, fp16_params)):
+                    param.data = fp16_view
 
-                        # Reset existing state dict key to the new main param.
-                        if param in self._optimizer.state:
-                            self._optimizer.state[fp32_param] = self._optimizer.state.pop(param)
+                # Create a fp32 copy
+                fp32_flat_master_param = fp16_flat_param.float()
+                fp32_flat_master_grad = torch.zeros_like(fp32_flat_master_param)
+                fp32_master_params = _split_flat_tensor(fp32_flat_master_param, fp16_params)
+                fp32_master_grads = _split_flat_tensor(fp32_flat_master_grad, fp16_params)
 
-                    # fp32 params.
-                    elif param.type() == 'torch.cuda.FloatTensor':
-                        fp32_params.append(param)
-                    else:
-                        raise TypeError('Expected parameter of type torch.cuda.FloatTensor '
-                                        f'or torch.cuda.HalfTensor, but got {param.type()}')
+                for i, param, fp32_param in zip(fp16_param_indices, fp16_params, fp32_master_params):
+                    # Copy tensor model parallel attributes.
+                    copy_tensor_parallel_attributes(param, fp32_param)
+
+                    # Replace the optimizer params with the new fp32 copy.
+                    param_group['params'][i] = fp32_param
+
+                    # Reset existing state dict key to the new main param.
+                    if param in self._optimizer.state:
+                        self._optimizer.state[fp32_param] = self._optimizer.state.pop(param)
 
             self._fp16_param_groups.append(fp16_params)
             self._fp32_master_param_groups.append(fp32_master_params)
             self._fp32_param_groups.append(fp32_params)
+            self._fp16_flat_params.append(fp16_flat_param)
+            self._fp32_flat_master_params.append(fp32_flat_master_param)
+            self._fp32_flat_master_grads.append(fp32_flat_master_grad)
+            self._fp32_master_grad_groups.append(fp32_master_grads)
 
         # Leverage state_dict() and load_state_dict() to
         # recast preexisting per-param state tensors
@@ -146,6 +206,7 @@ class FP16Optimizer(Optimizer):
                 f"\n=========  FP16 Optimizer Config =========\n"
                 f"Optimizer: {optimizer.__class__.__name__}\n"
                 f"clip_grad_norm = {clip_grad_norm}\n"
+                f"master_weights = {master_weights}\n"
                 f"grad_scaler = {self._grad_scaler.__class__.__name__}"
                 f"==========================================",
                 ranks=[0])
@@ -165,8 +226,10 @@ class FP16Optimizer(Optimizer):
         """Returns the loss scale.
 
         Returns:
-            int: loss scale.
+            int: loss scale, 1 if there is no grad scaler.
         """
+        if self._grad_scaler is None:
+            return 1.0
         return self._grad_scaler.scale
 
     @property
@@ -187,25 +250,21 @@ class FP16Optimizer(Optimizer):
         """
         return self._defaults
 
-    def _check_overflow(self):
+    def _unscale_grads_and_check_overflow(self):
         # clear previous overflow record
         self._found_overflow.fill_(0.0)
 
-        # check for overflow
-        for group in self._optimizer.param_groups:
-            for p in group['params']:
-                if p.grad is not None and has_inf_or_nan(p.grad):
-                    self._found_overflow.fill_(1.0)
-                    break
+        # unscale and check for overflow in one pass on device
+        grads = [flat_grad for flat_grad in self._fp32_flat_master_grads if flat_grad is not None]
+        for group in self._fp32_param_groups:
+            grads.extend(p.grad.data for p in group if p.grad is not None)
+        unscale_and_check_overflow(grads, self._grad_scaler.inv_scale, self._found_overflow)
 
-        # all-reduce across dp group
-        if self._dp_process_group:
-            dist.all_reduce(self._found_overflow, op=dist.ReduceOp.MAX, group=self._dp_process_group)
-
-        # all-reduce over model parallel group
-        if self._mp_process_group:
-            dist.all_reduce(self._found_overflow, op=dist.ReduceOp.MAX, group=self._mp_process_group)
+        # all-reduce across dp and mp groups
+        if self._overflow_process_group is not None:
+            dist.all_reduce(self._found_overflow, op=dist.ReduceOp.MAX, group=self._overflow_process_group)
 
+    def _sync_overflow(self):
         return self._found_overflow.item() > 0
 
     def zero_grad(self, set_to_none=True):
@@ -222,31 +281,36 @@ class FP16Optimizer(Optimizer):
     def _get_fp32_param_groups_to_update(self):
         return self._fp32_master_param_groups + self._fp32_param_groups
 
-    def _unscale_grads(self):
-        for group in self._get_fp32_param_groups_to_update():
-            for p in group:
-                if p.grad is not None:
-                    p.grad.data.div_(self.loss_scale)
-
     def _assign_grad_to_fp32_master_param(self):
         # This only needs to be done for the float16 group.
-        for fp16_param_group, fp32_master_param_group in zip(self._fp16_param_groups, self._fp32_master_param_groups):
-            for fp16_param, fp32_param in zip(fp16_param_group, fp32_master_param_group):
+        for fp16_param_group, fp32_master_param_group, fp32_master_grad_group, fp32_flat_master_grad in zip(
+                self._fp16_param_groups, self._fp32_master_param_groups, self._fp32_master_grad_groups,
+                self._fp32_flat_master_grads):
+            if fp32_flat_master_grad is None:
+                continue
+            fp16_grads = [fp16_param.grad for fp16_param in fp16_param_group]
+            has_all_grads = all(grad is not None for grad in fp16_grads)
+            if has_all_grads:
+                # cast-copy all grads into the flat buffer at once
+                torch.cat([grad.reshape(-1) for grad in fp16_grads], out=fp32_flat_master_grad)
+
+            for fp16_param, fp32_param, fp32_grad in zip(fp16_param_group, fp32_master_param_group,
+                                                         fp32_master_grad_group):
                 if fp16_param.grad is not None:
-                    fp32_param.grad = fp16_param.grad.float()
+                    if not has_all_grads:
+                        fp32_grad.copy_(fp16_param.grad)
+                    fp32_param.grad = fp32_grad
                     # clear unneeded grad on fp16 param
                     fp16_param.grad = None
+                else:
+                    # keep the flat buffer finite for params without grads
+                    fp32_grad.zero_()
+                    fp32_param.grad = None
 
     def _update_fp16_param_from_fp32_param(self):
-        fp16_param_data = []
-        fp32_master_param_data = []
-        for fp16_group, fp32_group in zip(self._fp16_param_groups, self._fp32_master_param_groups):
-            for fp16_param, fp32_param in zip(fp16_group, fp32_group):
-                fp16_param_data.append(fp16_param.data)
-                fp32_master_param_data.append(fp32_param.data)
-        _multi_tensor_copy_this_to_that(this=fp32_master_param_data,
-                                        that=fp16_param_data,
-                                        overflow_buf=self._dummy_overflow_buf)
+        for fp16_flat_param, fp32_flat_master_param in zip(self._fp16_flat_params, self._fp32_flat_master_params):
+            if fp16_flat_param is not None:
+                fp16_flat_param.copy_(fp32_flat_master_param)
 
     def step(self):
         """Update the model parameters.
@@ -254,20 +318,23 @@ class FP16Optimizer(Optimizer):
 
         # Copy gradients from model params to main params.
         self._assign_grad_to_fp32_master_param()
-        self._unscale_grads()
+        if self._grad_scaler is not None:
+            self._unscale_grads_and_check_overflow()
 
-        overflow = self._check_overflow()
-        self._grad_scaler.update(overflow)
-
-        if overflow:
-            self.zero_grad()
-            return False, None
-
-        # Clip the main gradients.
+        # Clip the main gradients before reading the overflow flag, so that the host sync overlaps with clipping.
+        # Clipped grads are discarded if overflow occurs.
         grad_norm = None
         if self._clip_grad_max_norm > 0.0:
             grad_norm = self.clip_grad_norm(self._clip_grad_max_norm)
 
+        if self._grad_scaler is not None:
+            overflow = self._sync_overflow()
+            self._grad_scaler.update(overflow)
+
+            if overflow:
+                self.zero_grad()
+                return False, None
+
         # Step the optimizer.
         self._optimizer.step()
 
@@ -284,8 +351,11 @@ class FP16Optimizer(Optimizer):
             loss (:class:`torch.Tensor`): the loss value.
         """
 
-        scaled_loss = loss * self.grad_scaler.scale
-        scaled_loss.backward()
+        if self._grad_scaler is None:
+            loss.backward()
+        else:
+            scaled_loss = loss * self.grad_scaler.scale
+            scaled_loss.backward()
 
     def state_dict(self):
         """Returns the states of the fp16 optimizer as a dict object.
@@ -309,7 +379,7 @@ class FP16Optimizer(Optimizer):
         self._optimizer.load_state_dict(state_dict['optimizer'])
 
         # Grad scaler.
-        if 'grad_scaler' in state_dict:
+        if 'grad_scaler' in state_dict and self.grad_scaler:
             self.grad_scaler.load_state_dict(state_dict['grad_scaler'])
 
         # Copy data for the main params.
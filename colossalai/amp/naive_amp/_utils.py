@@ -1,4 +1,6 @@
 from typing import List
+
+import torch
 from torch import Tensor
 
 
@@ -31,6 +33,27 @@ def has_inf_or_nan(tensor):
         return False
 
 
+def unscale_and_check_overflow(tensors: List[Tensor], inv_scale: Tensor, found_overflow: Tensor) -> None:
+    """Multiply tensors by ``inv_scale`` in place and set ``found_overflow`` to 1 if any of them has inf or nan.
+    For CUDA tensors, the check is fused into the unscale pass. Otherwise, overflow flags are accumulated on device.
+    No host sync happens in either case.
+
+    Args:
+        tensors (List[:class:`torch.Tensor`]): tensors on the same device
+        inv_scale (:class:`torch.Tensor`): one-element float tensor on the device of ``tensors``
+        found_overflow (:class:`torch.Tensor`): one-element float tensor on the device of ``tensors``
+    """
+    if len(tensors) == 0:
+        return
+    if tensors[0].is_cuda:
+        torch._amp_foreach_non_finite_check_and_unscale_(tensors, found_overflow, inv_scale)
+    else:
+        for tensor in tensors:
+            tensor.mul_(inv_scale)
+            found_overflow.add_(torch.isfinite(tensor).all().logical_not())
+        found_overflow.clamp_(max=1.0)
+
+
 def zero_gard_by_list(tensor_list: List[Tensor], set_to_none: bool = True) -> None:
     """Clear the gradient of a list of tensors,
 
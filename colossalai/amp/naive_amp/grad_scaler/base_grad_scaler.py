@@ -4,6 +4,7 @@
 import torch
 from abc import ABC, abstractmethod
 from colossalai.logging import get_dist_logger
+from colossalai.utils import get_current_device
 from torch import Tensor
 from typing import Dict
 
@@ -20,7 +21,7 @@ class BaseGradScaler(ABC):
 
     def __init__(self, initial_scale: float, verbose: bool):
         assert initial_scale > 0
-        self._scale = torch.cuda.FloatTensor([initial_scale])
+        self._scale = torch.tensor([initial_scale], dtype=torch.float, device=get_current_device())
         self._verbose = verbose
 
         if self._verbose:
@@ -55,7 +56,7 @@ class BaseGradScaler(ABC):
             state_dict (dict): the states of the gradient scaler
         """
 
-        self._scale = state_dict['scale']
+        self._scale = state_dict['scale'].to(self._scale.device)
 
     @abstractmethod
     def update(self, overflow: bool) -> None:
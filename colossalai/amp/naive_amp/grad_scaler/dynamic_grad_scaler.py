@@ -33,12 +33,12 @@ class DynamicGradScaler(BaseGradScaler):
                  verbose: bool = False):
         super().__init__(initial_scale, verbose)
         if min_scale:
-            self._min_scale = torch.cuda.FloatTensor([min_scale])
+            self._min_scale = torch.tensor([min_scale], dtype=torch.float, device=self._scale.device)
         else:
             self._min_scale = None
 
         if max_scale:
-            self._max_scale = torch.cuda.FloatTensor([max_scale])
+            self._max_scale = torch.tensor([max_scale], dtype=torch.float, device=self._scale.device)
         else:
             self._max_scale = None
 
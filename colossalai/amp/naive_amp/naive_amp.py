@@ -16,14 +16,16 @@ from ._fp16_optimizer import FP16Optimizer
 
 
 class NaiveAMPOptimizer(ColossalaiOptimizer):
-    """A wrapper class for optimizer to cast all parameters to fp16
+    """A wrapper class for optimizer to cast all parameters to fp16 (or bf16)
 
     Args:
         optim (torch.optim.Optimizer): A normal optimizer like Adam or SGD.
-        grad_scaler (BaseGradScaler): grad scaler for gradient chose in
+        grad_scaler (BaseGradScaler, optional): grad scaler for gradient chose in
                                       ``constant_grad_scaler`` or ``dynamic_grad_scaler``.
+                                      If None, loss scaling is disabled.
         clip_grad_norm (float, optional): clip gradients with this global L2 norm. Default 0.
         verbose (bool, optional): if set to `True`, will print debug info. Default False.
+        master_weights (bool, optional): whether to keep fp32 master weights. Default True.
 
     Note:
         clipping is ignored if ``clip_grad_norm`` equals 0.
@@ -44,7 +46,7 @@ class NaiveAMPOptimizer(ColossalaiOptimizer):
 
 
 class NaiveAMPModel(nn.Module):
-    r"""A wrapper class for model to cast the model into fp16 and
+    r"""A wrapper class for model to cast the model into fp16 (or bf16) and
     automatically cast the input and output
 
     Args:
@@ -53,6 +55,8 @@ class NaiveAMPModel(nn.Module):
         parallel_mode (:class:`colossalai.context.ParallelMode`): Parallel group mode used in this module.
                                                                   (Default: ``ParallelMode.DATA``)
         sync_buffer (bool, optional): whether to synchronize buffer. (Default: True)
+        dtype (torch.dtype, optional): the low precision dtype, ``torch.half`` or ``torch.bfloat16``.
+                                       (Default: ``torch.half``)
 
     Note:
         The parallel_mode should be concluded in ``ParallelMode``. More details about ``ParallelMode`` could be found
@@ -63,9 +67,12 @@ class NaiveAMPModel(nn.Module):
                  model: nn.Module,
                  output_to_fp32: bool = True,
                  parallel_mode: ParallelMode = ParallelMode.DATA,
-                 sync_buffer: bool = True):
+                 sync_buffer: bool = True,
+                 dtype: torch.dtype = torch.half):
         super().__init__()
-        self.model = model.half()
+        assert dtype in (torch.half, torch.bfloat16), f'expected torch.half or torch.bfloat16, but got {dtype}'
+        self.dtype = dtype
+        self.model = model.to(dtype)
         self._output_to_fp32 = output_to_fp32
         self._sync_buf = sync_buffer
 
@@ -88,11 +95,11 @@ class NaiveAMPModel(nn.Module):
 
     def _convert_to_fp16(self, input_: Any):
         if isinstance(input_, Tensor) and input_.dtype == torch.float32:
-            input_ = input_.half()
+            input_ = input_.to(self.dtype)
         return input_
 
     def _convert_to_fp32(self, input_: Any):
-        if isinstance(input_, Tensor) and input_.dtype == torch.float16:
+        if isinstance(input_, Tensor) and input_.dtype == self.dtype:
             input_ = input_.float()
         return input_
 
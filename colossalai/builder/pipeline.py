@@ -1,10 +1,14 @@
 import copy
 import heapq
+import time
+from typing import List, NamedTuple, Sequence
 
 from colossalai.builder import build_model, build_layer
 from colossalai.context.parallel_mode import ParallelMode
 from colossalai.core import global_context as gpc
 from colossalai.logging import get_dist_logger
+import torch
+import torch.distributed as dist
 import torch.nn as nn
 
 
@@ -150,6 +154,165 @@ def partition_balanced(weights, pipeline_parallel_size, num_chunks):
     return parts
 
 
+class LayerProfile(NamedTuple):
+    """Cost of a layer for one micro batch, as measured by :func:`profile_layers`."""
+    forward_time: float
+    backward_time: float
+    activation_bytes: int
+
+    @property
+    def time(self) -> float:
+        return self.forward_time + self.backward_time
+
+
+def _synchronize(device: torch.device):
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+def profile_layers(layers: Sequence[nn.Module], sample_input: torch.Tensor, num_iters: int = 3) -> List[LayerProfile]:
+    """Profiles the forward time, backward time and activation memory of each layer on a sample micro batch.
+    Layers are run in sequence, each one on the output of the previous one. The activation memory of a layer
+    is the size of the tensors it saves for backward, parameters excluded.
+
+    If the pipeline parallel group is initialized, the profiles of its first rank are broadcast,
+    so that all stages agree on the partition. Profiling leaves the random number generators
+    and the buffers of the layers, e.g. running statistics, as they were.
+
+    Args:
+        layers (Sequence[:class:`torch.nn.Module`]): Layers of the model, in execution order.
+        sample_input (:class:`torch.Tensor`): A sample micro batch, the input of the first layer.
+        num_iters (int, optional): The number of timed iterations averaged per layer, after one warmup iteration.
+
+    Returns:
+        List[:class:`LayerProfile`]: The profile of each layer.
+    """
+    profiles = []
+    layer_input = sample_input
+    rng_devices = [sample_input.device] if sample_input.is_cuda else []
+    with torch.random.fork_rng(devices=rng_devices):
+        for layer in layers:
+            param_ptrs = {param.data_ptr() for param in layer.parameters()}
+            buffers = [(buffer, buffer.clone()) for buffer in layer.buffers()]
+            forward_time = backward_time = 0.
+            for it in range(num_iters + 1):
+                x = layer_input.detach().requires_grad_(layer_input.is_floating_point())
+                saved = {}
+
+                def pack(tensor):
+                    if tensor.data_ptr() not in param_ptrs:
+                        saved[tensor.data_ptr()] = tensor.numel() * tensor.element_size()
+                    return tensor
+
+                _synchronize(x.device)
+                start = time.perf_counter()
+                with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+                    output = layer(x)
+                if isinstance(output, tuple):
+                    output = output[0]
+                _synchronize(output.device)
+                forward_end = time.perf_counter()
+                if output.requires_grad:
+                    torch.autograd.backward(output, torch.ones_like(output))
+                _synchronize(output.device)
+                if it > 0:
+                    forward_time += forward_end - start
+                    backward_time += time.perf_counter() - forward_end
+            layer.zero_grad(set_to_none=True)
+            with torch.no_grad():
+                for buffer, origin_buffer in buffers:
+                    buffer.copy_(origin_buffer)
+            profiles.append(LayerProfile(forward_time / num_iters, backward_time / num_iters, sum(saved.values())))
+            layer_input = output.detach()
+
+    if gpc.is_initialized(ParallelMode.PIPELINE) and gpc.get_world_size(ParallelMode.PIPELINE) > 1:
+        objects = [profiles]
+        src = gpc.get_ranks_in_group(ParallelMode.PIPELINE)[0]
+        dist.broadcast_object_list(objects, src=src, group=gpc.get_group(ParallelMode.PIPELINE))
+        profiles = objects[0]
+    return profiles
+
+
+def partition_profiled(profiles: Sequence[LayerProfile], pipeline_parallel_size, num_chunks, max_memory=None):
+    """Splits the profiled layers into contiguous parts so that the largest forward and backward time
+    of a part is minimal. Parts are assigned to stages in the same order as :func:`partition_balanced`.
+
+    Args:
+        profiles (Sequence[:class:`LayerProfile`]): Profiles of the layers, as returned by :func:`profile_layers`.
+        pipeline_parallel_size (int): The number of pipeline stages.
+        num_chunks (int): The number of chunks of each stage.
+        max_memory (int, optional): The maximal activation memory of one micro batch on a stage in bytes,
+            which each of its chunks is given an equal share of.
+
+    Returns:
+        List[List[Tuple[int, int]]]: The layer intervals of the chunks of each stage.
+    """
+    num_total = pipeline_parallel_size * num_chunks
+    num_items = len(profiles)
+    if num_items <= num_total:
+        return partition_uniform(num_items, pipeline_parallel_size, num_chunks)
+
+    time_prefix, memory_prefix = [0.], [0]
+    for profile in profiles:
+        time_prefix.append(time_prefix[-1] + profile.time)
+        memory_prefix.append(memory_prefix[-1] + profile.activation_bytes)
+    chunk_max_memory = float('inf') if max_memory is None else max_memory / num_chunks
+
+    # cost[k][i] is the minimal largest part time when splitting the first i layers into k parts
+    inf = float('inf')
+    cost = [[inf] * (num_items + 1) for _ in range(num_total + 1)]
+    split = [[0] * (num_items + 1) for _ in range(num_total + 1)]
+    cost[0][0] = 0.
+    for k in range(1, num_total + 1):
+        for i in range(k, num_items - (num_total - k) + 1):
+            # extend the last part backwards, its time and memory only grow
+            for j in range(i - 1, k - 2, -1):
+                part_time = time_prefix[i] - time_prefix[j]
+                if part_time >= cost[k][i] or memory_prefix[i] - memory_prefix[j] > chunk_max_memory:
+                    break
+                part_cost = max(cost[k - 1][j], part_time)
+                if part_cost < cost[k][i]:
+                    cost[k][i], split[k][i] = part_cost, j
+
+    if cost[num_total][num_items] == inf:
+        raise ValueError(f'Layers cannot be split into {num_total} parts '
+                         f'with at most {max_memory} bytes of activation memory per stage')
+
+    intervals = []
+    end = num_items
+    for k in range(num_total, 0, -1):
+        intervals.append((split[k][end], end))
+        end = split[k][end]
+    intervals.reverse()
+
+    parts = [[] for _ in range(pipeline_parallel_size)]
+    for idx, inter in enumerate(intervals):
+        parts[idx % pipeline_parallel_size].append(inter)
+    return parts
+
+
+def predict_pipeline_bubble(profiles: Sequence[LayerProfile], parts, num_microbatches: int) -> float:
+    """Predicts the fraction of time stages are idle in a 1F1B pipeline step with the given partition.
+    The step lasts ``num_microbatches`` times the slowest stage, plus the time the other stages take to fill and
+    drain the pipeline, which interleaving shortens by the number of chunks.
+
+    Args:
+        profiles (Sequence[:class:`LayerProfile`]): Profiles of the layers, as returned by :func:`profile_layers`.
+        parts (List[List[Tuple[int, int]]]): The layer intervals of the chunks of each stage.
+        num_microbatches (int): The number of micro batches of a step.
+
+    Returns:
+        float: The predicted bubble fraction, between 0 and 1.
+    """
+    stage_times = [sum(profile.time for st, ed in part for profile in profiles[st:ed]) for part in parts]
+    num_chunks = max(len(part) for part in parts)
+    slowest = max(stage_times)
+    step_time = num_microbatches * slowest + (sum(stage_times) - slowest) / num_chunks
+    if step_time == 0:
+        return 0.
+    return 1 - num_microbatches * sum(stage_times) / (len(parts) * step_time)
+
+
 def count_layer_params(layers):
     """Count the number of parameters in each layer
     """
@@ -237,7 +400,12 @@ def build_pipeline_model_from_cfg(config,
     return nn.ModuleList(models) if len(models) > 1 else models[0]
 
 
-def build_pipeline_model(layers: nn.Sequential, num_chunks: int = 1, verbose: bool = False):
+def build_pipeline_model(layers: nn.Sequential,
+                         num_chunks: int = 1,
+                         verbose: bool = False,
+                         sample_input: torch.Tensor = None,
+                         num_microbatches: int = None,
+                         max_memory: int = None):
     """An intializer to split the model into different stages for pipeline parallelism.
     Note that `layer` must be `torch.nn.Sequential`.
     Args:
@@ -245,10 +413,20 @@ def build_pipeline_model(layers: nn.Sequential, num_chunks: int = 1, verbose: bo
         num_chunks: The number of chunks you want to have on the current stage. This value should be 1
                         in most cases unless you are using virtual pipeline parallelism.
         verbose (bool, optional): Whether to print the logs.
+        sample_input (:class:`torch.Tensor`, optional): A sample micro batch. If given, layers are profiled on it
+            and split by :func:`partition_profiled`, otherwise they are split uniformly.
+        num_microbatches (int, optional): The number of micro batches of a step, used to log the predicted bubble.
+        max_memory (int, optional): The maximal activation memory of one micro batch on a stage in bytes,
+            only used with ``sample_input``.
     """
     pipeline_parallel_size = gpc.get_world_size(ParallelMode.PIPELINE)
     pipeline_rank = gpc.get_local_rank(ParallelMode.PIPELINE)
-    partitions = partition_uniform(len(layers), pipeline_parallel_size, num_chunks)
+    profiles = None
+    if sample_input is None:
+        partitions = partition_uniform(len(layers), pipeline_parallel_size, num_chunks)
+    else:
+        profiles = profile_layers(layers, sample_input)
+        partitions = partition_profiled(profiles, pipeline_parallel_size, num_chunks, max_memory=max_memory)
     module_list = []
     for start, end in partitions[pipeline_rank]:
         module_list.append(
@@ -262,5 +440,12 @@ def build_pipeline_model(layers: nn.Sequential, num_chunks: int = 1, verbose: bo
             for chunk, (start, end) in enumerate(part):
                 log_str += f'===== chunk={chunk}, layer=[{start}-{end}] =====\n'
                 log_str += '\n'.join([str(layer) for layer in layers[start:end]]) + '\n'
+            if profiles is not None:
+                stage_profiles = [profile for start, end in part for profile in profiles[start:end]]
+                log_str += f'===== forward + backward time: {sum(p.time for p in stage_profiles):.6f}s, ' \
+                    f'activation memory: {sum(p.activation_bytes for p in stage_profiles)} bytes =====\n'
             logger.info(log_str, ranks=[0])
+        if profiles is not None and num_microbatches is not None:
+            bubble = predict_pipeline_bubble(profiles, partitions, num_microbatches)
+            logger.info(f'Predicted pipeline bubble: {bubble:.2%}', ranks=[0])
     return nn.ModuleList(module_list) if len(module_list) > 1 else module_list[0]
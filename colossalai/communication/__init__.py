@@ -1,9 +1,9 @@
 from .collective import all_gather, reduce_scatter, all_reduce, broadcast, reduce
 from .p2p import (send_forward, send_forward_recv_forward, send_backward_recv_forward, send_backward,
                   send_backward_recv_backward, send_forward_recv_backward, send_forward_backward_recv_forward_backward,
-                  recv_forward, recv_backward)
+                  recv_forward, recv_backward, P2PWork)
 from .ring import ring_forward
-from .utils import send_tensor_meta, recv_tensor_meta
+from .utils import send_tensor_meta, recv_tensor_meta, wait_tensor_meta_sends
 
 __all__ = [
     'all_gather',
@@ -20,7 +20,9 @@ __all__ = [
     'send_forward_recv_backward',
     'recv_backward',
     'recv_forward',
+    'P2PWork',
     'ring_forward',
     'send_tensor_meta',
     'recv_tensor_meta',
+    'wait_tensor_meta_sends',
 ]
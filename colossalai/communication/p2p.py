@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- encoding: utf-8 -*-
 
-from typing import List, Tuple, Union
+from typing import Any, Callable, List, Optional, Tuple, Union
 import torch
 import torch.distributed as dist
 
@@ -15,6 +15,48 @@ from .utils import split_tensor_into_1d_equal_chunks, gather_split_1d_tensor
 TensorShape = Union[torch.Size, List[int], Tuple[int]]
 
 
+class P2PWork:
+    """Handle of pending pipeline p2p operations, returned by the communication functions
+    when they are called with ``async_op=True``.
+
+    The received tensors must not be used before :meth:`wait` returns them. The sent tensors
+    are kept alive by the handle until the operations complete.
+
+    Args:
+        reqs (List, optional): Requests returned by :func:`torch.distributed.batch_isend_irecv`, or other handles.
+        on_complete (Callable, optional): Called once all requests complete, its return value is the result
+            of :meth:`wait`.
+        send_tensors (optional): Tensors being sent, referenced until the operations complete.
+    """
+
+    def __init__(self, reqs: Optional[List] = None, on_complete: Optional[Callable] = None, send_tensors=None):
+        self._reqs = list(reqs) if reqs is not None else []
+        self._on_complete = on_complete
+        self._send_tensors = send_tensors
+        self._completed = False
+        self._result = None
+
+    def is_completed(self) -> bool:
+        """Returns whether all operations have completed, without blocking."""
+        return self._completed or all(req.is_completed() for req in self._reqs)
+
+    def wait(self) -> Any:
+        """Blocks until all operations complete and returns the received tensors, if any."""
+        if not self._completed:
+            for req in self._reqs:
+                req.wait()
+            if self._on_complete is not None:
+                self._result = self._on_complete()
+            self._reqs, self._on_complete, self._send_tensors = [], None, None
+            self._completed = True
+        return self._result
+
+    def then(self, func: Callable) -> 'P2PWork':
+        """Returns a handle whose :meth:`wait` returns ``func`` applied to the result of this handle."""
+        # depend on this handle rather than its requests, since a request must not be waited on twice
+        return P2PWork([self], lambda: func(self.wait()))
+
+
 def _get_tensor_shape(tensor_shape: TensorShape, chunk_tensor: bool = False) -> Tuple[TensorShape, bool]:
     """get the exact tensor shape when communicating and return whether the tensor is a chunk
 
@@ -57,11 +99,13 @@ def process_object_to_send(object_send, scatter_gather_tensors):
         if send_split:
             object_send = split_tensor_into_1d_equal_chunks(object_send)
         return object_send
+    tensors_send = []
     for tensor_send in object_send:
         send_split = _get_tensor_shape(tensor_send.shape, scatter_gather_tensors)[1]
         if send_split:
             tensor_send = split_tensor_into_1d_equal_chunks(tensor_send)
-    return object_send
+        tensors_send.append(tensor_send)
+    return tensors_send
 
 
 def filling_ops_queue(obj, comm_op, comm_rank, ops_queue):
@@ -83,7 +127,8 @@ def _communicate(object_send_next: Union[torch.Tensor, List[torch.Tensor]] = Non
                  prev_rank: int = None,
                  next_rank: int = None,
                  dtype: torch.dtype = None,
-                 scatter_gather_tensors: bool = False) -> Tuple[Union[torch.Tensor, List[torch.Tensor]]]:
+                 scatter_gather_tensors: bool = False,
+                 async_op: bool = False) -> Union[Tuple[Union[torch.Tensor, List[torch.Tensor]]], P2PWork]:
     """
     Adapted from megatron.p2p_communication.
     Communicate tensors between stages. Used as helper method in other
@@ -103,9 +148,11 @@ def _communicate(object_send_next: Union[torch.Tensor, List[torch.Tensor]] = Non
         next_rank (int): the rank of the next pipeline stage, defualts to None,
         dtype (torch.dtype): data type of intermediate buffers, defaults to None
         scatter_gather_tensors (bool): whether to scatter and gather tensor between pipeline stages, defaults to False
+        async_op (bool): whether to return a :class:`P2PWork` handle instead of waiting, defaults to False
 
     Returns:
-        Tuple[Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]]: returns tensor_recv_prev, tensor_recv_next
+        Tuple[Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]]: returns tensor_recv_prev, tensor_recv_next,
+        or a :class:`P2PWork` whose ``wait()`` returns them if ``async_op`` is True.
     """
 
     # Create placeholder tensors for receive in forward and backward directions
@@ -150,100 +197,123 @@ def _communicate(object_send_next: Union[torch.Tensor, List[torch.Tensor]] = Non
     if object_send_next is not None:
         filling_ops_queue(object_send_next, dist.isend, next_rank, ops)
 
-    if len(ops) > 0:
-        reqs = dist.batch_isend_irecv(ops)
-        for req in reqs:
-            req.wait()
-    # To protect against race condition when using batch_isend_irecv().
-    torch.cuda.synchronize()
+    reqs = dist.batch_isend_irecv(ops) if len(ops) > 0 else []
 
-    if recv_prev and recv_prev_split:
-        if isinstance(tensor_recv_prev, torch.Tensor):
-            tensor_recv_prev = gather_split_1d_tensor(tensor_recv_prev).view(recv_prev_shape).requires_grad_()
-        else:
-            for tensor_recv, tensor_shape in zip(tensor_recv_prev, recv_prev_shape):
-                tensor_recv = gather_split_1d_tensor(tensor_recv).view(tensor_shape).requires_grad_()
+    def _gather_recv_tensors():
+        # Waiting on the requests orders the current stream after the communication,
+        # so no device-wide synchronization is needed before the buffers are used.
+        prev, next_ = tensor_recv_prev, tensor_recv_next
+        if recv_prev and recv_prev_split:
+            prev = _gather_split_tensors(prev, recv_prev_shape)
+        if recv_next and recv_next_split:
+            next_ = _gather_split_tensors(next_, recv_next_shape)
+        return prev, next_
 
-    if recv_next and recv_next_split:
-        if isinstance(tensor_recv_next, torch.Tensor):
-            tensor_recv_next = gather_split_1d_tensor(tensor_recv_next).view(recv_next_shape).requires_grad_()
-        else:
-            for tensor_recv, tensor_shape in zip(tensor_recv_next, recv_next_shape):
-                tensor_recv = gather_split_1d_tensor(tensor_recv).view(tensor_shape).requires_grad_()
+    work = P2PWork(reqs, _gather_recv_tensors, send_tensors=(object_send_prev, object_send_next))
+    if async_op:
+        return work
+    return work.wait()
 
-    return tensor_recv_prev, tensor_recv_next
+
+def _gather_split_tensors(tensor_recv, recv_shape):
+    if isinstance(tensor_recv, torch.Tensor):
+        return gather_split_1d_tensor(tensor_recv).view(recv_shape).requires_grad_()
+    return [
+        gather_split_1d_tensor(tensor).view(tensor_shape).requires_grad_()
+        for tensor, tensor_shape in zip(tensor_recv, recv_shape)
+    ]
+
+
+def _select(result: Union[Tuple, P2PWork], index: int, async_op: bool):
+    if async_op:
+        return result.then(lambda tensors: tensors[index])
+    return result[index]
 
 
 def recv_forward(input_tensor_shape,
                  prev_rank=None,
                  dtype=torch.float,
-                 scatter_gather_tensors=False) -> Union[torch.Tensor, List[torch.Tensor]]:
+                 scatter_gather_tensors=False,
+                 async_op=False) -> Union[torch.Tensor, List[torch.Tensor], P2PWork]:
     """Copy the forward output from the previous stage in pipeline as the input tensor of this stage.
 
     Args:
         input_tensor_shape (Union[:class:`torch.Size`, List[:class:`torch.Size`]]): The shape of the tensor to be received.
         prev_rank (int, optional): The rank of the source of the tensor.
+        async_op (bool, optional): Whether to return a :class:`P2PWork` handle instead of waiting.
 
     Returns:
         Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]: The input tensor or input tensor list.
     """
     if gpc.is_pipeline_first_stage():
-        input_tensor = None
-    else:
-        input_tensor, _ = _communicate(recv_prev=True,
-                                       recv_prev_shape=input_tensor_shape,
-                                       prev_rank=prev_rank,
-                                       dtype=dtype,
-                                       scatter_gather_tensors=scatter_gather_tensors)
-    return input_tensor
+        return P2PWork() if async_op else None
+    result = _communicate(recv_prev=True,
+                          recv_prev_shape=input_tensor_shape,
+                          prev_rank=prev_rank,
+                          dtype=dtype,
+                          scatter_gather_tensors=scatter_gather_tensors,
+                          async_op=async_op)
+    return _select(result, 0, async_op)
 
 
 def recv_backward(output_grad_shape,
                   next_rank=None,
                   dtype=torch.float,
-                  scatter_gather_tensors=False) -> Union[torch.Tensor, List[torch.Tensor]]:
+                  scatter_gather_tensors=False,
+                  async_op=False) -> Union[torch.Tensor, List[torch.Tensor], P2PWork]:
     """Copy the gradient tensor from the next stage in pipeline as the input gradient of this stage.
 
     Args:
         output_grad_shape (Union[:class:`torch.Size`, List[:class:`torch.Size`]]): The shape of the tensor to be received.
         next_rank (int, optional): The rank of the source of the tensor.
+        async_op (bool, optional): Whether to return a :class:`P2PWork` handle instead of waiting.
 
     Returns:
         Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]: The input gradient tensor or gradident tensor list.
     """
     if gpc.is_pipeline_last_stage():
-        output_tensor_grad = None
-    else:
-        _, output_tensor_grad = _communicate(recv_next=True,
-                                             recv_next_shape=output_grad_shape,
-                                             next_rank=next_rank,
-                                             dtype=dtype,
-                                             scatter_gather_tensors=scatter_gather_tensors)
-    return output_tensor_grad
+        return P2PWork() if async_op else None
+    result = _communicate(recv_next=True,
+                          recv_next_shape=output_grad_shape,
+                          next_rank=next_rank,
+                          dtype=dtype,
+                          scatter_gather_tensors=scatter_gather_tensors,
+                          async_op=async_op)
+    return _select(result, 1, async_op)
 
 
-def send_forward(output_tensor, next_rank=None, scatter_gather_tensors=False) -> None:
+def send_forward(output_tensor, next_rank=None, scatter_gather_tensors=False, async_op=False) -> Optional[P2PWork]:
     """Sends the input tensor to the next stage in pipeline.
 
     Args:
         output_tensor (Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]): Tensor to be sent.
         next_rank (int, optional): The rank of the recipient of the tensor.
+        async_op (bool, optional): Whether to return a :class:`P2PWork` handle instead of waiting.
     """
-    if not gpc.is_pipeline_last_stage():
-        _communicate(object_send_next=output_tensor, next_rank=next_rank, scatter_gather_tensors=scatter_gather_tensors)
+    if gpc.is_pipeline_last_stage():
+        return P2PWork() if async_op else None
+    result = _communicate(object_send_next=output_tensor,
+                          next_rank=next_rank,
+                          scatter_gather_tensors=scatter_gather_tensors,
+                          async_op=async_op)
+    return result.then(lambda _: None) if async_op else None
 
 
-def send_backward(input_tensor_grad, prev_rank=None, scatter_gather_tensors=False) -> None:
+def send_backward(input_tensor_grad, prev_rank=None, scatter_gather_tensors=False, async_op=False) -> Optional[P2PWork]:
     """Sends the gradient tensor to the previous stage in pipeline.
 
     Args:
         input_tensor_grad (Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]): Tensor to be sent
         prev_rank (int, optional): The rank of the recipient of the tensor
+        async_op (bool, optional): Whether to return a :class:`P2PWork` handle instead of waiting.
     """
-    if not gpc.is_pipeline_first_stage():
-        _communicate(object_send_prev=input_tensor_grad,
-                     prev_rank=prev_rank,
-                     scatter_gather_tensors=scatter_gather_tensors)
+    if gpc.is_pipeline_first_stage():
+        return P2PWork() if async_op else None
+    result = _communicate(object_send_prev=input_tensor_grad,
+                          prev_rank=prev_rank,
+                          scatter_gather_tensors=scatter_gather_tensors,
+                          async_op=async_op)
+    return result.then(lambda _: None) if async_op else None
 
 
 def send_forward_recv_backward(output_tensor,
@@ -251,7 +321,8 @@ def send_forward_recv_backward(output_tensor,
                                recv_next=True,
                                next_rank=None,
                                dtype=torch.float,
-                               scatter_gather_tensors=False) -> Union[torch.Tensor, List[torch.Tensor]]:
+                               scatter_gather_tensors=False,
+                               async_op=False) -> Union[torch.Tensor, List[torch.Tensor], P2PWork]:
     """Batched communication operation. Sends the input tensor to the 
     next stage in pipeline, while receives the gradient tensor from the
     next stage in pipeline as the input gradient tensor of this stage.
@@ -259,20 +330,21 @@ def send_forward_recv_backward(output_tensor,
     Args:
         output_tensor (Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]): Tensor to be sent.
         output_grad_shape (Union[:class:`torch.Size`, List[:class:`torch.Size`]]): The shape of the tensor to be received.
+        async_op (bool, optional): Whether to return a :class:`P2PWork` handle instead of waiting.
 
     Returns:
         Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]: The input gradient tensor.
     """
     if gpc.is_pipeline_last_stage():
-        output_tensor_grad = None
-    else:
-        _, output_tensor_grad = _communicate(object_send_next=output_tensor,
-                                             recv_next=recv_next,
-                                             recv_next_shape=output_grad_shape,
-                                             next_rank=next_rank,
-                                             dtype=dtype,
-                                             scatter_gather_tensors=scatter_gather_tensors)
-    return output_tensor_grad
+        return P2PWork() if async_op else None
+    result = _communicate(object_send_next=output_tensor,
+                          recv_next=recv_next,
+                          recv_next_shape=output_grad_shape,
+                          next_rank=next_rank,
+                          dtype=dtype,
+                          scatter_gather_tensors=scatter_gather_tensors,
+                          async_op=async_op)
+    return _select(result, 1, async_op)
 
 
 def send_backward_recv_forward(input_tensor_grad,
@@ -280,7 +352,8 @@ def send_backward_recv_forward(input_tensor_grad,
                                recv_prev=True,
                                prev_rank=None,
                                dtype=torch.float,
-                               scatter_gather_tensors=False) -> Union[torch.Tensor, List[torch.Tensor]]:
+                               scatter_gather_tensors=False,
+                               async_op=False) -> Union[torch.Tensor, List[torch.Tensor], P2PWork]:
     """Batched communication operation. Sends the gradient tensor to the
     previous stage in pipeline, while receives the output tensor from the
     previous stage in pipeline as the input of this stage.
@@ -288,20 +361,21 @@ def send_backward_recv_forward(input_tensor_grad,
     Args:
         input_tensor_grad (Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]): Tensor to be sent.
         input_tensor_shape (Union[:class:`torch.Size`, List[:class:`torch.Size`]]): The shape of the tensor to be received.
+        async_op (bool, optional): Whether to return a :class:`P2PWork` handle instead of waiting.
 
     Returns:
         Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]: The input tensor.
     """
     if gpc.is_pipeline_first_stage():
-        input_tensor = None
-    else:
-        input_tensor, _ = _communicate(object_send_prev=input_tensor_grad,
-                                       recv_prev=recv_prev,
-                                       recv_prev_shape=input_tensor_shape,
-                                       prev_rank=prev_rank,
-                                       dtype=dtype,
-                                       scatter_gather_tensors=scatter_gather_tensors)
-    return input_tensor
+        return P2PWork() if async_op else None
+    result = _communicate(object_send_prev=input_tensor_grad,
+                          recv_prev=recv_prev,
+                          recv_prev_shape=input_tensor_shape,
+                          prev_rank=prev_rank,
+                          dtype=dtype,
+                          scatter_gather_tensors=scatter_gather_tensors,
+                          async_op=async_op)
+    return _select(result, 0, async_op)
 
 
 def send_forward_recv_forward(output_tensor,
@@ -310,7 +384,8 @@ def send_forward_recv_forward(output_tensor,
                               prev_rank=None,
                               next_rank=None,
                               dtype=torch.float,
-                              scatter_gather_tensors=False) -> Union[torch.Tensor, List[torch.Tensor]]:
+                              scatter_gather_tensors=False,
+                              async_op=False) -> Union[torch.Tensor, List[torch.Tensor], P2PWork]:
     """Batched communication operation. Sends the input tensor to the 
     next stage in pipeline, while receives the output tensor from the
     previous stage in pipeline as the input of this stage.
@@ -318,18 +393,20 @@ def send_forward_recv_forward(output_tensor,
     Args:
         output_tensor (Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]): Tensor to be sent.
         input_tensor_shape (Union[:class:`torch.Size`, List[:class:`torch.Size`]]): The shape of the tensor to be received.
+        async_op (bool, optional): Whether to return a :class:`P2PWork` handle instead of waiting.
 
     Returns:
         Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]: The input tensor.
     """
-    input_tensor, _ = _communicate(object_send_next=output_tensor,
-                                   recv_prev=recv_prev,
-                                   recv_prev_shape=input_tensor_shape,
-                                   prev_rank=prev_rank,
-                                   next_rank=next_rank,
-                                   dtype=dtype,
-                                   scatter_gather_tensors=scatter_gather_tensors)
-    return input_tensor
+    result = _communicate(object_send_next=output_tensor,
+                          recv_prev=recv_prev,
+                          recv_prev_shape=input_tensor_shape,
+                          prev_rank=prev_rank,
+                          next_rank=next_rank,
+                          dtype=dtype,
+                          scatter_gather_tensors=scatter_gather_tensors,
+                          async_op=async_op)
+    return _select(result, 0, async_op)
 
 
 def send_backward_recv_backward(input_tensor_grad,
@@ -338,7 +415,8 @@ def send_backward_recv_backward(input_tensor_grad,
                                 prev_rank=None,
                                 next_rank=None,
                                 dtype=torch.float,
-                                scatter_gather_tensors=False) -> Union[torch.Tensor, List[torch.Tensor]]:
+                                scatter_gather_tensors=False,
+                                async_op=False) -> Union[torch.Tensor, List[torch.Tensor], P2PWork]:
     """Batched communication operation. Sends the gradient tensor to the
     previous stage in pipeline, while receives the gradient tensor from the
     next member in pipeline as the input of this stage.
@@ -346,18 +424,20 @@ def send_backward_recv_backward(input_tensor_grad,
     Args:
         input_tensor_grad (Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]): Tensor to be sent.
         output_grad_shape (Union[:class:`torch.Size`, List[:class:`torch.Size`]]): The shape of the tensor to be received.
+        async_op (bool, optional): Whether to return a :class:`P2PWork` handle instead of waiting.
 
     Returns:
         Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]: The input gradient tensor.
     """
-    _, output_tensor_grad = _communicate(object_send_prev=input_tensor_grad,
-                                         recv_next=recv_next,
-                                         recv_next_shape=output_grad_shape,
-                                         prev_rank=prev_rank,
-                                         next_rank=next_rank,
-                                         dtype=dtype,
-                                         scatter_gather_tensors=scatter_gather_tensors)
-    return output_tensor_grad
+    result = _communicate(object_send_prev=input_tensor_grad,
+                          recv_next=recv_next,
+                          recv_next_shape=output_grad_shape,
+                          prev_rank=prev_rank,
+                          next_rank=next_rank,
+                          dtype=dtype,
+                          scatter_gather_tensors=scatter_gather_tensors,
+                          async_op=async_op)
+    return _select(result, 1, async_op)
 
 
 def send_forward_backward_recv_forward_backward(
@@ -370,7 +450,8 @@ def send_forward_backward_recv_forward_backward(
         prev_rank=None,
         next_rank=None,
         dtype=torch.float,
-        scatter_gather_tensors=False) -> Tuple[Union[torch.Tensor, List[torch.Tensor]]]:
+        scatter_gather_tensors=False,
+        async_op=False) -> Union[Tuple[Union[torch.Tensor, List[torch.Tensor]]], P2PWork]:
     """Batched communication operation. Sends the input tensor to the next stage in pipeline and
     the gradient tensor to the previous stage, while receives the input gradient tensor from the
     next stage and the input tensor from the previous stage.
@@ -380,18 +461,19 @@ def send_forward_backward_recv_forward_backward(
         input_tensor_grad (Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]): Tensor sent to the previous.
         input_tensor_shape (Union[:class:`torch.Size`, List[:class:`torch.Size`]]): The shape of the tensor received from the previous.
         output_grad_shape (Union[:class:`torch.Size`, List[:class:`torch.Size`]]): The shape of the tensor received from the next.
+        async_op (bool, optional): Whether to return a :class:`P2PWork` handle instead of waiting.
 
     Returns:
         Tuple(Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]], Union[:class:`torch.Tensor`, List[:class:`torch.Tensor`]]): (the input tensor, the input gradient tensor)
     """
-    input_tensor, output_tensor_grad = _communicate(object_send_next=output_tensor,
-                                                    object_send_prev=input_tensor_grad,
-                                                    recv_prev=recv_prev,
-                                                    recv_next=recv_next,
-                                                    recv_prev_shape=input_tensor_shape,
-                                                    recv_next_shape=output_grad_shape,
-                                                    prev_rank=prev_rank,
-                                                    next_rank=next_rank,
-                                                    dtype=dtype,
-                                                    scatter_gather_tensors=scatter_gather_tensors)
-    return input_tensor, output_tensor_grad
+    return _communicate(object_send_next=output_tensor,
+                        object_send_prev=input_tensor_grad,
+                        recv_prev=recv_prev,
+                        recv_next=recv_next,
+                        recv_prev_shape=input_tensor_shape,
+                        recv_next_shape=output_grad_shape,
+                        prev_rank=prev_rank,
+                        next_rank=next_rank,
+                        dtype=dtype,
+                        scatter_gather_tensors=scatter_gather_tensors,
+                        async_op=async_op)
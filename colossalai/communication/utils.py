@@ -4,10 +4,17 @@ import torch.distributed as dist
 from colossalai.context.parallel_mode import ParallelMode
 from colossalai.core import global_context as gpc
 from colossalai.utils import get_current_device
-from typing import Union, List, Tuple
+from typing import Dict, Union, List, Tuple
 
 TensorShape = Union[torch.Size, List[int], Tuple[int]]
 
+# Tensor meta information is sent as one fixed size header: [number of dims, dims padded to _MAX_META_NDIMS]
+_MAX_META_NDIMS = 8
+_META_HEADER_SIZE = 1 + _MAX_META_NDIMS
+
+# The last header sent to each peer with its request, kept alive until it is waited on.
+_pending_meta_sends: Dict[int, Tuple[torch.Tensor, dist.Work]] = {}
+
 
 def send_tensor_meta(tensor, need_meta=True, next_rank=None) -> bool:
     """Sends tensor meta information before sending a specific tensor.
@@ -15,6 +22,9 @@ def send_tensor_meta(tensor, need_meta=True, next_rank=None) -> bool:
     meta information of the tensor should be sent before communications. This function
     synchronizes with :func:`recv_tensor_meta`.
 
+    The shape is sent in one header without waiting for it to be received.
+    Call :func:`wait_tensor_meta_sends` before the header may be released, e.g. at the end of a step.
+
     Args:
         tensor (:class:`torch.Tensor`): Tensor to be sent.
         need_meta (bool, optional): If False, meta information won't be sent.
@@ -26,17 +36,28 @@ def send_tensor_meta(tensor, need_meta=True, next_rank=None) -> bool:
     if need_meta:
         if next_rank is None:
             next_rank = gpc.get_next_global_rank(ParallelMode.PIPELINE)
+        assert tensor.dim() <= _MAX_META_NDIMS, \
+            f'expected a tensor with at most {_MAX_META_NDIMS} dims in pipeline communication, but got {tensor.dim()}'
 
-        tensor_kwargs = {'dtype': torch.long, 'device': get_current_device()}
+        header = [tensor.dim(), *tensor.shape]
+        header += [0] * (_META_HEADER_SIZE - len(header))
+        header = torch.tensor(header, dtype=torch.long, device=get_current_device())
 
-        send_shape = torch.tensor(tensor.size(), **tensor_kwargs)
-        send_ndims = torch.tensor(len(tensor.size()), **tensor_kwargs)
-        dist.send(send_ndims, next_rank)
-        dist.send(send_shape, next_rank)
+        if next_rank in _pending_meta_sends:
+            _pending_meta_sends.pop(next_rank)[1].wait()
+        _pending_meta_sends[next_rank] = (header, dist.isend(header, next_rank))
 
     return False
 
 
+def wait_tensor_meta_sends() -> None:
+    """Waits until all headers sent by :func:`send_tensor_meta` are received and releases them.
+    """
+    for _, work in _pending_meta_sends.values():
+        work.wait()
+    _pending_meta_sends.clear()
+
+
 def recv_tensor_meta(tensor_shape: TensorShape, prev_rank=None) -> torch.Size:
     """Receives tensor meta information before receiving a specific tensor.
     Since the recipient must know the shape of the tensor in p2p communications,
@@ -54,14 +75,10 @@ def recv_tensor_meta(tensor_shape: TensorShape, prev_rank=None) -> torch.Size:
         if prev_rank is None:
             prev_rank = gpc.get_prev_global_rank(ParallelMode.PIPELINE)
 
-        tensor_kwargs = {'dtype': torch.long, 'device': get_current_device()}
-
-        recv_ndims = torch.empty((), **tensor_kwargs)
-        dist.recv(recv_ndims, prev_rank)
-        recv_shape = torch.empty(recv_ndims, **tensor_kwargs)
-        dist.recv(recv_shape, prev_rank)
-
-        tensor_shape = torch.Size(recv_shape)
+        header = torch.empty(_META_HEADER_SIZE, dtype=torch.long, device=get_current_device())
+        dist.recv(header, prev_rank)
+        header = header.tolist()
+        tensor_shape = torch.Size(header[1:1 + header[0]])
 
     return tensor_shape
 
@@ -7,6 +7,7 @@ TENSOR_PARALLEL_MODE = 'tensor_parallel_mode'
 # initializer
 INITIALIZER_MAPPING = {
     'data': 'Initializer_Data',
+    'data_node': 'Initializer_Data_Node',
     'tensor': 'Initializer_Tensor',
     'pipeline': 'Initializer_Pipeline',
     'embedding': 'Initializer_Embedding',
@@ -450,6 +450,12 @@ class ParallelContext(metaclass=SingletonMeta):
         # LSG: init data parallel process group for compatibility with other parallel module such as zero
         pg_init.append(dict(type=INITIALIZER_MAPPING['data']))
 
+        # init hierarchical data parallel process groups if the number of data parallel ranks per node is given
+        if parallel_config is not None and isinstance(parallel_config.get('data', None), dict) and \
+                'intra_node_size' in parallel_config['data']:
+            pg_init.append(
+                dict(type=INITIALIZER_MAPPING['data_node'], intra_node_size=parallel_config['data']['intra_node_size']))
+
         # LSG: init model parallel process group for compatibility with amp and clip grad
         pg_init.append(dict(type=INITIALIZER_MAPPING['model']))
 
@@ -498,6 +504,9 @@ class ParallelContext(metaclass=SingletonMeta):
     def destroy(self):
         """Destroys the current distributed parallel environment.
         """
+        # pending sends must complete before their process groups are destroyed
+        from colossalai.communication.utils import wait_tensor_meta_sends
+        wait_tensor_meta_sends()
         for mode, group in self._groups.items():
             if mode is not ParallelMode.GLOBAL:
                 dist.destroy_process_group(group)
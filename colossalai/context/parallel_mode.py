@@ -14,6 +14,11 @@ class ParallelMode(Enum):
     # common parallel
     DATA = 'data'
 
+    # hierarchical data parallel
+    # ranks in the same node and ranks with the same local index on different nodes
+    DATA_INTRA_NODE = 'data_intra_node'
+    DATA_INTER_NODE = 'data_inter_node'
+
     # model parallel - containing tensor and pipeline parallel groups
     # this is added to facilitate amp and grad clipping in hybrid parallel
     MODEL = 'model'
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+from torch import distributed as dist
+
+from colossalai.registry import DIST_GROUP_INITIALIZER
+from .process_group_initializer import ProcessGroupInitializer
+from ..parallel_mode import ParallelMode
+
+
+@DIST_GROUP_INITIALIZER.register_module
+class Initializer_Data_Node(ProcessGroupInitializer):
+    """A ProcessGroupInitializer for hierarchical data parallelism.
+    Each data parallel group is split into intra-node groups of ``intra_node_size`` consecutive ranks,
+    and inter-node groups of ranks with the same local index on different nodes.
+
+    Args:
+        intra_node_size (int): The number of data parallel ranks on each node.
+        rank (int): The rank of current process.
+        world_size (int): Size of whole communication world.
+        config (Config): Running configuration.
+        data_parallel_size (int): Size of data parallel.
+        pipeline_parallel_size (int): Size of pipeline parallel.
+        tensor_parallel_size (int): Size of tensor parallel.
+    """
+
+    def __init__(self, *args, intra_node_size: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_data_parallel_group = self.world_size // self.data_parallel_size
+        self.intra_node_size = intra_node_size
+        assert self.data_parallel_size % self.intra_node_size == 0, \
+            f'data parallel size ({self.data_parallel_size}) must be divisible by intra node size ({intra_node_size})'
+        self.inter_node_size = self.data_parallel_size // self.intra_node_size
+
+    def _init_groups(self, groups_of_ranks, mode):
+        local_rank = None
+        ranks_in_group = None
+        process_group = None
+        cpu_group = None
+        group_world_size = None
+
+        for ranks in groups_of_ranks:
+            group = dist.new_group(ranks)
+            group_cpu = dist.new_group(ranks, backend='gloo') if dist.get_backend() != 'gloo' else group
+
+            if self.rank in ranks:
+                local_rank = ranks.index(self.rank)
+                group_world_size = len(ranks)
+                process_group = group
+                cpu_group = group_cpu
+                ranks_in_group = ranks
+
+        return local_rank, group_world_size, process_group, cpu_group, ranks_in_group, mode
+
+    def init_dist_group(self):
+        """Initialize intra-node and inter-node data parallel groups, and assign local_ranks and groups to each gpu.
+
+        Returns:
+            List[Tuple (local_rank, group_world_size, process_group, ranks_in_group, mode)]:
+                Hierarchical data parallelism's information in a list of tuples.
+        """
+        intra_node_groups = []
+        inter_node_groups = []
+        for i in range(self.num_data_parallel_group):
+            data_parallel_ranks = [i + j * self.num_data_parallel_group for j in range(self.data_parallel_size)]
+            for node in range(self.inter_node_size):
+                intra_node_groups.append(data_parallel_ranks[node * self.intra_node_size:(node + 1) *
+                                                             self.intra_node_size])
+            for local_index in range(self.intra_node_size):
+                inter_node_groups.append(data_parallel_ranks[local_index::self.intra_node_size])
+
+        return [
+            self._init_groups(intra_node_groups, ParallelMode.DATA_INTRA_NODE),
+            self._init_groups(inter_node_groups, ParallelMode.DATA_INTER_NODE)
+        ]
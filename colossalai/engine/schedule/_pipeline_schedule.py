@@ -61,6 +61,19 @@ def pack_return_tensors(return_tensors):
     return output, label
 
 
+def deallocate_output_tensor(output_tensor):
+    """Frees the storage of a stage output that has been sent to the next stage, while keeping its autograd graph.
+
+    The data is replaced by a single element expanded to the original shape, so that the gradient received
+    from the next stage can still be passed to :func:`torch.autograd.backward`. Views are left untouched,
+    since freeing them would not release the memory of their base.
+    """
+    if output_tensor is None or output_tensor._base is not None or output_tensor.numel() <= 1:
+        return
+    placeholder = torch.empty((1,), device=output_tensor.device, dtype=output_tensor.dtype)
+    output_tensor.data = placeholder.expand(output_tensor.shape)
+
+
 class PipelineSchedule(BaseSchedule):
     """A helper schedule class for pipeline parallelism running environment.
     It uses non-interleaved 1F1B strategy. Other properties are similar as
@@ -73,13 +86,17 @@ class PipelineSchedule(BaseSchedule):
         tensor_shape (torch.Size, optional): Specified shape in pipeline communication.
         scatter_gather_tensors (bool, optional):
             If set to `True`, communication will be reduced over pipeline when using 1D tensor parallelization.
+        deallocate_outputs (bool, optional):
+            If set to `True`, the output tensors of non-last stages are freed once sent to the next stage,
+            only their autograd graphs are kept until the backward pass.
     """
 
     def __init__(self,
                  num_microbatches,
                  batch_data_process_func: Callable = None,
                  tensor_shape: Union[torch.Size, List[int], Tuple[int]] = None,
-                 scatter_gather_tensors: bool = False):
+                 scatter_gather_tensors: bool = False,
+                 deallocate_outputs: bool = False):
         super().__init__(batch_data_process_func=batch_data_process_func)
 
         assert num_microbatches > 0, f'expected num_microbatches to be larger then 1, but got {num_microbatches}'
@@ -90,6 +107,7 @@ class PipelineSchedule(BaseSchedule):
         self.scatter_gather_tensors = False
         if gpc.is_initialized(ParallelMode.PARALLEL_1D) and gpc.get_world_size(ParallelMode.PARALLEL_1D) > 1:
             self.scatter_gather_tensors = scatter_gather_tensors
+        self.deallocate_outputs = deallocate_outputs
         self._logger = get_dist_logger()
 
     def load_batch(self, data_iter):
@@ -120,7 +138,7 @@ class PipelineSchedule(BaseSchedule):
         # TODO: remove this after testing new zero with pipeline parallelism
         model = engine.model
         if isinstance(model, NaiveAMPModel):
-            self.dtype = torch.half
+            self.dtype = model.dtype
             model = model.model
         if isinstance(model, ShardedModelV2):
             self.dtype = torch.half
@@ -271,6 +289,14 @@ class PipelineSchedule(BaseSchedule):
         ft_shape = self.tensor_shape
         bt_shape = None
         fs_checker = self.tensor_shape is None
+        # Sends are waited on only once the sent tensors are no longer needed, so that compute is not
+        # stalled while they drain. A warmup output has been received by the next stage once its
+        # gradient has come back, so its send is released right before its backward pass.
+        forward_send_works = []
+        backward_send_work = None
+        # The last stage sends no output, and outputs are not kept when forward only.
+        deallocate_outputs = self.deallocate_outputs and not forward_only and \
+            not gpc.is_last_rank(ParallelMode.PIPELINE)
 
         # Run warmup forward passes.
         for i in range(num_warmup_microbatches):
@@ -287,7 +313,12 @@ class PipelineSchedule(BaseSchedule):
             if not gpc.is_last_rank(ParallelMode.PIPELINE):
                 bt_shape = output_tensor.shape
                 fs_checker = comm.send_tensor_meta(output_tensor, fs_checker)
-            comm.send_forward(output_tensor, scatter_gather_tensors=self.scatter_gather_tensors)
+            forward_send_works.append(
+                comm.send_forward(output_tensor, scatter_gather_tensors=self.scatter_gather_tensors, async_op=True))
+            if deallocate_outputs:
+                # the storage can only be released once the send has completed
+                forward_send_works[-1].wait()
+                deallocate_output_tensor(output_tensor)
 
             if not forward_only:
                 input_tensors.append(input_tensor)
@@ -313,7 +344,10 @@ class PipelineSchedule(BaseSchedule):
                                                return_output_label=return_output_label,
                                                accum_loss=accum_loss)
             if forward_only:
-                comm.send_forward(output_tensor, scatter_gather_tensors=self.scatter_gather_tensors)
+                if len(forward_send_works) > 0:
+                    forward_send_works.pop(0).wait()
+                forward_send_works.append(
+                    comm.send_forward(output_tensor, scatter_gather_tensors=self.scatter_gather_tensors, async_op=True))
 
                 if not last_iteration:
                     input_tensor = comm.recv_forward(ft_shape,
@@ -321,10 +355,18 @@ class PipelineSchedule(BaseSchedule):
                                                      scatter_gather_tensors=self.scatter_gather_tensors)
 
             else:
+                # Post the receive of the next input early, so that it overlaps with the backward pass.
+                if not last_iteration:
+                    recv_forward_work = comm.recv_forward(ft_shape,
+                                                          dtype=self.dtype,
+                                                          scatter_gather_tensors=self.scatter_gather_tensors,
+                                                          async_op=True)
                 output_tensor_grad = comm.send_forward_recv_backward(output_tensor,
                                                                      bt_shape,
                                                                      dtype=self.dtype,
                                                                      scatter_gather_tensors=self.scatter_gather_tensors)
+                if deallocate_outputs:
+                    deallocate_output_tensor(output_tensor)
 
                 # Add input_tensor and output_tensor to end of list.
                 input_tensors.append(input_tensor)
@@ -334,17 +376,20 @@ class PipelineSchedule(BaseSchedule):
                 # the backward pass.
                 input_tensor = input_tensors.pop(0)
                 output_tensor = output_tensors.pop(0)
+                if len(forward_send_works) > 0:
+                    forward_send_works.pop(0).wait()
 
                 input_tensor_grad = self._backward_step(engine, input_tensor, output_tensor, output_tensor_grad)
 
+                if backward_send_work is not None:
+                    backward_send_work.wait()
+                backward_send_work = comm.send_backward(input_tensor_grad,
+                                                        scatter_gather_tensors=self.scatter_gather_tensors,
+                                                        async_op=True)
                 if last_iteration:
                     input_tensor = None
-                    comm.send_backward(input_tensor_grad, scatter_gather_tensors=self.scatter_gather_tensors)
                 else:
-                    input_tensor = comm.send_backward_recv_forward(input_tensor_grad,
-                                                                   ft_shape,
-                                                                   dtype=self.dtype,
-                                                                   scatter_gather_tensors=self.scatter_gather_tensors)
+                    input_tensor = recv_forward_work.wait()
 
         # Run cooldown backward passes.
         if not forward_only:
@@ -355,10 +400,22 @@ class PipelineSchedule(BaseSchedule):
                 output_tensor_grad = comm.recv_backward(bt_shape,
                                                         dtype=self.dtype,
                                                         scatter_gather_tensors=self.scatter_gather_tensors)
+                if len(forward_send_works) > 0:
+                    forward_send_works.pop(0).wait()
 
                 input_tensor_grad = self._backward_step(engine, input_tensor, output_tensor, output_tensor_grad)
 
-                comm.send_backward(input_tensor_grad, scatter_gather_tensors=self.scatter_gather_tensors)
+                if backward_send_work is not None:
+                    backward_send_work.wait()
+                backward_send_work = comm.send_backward(input_tensor_grad,
+                                                        scatter_gather_tensors=self.scatter_gather_tensors,
+                                                        async_op=True)
+
+        for work in forward_send_works:
+            work.wait()
+        if backward_send_work is not None:
+            backward_send_work.wait()
+        comm.wait_tensor_meta_sends()
 
         if len(return_tensors) > 0:
             output, label = pack_return_tensors(return_tensors)
@@ -404,7 +461,7 @@ class InterleavedPipelineSchedule(PipelineSchedule):
         if isinstance(engine.model, ShardedModelV2):
             self.dtype = torch.half
         elif isinstance(engine.model[0], NaiveAMPModel):
-            self.dtype = torch.half
+            self.dtype = engine.model[0].dtype
         for model in engine.model:
             if isinstance(model, NaiveAMPModel):
                 model = model.model
@@ -644,30 +701,21 @@ class InterleavedPipelineSchedule(PipelineSchedule):
             input_tensors[next_forward_model_chunk_id].append(input_tensor)
 
         # Run 1F1B in steady state.
+        # The exchange of each iteration is split into a forward and a backward half, posted right after
+        # the forward and the backward pass. Each half is waited on only before the received tensor is
+        # consumed, so the forward half overlaps with the backward pass and vice versa.
+        backward_work = None
         for k in range(num_microbatches_remaining):
             # Forward pass.
             forward_k = k + num_warmup_microbatches
             output_tensor = _forward_step_helper(forward_k)
 
-            # Backward pass.
-            backward_k = k
-            input_tensor_grad = _backward_step_helper(backward_k)
-
-            # Send output_tensor and input_tensor_grad, receive input_tensor
-            # and output_tensor_grad.
-
-            # Determine if current stage has anything to send in either direction,
-            # otherwise set tensor to None.
+            # Determine if current stage has anything to send, otherwise set tensor to None.
             forward_model_chunk_id = get_model_chunk_id(forward_k, forward=True)
             gpc.set_virtual_pipeline_parallel_rank(forward_model_chunk_id)
             if gpc.is_pipeline_last_stage():
                 output_tensor = None
 
-            backward_model_chunk_id = get_model_chunk_id(backward_k, forward=False)
-            gpc.set_virtual_pipeline_parallel_rank(backward_model_chunk_id)
-            if gpc.is_pipeline_first_stage():
-                input_tensor_grad = None
-
             # Determine if peers are sending, and where in data structure to put
             # received tensors.
             recv_prev = True
@@ -680,6 +728,32 @@ class InterleavedPipelineSchedule(PipelineSchedule):
             else:
                 next_forward_model_chunk_id = get_model_chunk_id(forward_k + 1, forward=True)
 
+            # If last iteration, don't receive; we already received one extra
+            # before the start of the for loop.
+            if k == (num_microbatches_remaining - 1):
+                recv_prev = False
+
+            # Send output_tensor, receive input_tensor.
+            input_shape = input_tensor_shapes[next_forward_model_chunk_id] if recv_prev else None
+            forward_work = comm.send_forward_recv_forward(output_tensor,
+                                                          input_shape,
+                                                          recv_prev=recv_prev,
+                                                          dtype=self.dtype,
+                                                          scatter_gather_tensors=self.scatter_gather_tensors,
+                                                          async_op=True)
+
+            # Backward pass.
+            backward_k = k
+            if backward_work is not None:
+                backward_work.wait()
+            input_tensor_grad = _backward_step_helper(backward_k)
+
+            # Determine if current stage has anything to send, otherwise set tensor to None.
+            backward_model_chunk_id = get_model_chunk_id(backward_k, forward=False)
+            gpc.set_virtual_pipeline_parallel_rank(backward_model_chunk_id)
+            if gpc.is_pipeline_first_stage():
+                input_tensor_grad = None
+
             recv_next = True
             if gpc.is_pipeline_last_stage(ignore_virtual=True):
                 # Last stage is ahead of first stage by (pipeline_parallel_size - 1).
@@ -691,29 +765,24 @@ class InterleavedPipelineSchedule(PipelineSchedule):
             else:
                 next_backward_model_chunk_id = get_model_chunk_id(backward_k + 1, forward=False)
 
-            # If last iteration, don't receive; we already received one extra
-            # before the start of the for loop.
-            if k == (num_microbatches_remaining - 1):
-                recv_prev = False
-
-            input_shape = input_tensor_shapes[next_forward_model_chunk_id] if recv_prev else None
+            # Send input_tensor_grad, receive output_tensor_grad, which is put in data
+            # structures in the right location once it has arrived.
             output_shape = output_tensor_shapes[next_backward_model_chunk_id] if recv_next else None
-            # Communicate tensors.
-            input_tensor, output_tensor_grad = \
-                comm.send_forward_backward_recv_forward_backward(
-                    output_tensor, input_tensor_grad,
-                    input_shape,
-                    output_shape,
-                    recv_prev=recv_prev, recv_next=recv_next,
-                    dtype=self.dtype,
-                    scatter_gather_tensors=self.scatter_gather_tensors)
-
-            # Put input_tensor and output_tensor_grad in data structures in the
-            # right location.
+            backward_work = comm.send_backward_recv_backward(input_tensor_grad,
+                                                             output_shape,
+                                                             recv_next=recv_next,
+                                                             dtype=self.dtype,
+                                                             scatter_gather_tensors=self.scatter_gather_tensors,
+                                                             async_op=True)
+            if recv_next:
+                backward_work = backward_work.then(output_tensor_grads[next_backward_model_chunk_id].append)
+
+            input_tensor = forward_work.wait()
             if recv_prev:
                 input_tensors[next_forward_model_chunk_id].append(input_tensor)
-            if recv_next:
-                output_tensor_grads[next_backward_model_chunk_id].append(output_tensor_grad)
+
+        if backward_work is not None:
+            backward_work.wait()
 
         # Run cooldown backward passes (flush out pipeline).
         if not forward_only:
@@ -737,6 +806,7 @@ class InterleavedPipelineSchedule(PipelineSchedule):
                                                      recv_next=recv_next,
                                                      dtype=self.dtype,
                                                      scatter_gather_tensors=self.scatter_gather_tensors))
+        comm.wait_tensor_meta_sends()
 
         if len(return_tensors) > 0:
             output, label = pack_return_tensors(return_tensors)
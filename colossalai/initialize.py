@@ -334,8 +334,8 @@ def initialize(model: nn.Module,
         cfg_ = fp16_cfg.copy()
         amp_mode = cfg_.pop('mode')
         if is_using_pp():
-            assert amp_mode == AMP_TYPE.NAIVE, 'Pipeline only support NaiveAMP currently'
-        if amp_mode == AMP_TYPE.NAIVE:
+            assert amp_mode in (AMP_TYPE.NAIVE, AMP_TYPE.BF16), 'Pipeline only support NaiveAMP and BF16 AMP currently'
+        if amp_mode in (AMP_TYPE.NAIVE, AMP_TYPE.BF16):
             cfg_['clip_grad_norm'] = clip_grad_norm
         model, optimizer, criterion = convert_to_amp(model=model,
                                                      optimizer=optimizer,
@@ -372,7 +372,7 @@ def initialize(model: nn.Module,
             if verbose:
                 logger.info('Model is using torch.nn.parallel.DistributedDataParallel for Sequence Parallelism',
                             ranks=[0])
-        elif is_using_ddp() and not is_using_pp() and amp_mode != AMP_TYPE.NAIVE:
+        elif is_using_ddp() and not is_using_pp() and amp_mode not in (AMP_TYPE.NAIVE, AMP_TYPE.BF16):
             model = DDP(model, process_group=gpc.get_group(ParallelMode.DATA), device_ids=[torch.cuda.current_device()])
             if verbose:
                 logger.info('Model is using torch.nn.parallel.DistributedDataParallel for Data Parallelism', ranks=[0])
@@ -491,7 +491,10 @@ int destroy_adam_optimizer(int optimizer_id) {
 }
 
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
-  m.def("adam_update", &adam_step, "CPU Adam update (C++)");
+  // release the GIL, so that other threads can run during the update,
+  // e.g. copying updated params back in a pipelined optimizer step
+  m.def("adam_update", &adam_step, "CPU Adam update (C++)",
+        py::call_guard<py::gil_scoped_release>());
   m.def("create_adam", &create_adam_optimizer, "CPU Adam (C++)");
   m.def("destroy_adam", &destroy_adam_optimizer, "CPU Adam destroy (C++)");
 }
@@ -70,6 +70,10 @@ class DistributedLogger:
         ln = stack[2][2]
         func = stack[2][3]
 
+        # break the reference cycle between this frame and the stack, which would otherwise
+        # keep the callers' frames and their locals alive until garbage collection
+        del stack
+
         return fn, ln, func
 
     @staticmethod
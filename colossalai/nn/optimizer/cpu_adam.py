@@ -1,8 +1,12 @@
 import math
+import warnings
+from collections import defaultdict
+
 import torch
 
 from colossalai.registry import OPTIMIZERS
 from colossalai.nn.optimizer import CPU_ADAM_CNT
+from colossalai.nn.optimizer.utils import DiskAdamStates, init_quantized_adam_states, quantized_adam_update
 
 
 @OPTIMIZERS.register_module
@@ -19,6 +23,8 @@ class CPUAdam(torch.optim.Optimizer):
 
     This version of CPU Adam accelates parameters updating on CPU with SIMD.
     Support of AVX2 or AVX512 is required.
+    If the ``cpu_adam`` extension is not installed, CPU parameters of a group are updated together
+    with ``torch._foreach_*`` ops, which follow the numerics of the extension.
 
     The GPU part is implemented in an naive way.
 
@@ -45,6 +51,17 @@ class CPUAdam(torch.optim.Optimizer):
             True for decoupled weight decay(also known as AdamW) (default: True)
         simd_log (boolean, optional): whether to show if you are using SIMD to 
             accelerate. (default: False)
+        quantized_states (boolean, optional): whether to keep ``exp_avg`` and ``exp_avg_sq`` as 8-bit blockwise
+            dynamic quantized states, which cuts the memory of states by about 4x. States are dequantized
+            chunk by chunk in the update and re-quantized. (default: False)
+        quantize_block_size (int, optional): number of elements sharing an absmax scale in quantized states.
+            (default: 2048)
+        offload_states_dir (str, optional): if given, ``exp_avg`` and ``exp_avg_sq`` of CPU parameters are kept in
+            memory-mapped temporary files in this directory, and CPU parameters are updated block by block,
+            overlapped with reading states of the next block and writing back states of the previous block.
+            It can't be used with ``quantized_states``. (default: None)
+        offload_states_block_size (int, optional): number of elements in a block of offloaded states.
+            (default: 2**24)
 
     .. _Adam\: A Method for Stochastic Optimization:
         https://arxiv.org/abs/1412.6980
@@ -55,6 +72,8 @@ class CPUAdam(torch.optim.Optimizer):
     # Number of fp32 shards for per parameter
     # Param weight, grad, momentum and variance
     num_fp32_shards_per_param = 4
+    # Number of elements dequantized at a time with quantized states
+    quantize_chunk_size = 2**20
 
     def __init__(self,
                  model_params,
@@ -64,20 +83,35 @@ class CPUAdam(torch.optim.Optimizer):
                  eps=1e-8,
                  weight_decay=0,
                  adamw_mode=True,
-                 simd_log=False):
+                 simd_log=False,
+                 quantized_states=False,
+                 quantize_block_size=2048,
+                 offload_states_dir=None,
+                 offload_states_block_size=2**24):
 
         default_args = dict(lr=lr, betas=betas, eps=eps, weight_decay=weight_decay, bias_correction=bias_correction)
         super(CPUAdam, self).__init__(model_params, default_args)
         self.opt_id = CPU_ADAM_CNT()
         self.adamw_mode = adamw_mode
+        self.quantized_states = quantized_states
+        self.quantize_block_size = quantize_block_size
+        self.disk_states = None
+        if offload_states_dir is not None:
+            assert not quantized_states, 'offloaded states can not be quantized'
+            self.disk_states = DiskAdamStates(offload_states_dir, offload_states_block_size)
         try:
             import cpu_adam
+            self.cpu_adam_op = cpu_adam
         except ImportError:
-            raise ImportError('Please install colossalai from source code to use CPUAdam')
-        self.cpu_adam_op = cpu_adam
-        self.cpu_adam_op.create_adam(self.opt_id, lr, betas[0], betas[1], eps, weight_decay, adamw_mode, simd_log)
+            warnings.warn('cpu_adam extension is not installed, CPUAdam falls back to a slower PyTorch implementation. '
+                          'Please install colossalai from source code to use the extension')
+            self.cpu_adam_op = None
+        if self.cpu_adam_op is not None:
+            self.cpu_adam_op.create_adam(self.opt_id, lr, betas[0], betas[1], eps, weight_decay, adamw_mode, simd_log)
 
     def __del__(self):
+        if getattr(self, 'disk_states', None) is not None:
+            self.disk_states.close()
         if self.cpu_adam_op:
             self.cpu_adam_op.destroy_adam(self.opt_id)
 
@@ -114,6 +148,95 @@ class CPUAdam(torch.optim.Optimizer):
 
         data.addcdiv_(exp_avg, denom, value=-step_size)
 
+    def torch_multi_tensor_adam_update(self,
+                                       data_list,
+                                       grad_list,
+                                       exp_avg_list,
+                                       exp_avg_sq_list,
+                                       lr,
+                                       beta1,
+                                       beta2,
+                                       eps,
+                                       weight_decay,
+                                       bias_correction1,
+                                       bias_correction2,
+                                       use_adamw=False,
+                                       loss_scale=-1):
+        """Update a list of tensors with ``torch._foreach_*`` ops, following the numerics of the ``cpu_adam`` extension.
+        fp16 params and grads are computed in fp32.
+        """
+        fp32_data_list = [data if data.dtype == torch.float else data.float() for data in data_list]
+        grad_list = [grad.float() for grad in grad_list]
+        if loss_scale > 0:
+            grad_list = torch._foreach_div(grad_list, loss_scale)
+        if weight_decay > 0 and not use_adamw:
+            grad_list = torch._foreach_add(grad_list, fp32_data_list, alpha=weight_decay)
+
+        # Decay the first and second moment running average coefficient
+        torch._foreach_mul_(exp_avg_list, beta1)
+        torch._foreach_add_(exp_avg_list, grad_list, alpha=1 - beta1)
+        torch._foreach_mul_(exp_avg_sq_list, beta2)
+        torch._foreach_addcmul_(exp_avg_sq_list, grad_list, grad_list, value=1 - beta2)
+
+        denom_list = torch._foreach_sqrt(exp_avg_sq_list)
+        torch._foreach_mul_(denom_list, 1 / math.sqrt(bias_correction2))
+        torch._foreach_add_(denom_list, eps)
+
+        if weight_decay > 0 and use_adamw:
+            torch._foreach_mul_(fp32_data_list, 1 - lr * weight_decay)
+        torch._foreach_addcdiv_(fp32_data_list, exp_avg_list, denom_list, value=-lr / bias_correction1)
+
+        for data, fp32_data in zip(data_list, fp32_data_list):
+            if data is not fp32_data:
+                data.copy_(fp32_data)
+
+    def _get_update_fn(self, p, state, group):
+        """Return a function which updates flat views of ``(data, grad, exp_avg, exp_avg_sq)`` of a part of ``p``."""
+        beta1, beta2 = group['betas']
+        step = state['step']
+        if p.device.type == 'cpu' and self.cpu_adam_op is not None:
+
+            def update_fn(data, grad, exp_avg, exp_avg_sq):
+                self.cpu_adam_op.adam_update(self.opt_id, step, group['lr'], beta1, beta2, group['eps'],
+                                             group['weight_decay'], group['bias_correction'], data, grad, exp_avg,
+                                             exp_avg_sq, -1)
+        else:
+            bias_correction1, bias_correction2 = 1, 1
+            if group['bias_correction']:
+                bias_correction1 = 1 - beta1**step
+                bias_correction2 = 1 - beta2**step
+
+            def update_fn(data, grad, exp_avg, exp_avg_sq):
+                self.torch_multi_tensor_adam_update([data], [grad], [exp_avg], [exp_avg_sq], group['lr'], beta1, beta2,
+                                                    group['eps'], group['weight_decay'], bias_correction1,
+                                                    bias_correction2, self.adamw_mode)
+
+        return update_fn
+
+    def _init_state(self, p, state):
+        state['step'] = 0
+        target_device = p.device
+        if self.quantized_states:
+            init_quantized_adam_states(state, p.numel(), self.quantize_block_size, target_device)
+        elif self.disk_states is not None and target_device.type == 'cpu':
+            self.disk_states.init_states(p, state)
+        else:
+            # gradient momentums
+            state['exp_avg'] = torch.zeros_like(p.data, dtype=torch.float, device=target_device)
+            # gradient variances
+            state['exp_avg_sq'] = torch.zeros_like(p.data, dtype=torch.float, device=target_device)
+
+    def load_state_dict(self, state_dict):
+        super().load_state_dict(state_dict)
+        if self.disk_states is None:
+            return
+        # move the loaded states of CPU params back to disk
+        for group in self.param_groups:
+            for p in group['params']:
+                state = self.state.get(p, {})
+                if p.device.type == 'cpu' and 'exp_avg' in state and 'exp_avg_absmax' not in state:
+                    self.disk_states.load_states(p, state)
+
     @torch.no_grad()
     def step(self, closure=None):
         loss = None
@@ -122,6 +245,9 @@ class CPUAdam(torch.optim.Optimizer):
                 loss = closure()
 
         for _, group in enumerate(self.param_groups):
+            # CPU tensors updated by the PyTorch fallback, grouped by step
+            cpu_tensor_lists = defaultdict(lambda: ([], [], [], []))
+            disk_tasks = []
             for _, p in enumerate(group['params']):
 
                 if p.grad is None:
@@ -131,20 +257,32 @@ class CPUAdam(torch.optim.Optimizer):
 
                 target_device = p.device
                 if len(state) == 0:
-                    state['step'] = 0
-
-                    # gradient momentums
-                    state['exp_avg'] = torch.zeros_like(p.data, dtype=torch.float, device=target_device)
-                    # gradient variances
-                    state['exp_avg_sq'] = torch.zeros_like(p.data, dtype=torch.float, device=target_device)
+                    self._init_state(p, state)
 
                 state['step'] += 1
                 beta1, beta2 = group['betas']
 
+                if 'exp_avg_absmax' in state:
+                    assert state['exp_avg'].device == target_device, "quantized states should stay with the param"
+                    quantized_adam_update(p.data, p.grad.data, state, self.quantize_chunk_size,
+                                          self._get_update_fn(p, state, group))
+                    continue
+                if self.disk_states is not None and self.disk_states.is_offloaded(p, state):
+                    assert target_device.type == 'cpu', "offloaded states should stay with a CPU param"
+                    disk_tasks.append((p, self._get_update_fn(p, state, group)))
+                    continue
+
                 if target_device.type == 'cpu':
                     assert p.data.numel() == p.grad.data.numel(), "parameter and gradient should have the same size"
                     assert state['exp_avg'].device.type == 'cpu', "exp_avg should stay on cpu"
                     assert state['exp_avg_sq'].device.type == 'cpu', "exp_avg should stay on cpu"
+                    if self.cpu_adam_op is None:
+                        p_l, g_l, m_l, v_l = cpu_tensor_lists[state['step']]
+                        p_l.append(p.data)
+                        g_l.append(p.grad.data)
+                        m_l.append(state['exp_avg'])
+                        v_l.append(state['exp_avg_sq'])
+                        continue
                     self.cpu_adam_op.adam_update(self.opt_id, state['step'], group['lr'], beta1, beta2, group['eps'],
                                                  group['weight_decay'], group['bias_correction'], p.data, p.grad.data,
                                                  state['exp_avg'], state['exp_avg_sq'], -1)
@@ -161,4 +299,16 @@ class CPUAdam(torch.optim.Optimizer):
                                            bias_correction2, self.adamw_mode)
                 else:
                     raise RuntimeError
+
+            beta1, beta2 = group['betas']
+            for step, (p_l, g_l, m_l, v_l) in cpu_tensor_lists.items():
+                bias_correction1, bias_correction2 = 1, 1
+                if group['bias_correction']:
+                    bias_correction1 = 1 - beta1**step
+                    bias_correction2 = 1 - beta2**step
+                self.torch_multi_tensor_adam_update(p_l, g_l, m_l, v_l, group['lr'], beta1, beta2, group['eps'],
+                                                    group['weight_decay'], bias_correction1, bias_correction2,
+                                                    self.adamw_mode)
+            if len(disk_tasks) > 0:
+                self.disk_states.update(disk_tasks)
         return loss
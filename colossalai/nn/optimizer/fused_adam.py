@@ -4,13 +4,15 @@ import torch
 from colossalai.registry import OPTIMIZERS
 from colossalai.utils import multi_tensor_applier
 
+from .multi_tensor_ops import multi_tensor_adam, split_tensor_lists_by_device
+
 
 @OPTIMIZERS.register_module
 class FusedAdam(torch.optim.Optimizer):
     """Implements Adam algorithm.
 
-    Currently GPU-only.  Requires ColossalAI to be installed via
-    ``pip install .``.
+    CUDA params require ColossalAI to be installed via ``pip install .``.
+    CPU params are updated by ``torch._foreach_*`` ops with the same numerics.
 
     This version of fused Adam implements 2 fusions.
 
@@ -70,7 +72,7 @@ class FusedAdam(torch.optim.Optimizer):
             self._dummy_overflow_buf = torch.cuda.IntTensor([0])
             self.multi_tensor_adam = colossal_C.multi_tensor_adam
         else:
-            raise RuntimeError('FusedAdam requires cuda extensions')
+            self.multi_tensor_adam = None
 
     def zero_grad(self, set_to_none=False):
         if set_to_none:
@@ -134,8 +136,15 @@ class FusedAdam(torch.optim.Optimizer):
                 m_l.append(state['exp_avg'])
                 v_l.append(state['exp_avg_sq'])
 
-            multi_tensor_applier(self.multi_tensor_adam, self._dummy_overflow_buf, [g_l, p_l, m_l, v_l], group['lr'],
-                                 beta1, beta2, group['eps'], group['step'], self.adamw_mode, bias_correction,
-                                 group['weight_decay'])
+            for device_type, tensor_lists in split_tensor_lists_by_device([g_l, p_l, m_l, v_l]).items():
+                if device_type == 'cpu':
+                    multi_tensor_adam(*tensor_lists, group['lr'], beta1, beta2, group['eps'], group['step'],
+                                      self.adamw_mode, bias_correction, group['weight_decay'])
+                elif self.multi_tensor_adam is None:
+                    raise RuntimeError('FusedAdam requires cuda extensions')
+                else:
+                    multi_tensor_applier(self.multi_tensor_adam, self._dummy_overflow_buf, tensor_lists, group['lr'],
+                                         beta1, beta2, group['eps'], group['step'], self.adamw_mode, bias_correction,
+                                         group['weight_decay'])
 
         return loss
@@ -4,13 +4,15 @@ import torch
 from colossalai.registry import OPTIMIZERS
 from colossalai.utils import multi_tensor_applier
 
+from .multi_tensor_ops import multi_tensor_l2norm, multi_tensor_lamb, split_tensor_lists_by_device
+
 
 @OPTIMIZERS.register_module
 class FusedLAMB(torch.optim.Optimizer):
     """Implements LAMB algorithm.
 
-    Currently GPU-only.  Requires ColossalAI to be installed via
-    ``pip install .``.
+    CUDA params require ColossalAI to be installed via ``pip install .``.
+    CPU params are updated by ``torch._foreach_*`` ops with the same numerics.
 
     This version of fused LAMB implements 2 fusions.
 
@@ -84,7 +86,8 @@ class FusedLAMB(torch.optim.Optimizer):
                                                     device=self.param_groups[0]["params"][0].device)
             self.multi_tensor_lamb = colossal_C.multi_tensor_lamb
         else:
-            raise RuntimeError('FusedLAMB requires cuda extensions')
+            self.multi_tensor_l2norm = None
+            self.multi_tensor_lamb = None
 
         self.adam_w_mode = 1 if adam_w_mode else 0
         self.set_grad_none = set_grad_none
@@ -109,30 +112,41 @@ class FusedLAMB(torch.optim.Optimizer):
         if closure is not None:
             loss = closure()
 
-        # create separate grad lists for fp32 and fp16 params
-        g_all_32, g_all_16 = [], []
+        # create separate grad lists for fp32 and fp16 params, CPU grads are in one list
+        g_all_32, g_all_16, g_all_cpu = [], [], []
         for group in self.param_groups:
             for p in group['params']:
                 if p.grad is None:
                     continue
-                if p.dtype == torch.float32:
+                if p.dtype not in [torch.float16, torch.float32]:
+                    raise RuntimeError('FusedLAMB only support fp16 and fp32.')
+                if p.device.type == 'cpu':
+                    g_all_cpu.append(p.grad.data)
+                elif p.dtype == torch.float32:
                     g_all_32.append(p.grad.data)
-                elif p.dtype == torch.float16:
-                    g_all_16.append(p.grad.data)
                 else:
-                    raise RuntimeError('FusedLAMB only support fp16 and fp32.')
+                    g_all_16.append(p.grad.data)
 
-        device = self.param_groups[0]["params"][0].device
-        g_norm_32, g_norm_16 = torch.zeros(1, device=device), torch.zeros(1, device=device)
-        # compute grad norm for two lists
-        if len(g_all_32) > 0:
-            g_norm_32 = multi_tensor_applier(self.multi_tensor_l2norm, self._dummy_overflow_buf, [g_all_32], False)[0]
-        if len(g_all_16) > 0:
-            g_norm_16 = multi_tensor_applier(self.multi_tensor_l2norm, self._dummy_overflow_buf, [g_all_16], False)[0]
-
-        # blend two grad norms to get global grad norm
-        global_grad_norm = multi_tensor_applier(self.multi_tensor_l2norm, self._dummy_overflow_buf,
-                                                [[g_norm_32, g_norm_16]], False)[0]
+        if len(g_all_32) + len(g_all_16) > 0:
+            if self.multi_tensor_l2norm is None:
+                raise RuntimeError('FusedLAMB requires cuda extensions')
+            device = (g_all_32 + g_all_16)[0].device
+            g_norm_32, g_norm_16 = torch.zeros(1, device=device), torch.zeros(1, device=device)
+            # compute grad norm for two lists
+            if len(g_all_32) > 0:
+                g_norm_32 = multi_tensor_applier(self.multi_tensor_l2norm, self._dummy_overflow_buf, [g_all_32],
+                                                 False)[0]
+            if len(g_all_16) > 0:
+                g_norm_16 = multi_tensor_applier(self.multi_tensor_l2norm, self._dummy_overflow_buf, [g_all_16],
+                                                 False)[0]
+            norms = [g_norm_32, g_norm_16]
+            if len(g_all_cpu) > 0:
+                norms.append(multi_tensor_l2norm(g_all_cpu)[0].view(1).to(device))
+            # blend grad norms to get global grad norm
+            global_grad_norm = multi_tensor_applier(self.multi_tensor_l2norm, self._dummy_overflow_buf, [norms],
+                                                    False)[0]
+        else:
+            global_grad_norm = multi_tensor_l2norm(g_all_cpu)[0] if len(g_all_cpu) > 0 else torch.zeros(1)
         max_grad_norm = self.defaults['max_grad_norm']
 
         for group in self.param_groups:
@@ -179,15 +193,16 @@ class FusedLAMB(torch.optim.Optimizer):
                 else:
                     raise RuntimeError('FusedLAMB only support fp16 and fp32.')
 
-            if (len(g_16) > 0):
-                multi_tensor_applier(self.multi_tensor_lamb, self._dummy_overflow_buf, [g_16, p_16, m_16, v_16],
-                                     group['lr'], beta1, beta2, group['eps'], group['step'], bias_correction,
-                                     group['weight_decay'], grad_averaging, self.adam_w_mode, global_grad_norm,
-                                     max_grad_norm, self.use_nvlamb)
-            if (len(g_32) > 0):
-                multi_tensor_applier(self.multi_tensor_lamb, self._dummy_overflow_buf, [g_32, p_32, m_32, v_32],
-                                     group['lr'], beta1, beta2, group['eps'], group['step'], bias_correction,
-                                     group['weight_decay'], grad_averaging, self.adam_w_mode, global_grad_norm,
-                                     max_grad_norm, self.use_nvlamb)
+            for tensor_lists in ([g_16, p_16, m_16, v_16], [g_32, p_32, m_32, v_32]):
+                for device_type, lists in split_tensor_lists_by_device(tensor_lists).items():
+                    if device_type == 'cpu':
+                        multi_tensor_lamb(*lists, group['lr'], beta1, beta2, group['eps'], group['step'],
+                                          bias_correction, group['weight_decay'], grad_averaging, self.adam_w_mode,
+                                          global_grad_norm, max_grad_norm, self.use_nvlamb)
+                    else:
+                        multi_tensor_applier(self.multi_tensor_lamb, self._dummy_overflow_buf, lists, group['lr'],
+                                             beta1, beta2, group['eps'], group['step'], bias_correction,
+                                             group['weight_decay'], grad_averaging, self.adam_w_mode,
+                                             global_grad_norm, max_grad_norm, self.use_nvlamb)
 
         return loss
@@ -5,13 +5,15 @@ from torch.optim.optimizer import Optimizer, required
 from colossalai.registry import OPTIMIZERS
 from colossalai.utils import multi_tensor_applier
 
+from .multi_tensor_ops import multi_tensor_sgd, split_tensor_lists_by_device
+
 
 @OPTIMIZERS.register_module
 class FusedSGD(Optimizer):
     r"""Implements stochastic gradient descent (optionally with momentum).
 
-    Currently GPU-only.  Requires ColossalAI to be installed via
-    ``pip install .``.
+    CUDA params require ColossalAI to be installed via ``pip install .``.
+    CPU params are updated by ``torch._foreach_*`` ops with the same numerics.
 
     This version of fused SGD implements 2 fusions.
 
@@ -93,7 +95,7 @@ class FusedSGD(Optimizer):
                                                     device=self.param_groups[0]["params"][0].device)
             self.multi_tensor_sgd = colossal_C.multi_tensor_sgd
         else:
-            raise RuntimeError('FusedSGD requires cuda extensions')
+            self.multi_tensor_sgd = None
 
     def __setstate__(self, state):
         super(FusedSGD, self).__setstate__(state)
@@ -198,10 +200,17 @@ class FusedSGD(Optimizer):
             for s, (launch_set, first_run) in enumerate(zip(launch_sets, first_runs)):
                 assert len(launch_set[0]) == len(launch_set[1])
                 assert len(launch_set[0]) == len(launch_set[2])
-                if len(launch_set[0]) > 0:
-                    multi_tensor_applier(self.multi_tensor_sgd, self._dummy_overflow_buf, launch_set, weight_decay,
-                                         momentum, dampening, group['lr'], nesterov, first_run, self.wd_after_momentum,
-                                         1.0 / self.most_recent_scale)
+                # split by the device of params to update
+                for device_type, lists in split_tensor_lists_by_device(launch_set, device_list_idx=1).items():
+                    if device_type == 'cpu':
+                        multi_tensor_sgd(lists, weight_decay, momentum, dampening, group['lr'], nesterov, first_run,
+                                         self.wd_after_momentum, 1.0 / self.most_recent_scale)
+                    elif self.multi_tensor_sgd is None:
+                        raise RuntimeError('FusedSGD requires cuda extensions')
+                    else:
+                        multi_tensor_applier(self.multi_tensor_sgd, self._dummy_overflow_buf, lists, weight_decay,
+                                             momentum, dampening, group['lr'], nesterov, first_run,
+                                             self.wd_after_momentum, 1.0 / self.most_recent_scale)
 
         self.most_recent_scale = 1.0
         self.scale_set_by_backward = False
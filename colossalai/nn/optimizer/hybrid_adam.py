@@ -1,12 +1,16 @@
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
 import torch
 
 from colossalai.utils import multi_tensor_applier
 from colossalai.registry import OPTIMIZERS
-from colossalai.nn.optimizer import CPU_ADAM_CNT
+from colossalai.nn.optimizer.cpu_adam import CPUAdam
+from colossalai.nn.optimizer.utils import quantized_adam_update
 
 
 @OPTIMIZERS.register_module
-class HybridAdam(torch.optim.Optimizer):
+class HybridAdam(CPUAdam):
     """Implements Adam algorithm.
 
     Supports parameters updating on both GPU and CPU, depanding on the device of paramters.
@@ -20,9 +24,15 @@ class HybridAdam(torch.optim.Optimizer):
     This version of Hybrid Adam is an hybrid of CPUAdam and FusedAdam.
 
     * For parameters updating on CPU, it uses CPUAdam.
+      Small CPU parameters are updated together with ``torch._foreach_*`` ops to save per-call overhead.
     * For parameters updating on GPU, it uses FusedAdam.
     * Hybird precision calculation of fp16 and fp32 is supported, eg fp32 parameters and fp16 gradients.
 
+    Params of each group are partitioned by device and kind of states, and the partitions are cached per list of
+    params of the group, so that optimizers stepping a group chunk by chunk, e.g. ``ShardedOptimizerV2``, hit the cache.
+    A partition is rebuilt when any of its params moves to another device or the optimizer states are loaded.
+    If you replace states of params in other ways, call :meth:`invalidate_param_partitions`.
+
     :class:`colossalai.nn.optimizer.HybridAdam` may be used as a drop-in replacement for ``torch.optim.AdamW``,
     or ``torch.optim.Adam`` with ``adamw_mode=False``
 
@@ -44,6 +54,17 @@ class HybridAdam(torch.optim.Optimizer):
             True for decoupled weight decay(also known as AdamW) (default: True)
         simd_log (boolean, optional): whether to show if you are using SIMD to 
             accelerate. (default: False)
+        quantized_states (boolean, optional): whether to keep ``exp_avg`` and ``exp_avg_sq`` as 8-bit blockwise
+            dynamic quantized states, which cuts the memory of states by about 4x. States are dequantized
+            chunk by chunk in the update and re-quantized. (default: False)
+        quantize_block_size (int, optional): number of elements sharing an absmax scale in quantized states.
+            (default: 2048)
+        offload_states_dir (str, optional): if given, ``exp_avg`` and ``exp_avg_sq`` of CPU parameters are kept in
+            memory-mapped temporary files in this directory, and CPU parameters are updated block by block,
+            overlapped with reading states of the next block and writing back states of the previous block.
+            It can't be used with ``quantized_states``. (default: None)
+        offload_states_block_size (int, optional): number of elements in a block of offloaded states.
+            (default: 2**24)
 
     .. _Adam\: A Method for Stochastic Optimization:
         https://arxiv.org/abs/1412.6980
@@ -51,9 +72,8 @@ class HybridAdam(torch.optim.Optimizer):
         https://openreview.net/forum?id=ryQu7f-RZ
     """
 
-    # Number of fp32 shards for per parameter
-    # Param weight, grad, momentum and variance
-    num_fp32_shards_per_param = 4
+    # CPU params with fewer elements are updated together by the PyTorch multi-tensor implementation
+    cpu_batch_numel = 2**16
 
     def __init__(self,
                  model_params,
@@ -63,27 +83,103 @@ class HybridAdam(torch.optim.Optimizer):
                  eps=1e-8,
                  weight_decay=0,
                  adamw_mode=True,
-                 simd_log=False):
-
-        default_args = dict(lr=lr, betas=betas, eps=eps, weight_decay=weight_decay, bias_correction=bias_correction)
-        super(HybridAdam, self).__init__(model_params, default_args)
-        self.opt_id = CPU_ADAM_CNT()
-        self.adamw_mode = adamw_mode
+                 simd_log=False,
+                 quantized_states=False,
+                 quantize_block_size=2048,
+                 offload_states_dir=None,
+                 offload_states_block_size=2**24):
+        super(HybridAdam, self).__init__(model_params,
+                                         lr=lr,
+                                         bias_correction=bias_correction,
+                                         betas=betas,
+                                         eps=eps,
+                                         weight_decay=weight_decay,
+                                         adamw_mode=adamw_mode,
+                                         simd_log=simd_log,
+                                         quantized_states=quantized_states,
+                                         quantize_block_size=quantize_block_size,
+                                         offload_states_dir=offload_states_dir,
+                                         offload_states_block_size=offload_states_block_size)
         try:
-            import cpu_adam
             import colossal_C
         except ImportError:
             raise ImportError('Please install colossalai from source code to use HybridAdam')
 
-        self.cpu_adam_op = cpu_adam
-        self.cpu_adam_op.create_adam(self.opt_id, lr, betas[0], betas[1], eps, weight_decay, adamw_mode, simd_log)
-
         self.gpu_adam_op = colossal_C.multi_tensor_adam
         self._dummy_overflow_buf = torch.cuda.IntTensor([0])
-
-    def __del__(self):
-        if self.cpu_adam_op:
-            self.cpu_adam_op.destroy_adam(self.opt_id)
+        # (group index, ids of params) -> (devices of params, partition), valid for the states of the optimizer
+        self._param_partitions: Dict[Tuple, Tuple[Tuple[torch.device, ...], Dict[str, List]]] = {}
+        self._param_partitions_state = None
+
+    def invalidate_param_partitions(self):
+        self._param_partitions.clear()
+        self._param_partitions_state = None
+
+    def _get_update_fn(self, p, state, group):
+        if p.device.type == 'cpu':
+            return super(HybridAdam, self)._get_update_fn(p, state, group)
+        beta1, beta2 = group['betas']
+        step = state['step']
+        adamw_mode = 1 if self.adamw_mode else 0
+        bias_correction = 1 if group['bias_correction'] else 0
+
+        def update_fn(data, grad, exp_avg, exp_avg_sq):
+            multi_tensor_applier(self.gpu_adam_op, self._dummy_overflow_buf, [[grad], [data], [exp_avg], [exp_avg_sq]],
+                                 group['lr'], beta1, beta2, group['eps'], step, adamw_mode, bias_correction,
+                                 group['weight_decay'])
+
+        return update_fn
+
+    def _build_param_partition(self, group) -> Dict[str, List]:
+        """Partition params of a group by device and kind of states.
+        States of params with gradients are initialized. Params without gradients and states are not partitioned.
+        """
+        partition = dict(cpu=[], cpu_batch=[], cuda=[], quantized=[], disk=[], uninitialized=[])
+        for p in group['params']:
+            state = self.state[p]
+            if len(state) == 0:
+                if p.grad is None:
+                    partition['uninitialized'].append(p)
+                    continue
+                self._init_state(p, state)
+
+            target_device = p.device
+            if 'exp_avg_absmax' in state:
+                assert state['exp_avg'].device == target_device, "quantized states should stay with the param"
+                partition['quantized'].append((p, state))
+            elif self.disk_states is not None and self.disk_states.is_offloaded(p, state):
+                assert target_device.type == 'cpu', "offloaded states should stay with a CPU param"
+                partition['disk'].append((p, state))
+            elif target_device.type == 'cpu':
+                assert state['exp_avg'].device.type == 'cpu', "exp_avg should stay on cpu"
+                assert state['exp_avg_sq'].device.type == 'cpu', "exp_avg should stay on cpu"
+                if self.cpu_adam_op is None or p.numel() < self.cpu_batch_numel:
+                    partition['cpu_batch'].append((p, state))
+                else:
+                    partition['cpu'].append((p, state))
+            elif target_device.type == 'cuda':
+                assert state['exp_avg'].device.type == 'cuda', "exp_avg should stay on cuda"
+                assert state['exp_avg_sq'].device.type == 'cuda', "exp_avg should stay on cuda"
+                partition['cuda'].append((p, state))
+            else:
+                raise RuntimeError
+        return partition
+
+    def _get_param_partition(self, group_id, group) -> Dict[str, List]:
+        # loading a state dict replaces the states
+        if self._param_partitions_state is not self.state:
+            self.invalidate_param_partitions()
+            self._param_partitions_state = self.state
+        # partitions hold the params, so their ids are not reused
+        params_key = (group_id, tuple(map(id, group['params'])))
+        devices = tuple(p.device for p in group['params'])
+        cached = self._param_partitions.get(params_key)
+        # params which get gradients for the first time must be initialized
+        if cached is not None and cached[0] == devices and all(p.grad is None for p in cached[1]['uninitialized']):
+            return cached[1]
+        partition = self._build_param_partition(group)
+        self._param_partitions[params_key] = (devices, partition)
+        return partition
 
     @torch.no_grad()
     def step(self, closure=None):
@@ -92,52 +188,56 @@ class HybridAdam(torch.optim.Optimizer):
             with torch.enable_grad():
                 loss = closure()
 
-        for _, group in enumerate(self.param_groups):
-            g_l, p_l, m_l, v_l = [], [], [], []
-            group_step = 0
-            for _, p in enumerate(group['params']):
-
-                if p.grad is None:
-                    continue
-
-                state = self.state[p]
-
-                target_device = p.device
-                if len(state) == 0:
-                    state['step'] = 0
-
-                    # gradient momentums
-                    state['exp_avg'] = torch.zeros_like(p.data, dtype=torch.float, device=target_device)
-                    # gradient variances
-                    state['exp_avg_sq'] = torch.zeros_like(p.data, dtype=torch.float, device=target_device)
-
-                state['step'] += 1
-                group_step = state['step']
-                beta1, beta2 = group['betas']
-
-                if target_device.type == 'cpu':
-                    assert state['exp_avg'].device.type == 'cpu', "exp_avg should stay on cpu"
-                    assert state['exp_avg_sq'].device.type == 'cpu', "exp_avg should stay on cpu"
-                    self.cpu_adam_op.adam_update(self.opt_id, state['step'], group['lr'], beta1, beta2, group['eps'],
-                                                 group['weight_decay'], group['bias_correction'], p.data, p.grad.data,
-                                                 state['exp_avg'], state['exp_avg_sq'], -1)
-
-                elif target_device.type == 'cuda':
-                    assert state['exp_avg'].device.type == 'cuda', "exp_avg should stay on cuda"
-                    assert state['exp_avg_sq'].device.type == 'cuda', "exp_avg should stay on cuda"
-
-                    # record the state by gruop and update at once
-                    g_l.append(p.grad.data)
-                    p_l.append(p.data)
-                    m_l.append(state['exp_avg'])
-                    v_l.append(state['exp_avg_sq'])
-
-                else:
-                    raise RuntimeError
-            if len(g_l) > 0:
+        for group_id, group in enumerate(self.param_groups):
+            partition = self._get_param_partition(group_id, group)
+            beta1, beta2 = group['betas']
+
+            def params_with_grad(kind):
+                tasks = [(p, state) for p, state in partition[kind] if p.grad is not None]
+                for _, state in tasks:
+                    state['step'] += 1
+                return tasks
+
+            for p, state in params_with_grad('quantized'):
+                quantized_adam_update(p.data, p.grad.data, state, self.quantize_chunk_size,
+                                      self._get_update_fn(p, state, group))
+
+            for p, state in params_with_grad('cpu'):
+                self.cpu_adam_op.adam_update(self.opt_id, state['step'], group['lr'], beta1, beta2, group['eps'],
+                                             group['weight_decay'], group['bias_correction'], p.data, p.grad.data,
+                                             state['exp_avg'], state['exp_avg_sq'], -1)
+
+            # CPU tensors updated together, grouped by step
+            cpu_tensor_lists = defaultdict(lambda: ([], [], [], []))
+            for p, state in params_with_grad('cpu_batch'):
+                p_l, g_l, m_l, v_l = cpu_tensor_lists[state['step']]
+                p_l.append(p.data)
+                g_l.append(p.grad.data)
+                m_l.append(state['exp_avg'])
+                v_l.append(state['exp_avg_sq'])
+            for step, (p_l, g_l, m_l, v_l) in cpu_tensor_lists.items():
+                bias_correction1, bias_correction2 = 1, 1
+                if group['bias_correction']:
+                    bias_correction1 = 1 - beta1**step
+                    bias_correction2 = 1 - beta2**step
+                self.torch_multi_tensor_adam_update(p_l, g_l, m_l, v_l, group['lr'], beta1, beta2, group['eps'],
+                                                    group['weight_decay'], bias_correction1, bias_correction2,
+                                                    self.adamw_mode)
+
+            cuda = params_with_grad('cuda')
+            if len(cuda) > 0:
+                group_step = cuda[-1][1]['step']
                 adamw_mode = 1 if self.adamw_mode else 0
                 bias_correction = 1 if group['bias_correction'] else 0
+                g_l = [p.grad.data for p, _ in cuda]
+                p_l = [p.data for p, _ in cuda]
+                m_l = [state['exp_avg'] for _, state in cuda]
+                v_l = [state['exp_avg_sq'] for _, state in cuda]
                 multi_tensor_applier(self.gpu_adam_op, self._dummy_overflow_buf, [g_l, p_l, m_l, v_l], group['lr'],
                                      group['betas'][0], group['betas'][1], group['eps'], group_step, adamw_mode,
                                      bias_correction, group['weight_decay'])
+
+            disk_tasks = [(p, self._get_update_fn(p, state, group)) for p, state in params_with_grad('disk')]
+            if len(disk_tasks) > 0:
+                self.disk_states.update(disk_tasks)
         return loss
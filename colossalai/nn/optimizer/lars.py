@@ -7,6 +7,8 @@ from torch.optim import Optimizer
 
 from colossalai.registry import OPTIMIZERS
 
+from .multi_tensor_ops import multi_tensor_lars
+
 
 @OPTIMIZERS.register_module
 class Lars(Optimizer):
@@ -68,35 +70,19 @@ class Lars(Optimizer):
             lars = group['lars']
             eps = group['epsilon']
 
+            # params of the same device and dtype are updated by one multi-tensor launch
+            params_by_type = {}
             for p in group['params']:
                 if p.grad is None:
                     continue
-                decayed_grad = p.grad
-                scaled_lr = lr
-                if lars:
-                    w_norm = torch.norm(p)
-                    g_norm = torch.norm(p.grad)
-                    trust_ratio = torch.where(
-                        w_norm > 0 and g_norm > 0,
-                        eeta * w_norm / (g_norm + weight_decay * w_norm + eps),
-                        torch.ones_like(w_norm)
-                    )
-                    trust_ratio.clamp_(0.0, 50)
-                    scaled_lr *= trust_ratio.item()
-                    if weight_decay != 0:
-                        decayed_grad = decayed_grad.add(p, alpha=weight_decay)
-                decayed_grad = torch.clamp(decayed_grad, -10.0, 10.0)
+                params_by_type.setdefault((p.device, p.dtype), []).append(p)
 
+            for params in params_by_type.values():
+                momentum_buffers = [self.state[p].get('momentum_buffer') for p in params]
+                momentum_buffers = multi_tensor_lars([p.grad for p in params], params, momentum_buffers, lr,
+                                                     momentum, eeta, weight_decay, eps, lars)
                 if momentum != 0:
-                    param_state = self.state[p]
-                    if 'momentum_buffer' not in param_state:
-                        buf = param_state['momentum_buffer'] = torch.clone(
-                            decayed_grad).detach()
-                    else:
-                        buf = param_state['momentum_buffer']
-                        buf.mul_(momentum).add_(decayed_grad)
-                    decayed_grad = buf
-
-                p.add_(decayed_grad, alpha=-scaled_lr)
+                    for p, buf in zip(params, momentum_buffers):
+                        self.state[p]['momentum_buffer'] = buf
 
         return loss
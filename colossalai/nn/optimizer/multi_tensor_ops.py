@@ -0,0 +1,187 @@
+"""Multi-tensor optimizer ops built on ``torch._foreach_*``.
+
+They follow the numerics of the ``colossal_C.multi_tensor_*`` CUDA kernels, and work on any device.
+Fused optimizers use them for CPU params. fp16 tensors are computed in fp32 and written back.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import torch
+
+
+def split_tensor_lists_by_device(tensor_lists: List[List[torch.Tensor]],
+                                 device_list_idx: int = 0) -> Dict[str, List[List[torch.Tensor]]]:
+    """Split tensor lists by the device type of tensors in ``tensor_lists[device_list_idx]``."""
+    splits: Dict[str, List[List[torch.Tensor]]] = {}
+    for i, t in enumerate(tensor_lists[device_list_idx]):
+        lists = splits.setdefault(t.device.type, [[] for _ in tensor_lists])
+        for dst, src in zip(lists, tensor_lists):
+            dst.append(src[i])
+    return splits
+
+
+def _to_fp32(tensors: List[torch.Tensor]) -> List[torch.Tensor]:
+    return [t if t.dtype == torch.float else t.float() for t in tensors]
+
+
+def _copy_back(tensors: List[torch.Tensor], fp32_tensors: List[torch.Tensor]) -> None:
+    for t, fp32_t in zip(tensors, fp32_tensors):
+        if t is not fp32_t:
+            t.copy_(fp32_t)
+
+
+def multi_tensor_l2norm(tensors: List[torch.Tensor],
+                        per_tensor: bool = False) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+    """Return the l2 norm of all tensors in fp32, and the norm of each tensor if ``per_tensor``."""
+    norms = torch.stack(torch._foreach_norm(_to_fp32(tensors)))
+    return norms.norm(), norms if per_tensor else None
+
+
+@torch.no_grad()
+def multi_tensor_adam(g_l: List[torch.Tensor], p_l: List[torch.Tensor], m_l: List[torch.Tensor],
+                      v_l: List[torch.Tensor], lr: float, beta1: float, beta2: float, eps: float, step: int,
+                      adamw_mode: int, bias_correction: int, weight_decay: float) -> None:
+    """Adam of ``colossal_C.multi_tensor_adam``."""
+    bias_correction1, bias_correction2 = 1.0, 1.0
+    if bias_correction == 1:
+        bias_correction1 = 1 - beta1**step
+        bias_correction2 = 1 - beta2**step
+    g_32, p_32, m_32, v_32 = _to_fp32(g_l), _to_fp32(p_l), _to_fp32(m_l), _to_fp32(v_l)
+
+    if adamw_mode == 0 and weight_decay != 0:
+        # L2
+        g_32 = torch._foreach_add(g_32, p_32, alpha=weight_decay)
+    torch._foreach_mul_(m_32, beta1)
+    torch._foreach_add_(m_32, g_32, alpha=1 - beta1)
+    torch._foreach_mul_(v_32, beta2)
+    torch._foreach_addcmul_(v_32, g_32, g_32, value=1 - beta2)
+
+    denom = torch._foreach_div(v_32, bias_correction2)
+    torch._foreach_sqrt_(denom)
+    torch._foreach_add_(denom, eps)
+    update = torch._foreach_div(m_32, bias_correction1)
+    torch._foreach_div_(update, denom)
+    if adamw_mode == 1 and weight_decay != 0:
+        torch._foreach_add_(update, p_32, alpha=weight_decay)
+    torch._foreach_add_(p_32, update, alpha=-lr)
+
+    _copy_back(p_l, p_32)
+    _copy_back(m_l, m_32)
+    _copy_back(v_l, v_32)
+
+
+@torch.no_grad()
+def multi_tensor_lamb(g_l: List[torch.Tensor], p_l: List[torch.Tensor], m_l: List[torch.Tensor],
+                      v_l: List[torch.Tensor], lr: float, beta1: float, beta2: float, eps: float, step: int,
+                      bias_correction: int, weight_decay: float, grad_averaging: int, mode: int,
+                      global_grad_norm: torch.Tensor, max_grad_norm: float, use_nvlamb: bool) -> None:
+    """LAMB of ``colossal_C.multi_tensor_lamb``. Trust ratios are computed from batched per-tensor norms."""
+    bias_correction1, bias_correction2 = 1.0, 1.0
+    if bias_correction == 1:
+        bias_correction1 = 1 - beta1**step
+        bias_correction2 = 1 - beta2**step
+    beta3 = 1 - beta1 if grad_averaging == 1 else 1.0
+    global_grad_norm = float(global_grad_norm)
+    clipped_global_grad_norm = global_grad_norm / max_grad_norm if global_grad_norm > max_grad_norm else 1.0
+    g_32, p_32, m_32, v_32 = _to_fp32(g_l), _to_fp32(p_l), _to_fp32(m_l), _to_fp32(v_l)
+
+    # stage 1: compute updates
+    scaled_g = torch._foreach_div(g_32, clipped_global_grad_norm)
+    if mode == 0 and weight_decay != 0:
+        # L2 on scaled grad
+        torch._foreach_add_(scaled_g, p_32, alpha=weight_decay)
+    torch._foreach_mul_(m_32, beta1)
+    torch._foreach_add_(m_32, scaled_g, alpha=beta3)
+    torch._foreach_mul_(v_32, beta2)
+    torch._foreach_addcmul_(v_32, scaled_g, scaled_g, value=1 - beta2)
+    denom = torch._foreach_div(v_32, bias_correction2)
+    torch._foreach_sqrt_(denom)
+    torch._foreach_add_(denom, eps)
+    update = torch._foreach_div(m_32, bias_correction1)
+    torch._foreach_div_(update, denom)
+    if mode == 1 and weight_decay != 0:
+        torch._foreach_add_(update, p_32, alpha=weight_decay)
+
+    # stage 2: apply updates with trust ratios
+    if use_nvlamb or weight_decay != 0:
+        param_norms = torch.stack(torch._foreach_norm(p_32))
+        update_norms = torch.stack(torch._foreach_norm(update))
+        ratios = torch.where((param_norms != 0) & (update_norms != 0), lr * param_norms / update_norms,
+                             torch.full_like(param_norms, lr))
+        torch._foreach_mul_(update, ratios.tolist())
+    else:
+        torch._foreach_mul_(update, lr)
+    torch._foreach_sub_(p_32, update)
+
+    _copy_back(p_l, p_32)
+    _copy_back(m_l, m_32)
+    _copy_back(v_l, v_32)
+
+
+@torch.no_grad()
+def multi_tensor_sgd(tensor_lists: List[List[torch.Tensor]], weight_decay: float, momentum: float, dampening: float,
+                     lr: float, nesterov: bool, first_run: bool, wd_after_momentum: bool, scale: float) -> None:
+    """SGD of ``colossal_C.multi_tensor_sgd``.
+    ``tensor_lists`` is ``[grads, params, momentums]``, with optional fp16 copies of params as the 4th list.
+    """
+    g_l, p_l, m_l = tensor_lists[:3]
+    p_32, m_32 = _to_fp32(p_l), _to_fp32(m_l)
+    g_32 = torch._foreach_mul(_to_fp32(g_l), scale)
+
+    if weight_decay != 0 and not wd_after_momentum:
+        torch._foreach_add_(g_32, p_32, alpha=weight_decay)
+    if momentum != 0:
+        if first_run:
+            for m, g in zip(m_32, g_32):
+                m.copy_(g)
+        else:
+            torch._foreach_mul_(m_32, momentum)
+            torch._foreach_add_(m_32, g_32, alpha=1 - dampening)
+        if nesterov:
+            torch._foreach_add_(g_32, m_32, alpha=momentum)
+        else:
+            g_32 = m_32
+    if weight_decay != 0 and wd_after_momentum:
+        g_32 = torch._foreach_add(g_32, p_32, alpha=weight_decay)
+    torch._foreach_add_(p_32, g_32, alpha=-lr)
+
+    _copy_back(p_l, p_32)
+    if momentum != 0:
+        _copy_back(m_l, m_32)
+    if len(tensor_lists) == 4:
+        _copy_back(tensor_lists[3], p_32)
+
+
+@torch.no_grad()
+def multi_tensor_lars(g_l: List[torch.Tensor], p_l: List[torch.Tensor], momentum_buffers: List[Optional[torch.Tensor]],
+                      lr: float, momentum: float, eeta: float, weight_decay: float, eps: float,
+                      lars: bool) -> List[Optional[torch.Tensor]]:
+    """LARS of :class:`colossalai.nn.optimizer.Lars`. Trust ratios are computed from batched per-tensor norms.
+    Tensors must have the same dtype and device.
+
+    Returns:
+        List[Optional[torch.Tensor]]: momentum buffers, new buffers are created for ``None``.
+    """
+    if lars:
+        w_norms = torch.stack(torch._foreach_norm(p_l))
+        g_norms = torch.stack(torch._foreach_norm(g_l))
+        trust_ratios = torch.where((w_norms > 0) & (g_norms > 0),
+                                   eeta * w_norms / (g_norms + weight_decay * w_norms + eps),
+                                   torch.ones_like(w_norms)).clamp_(0.0, 50)
+        scaled_lrs = (lr * trust_ratios).tolist()
+        if weight_decay != 0:
+            g_l = torch._foreach_add(g_l, p_l, alpha=weight_decay)
+    else:
+        scaled_lrs = [lr] * len(p_l)
+    decayed_grads = [torch.clamp(g, -10.0, 10.0) for g in g_l]
+
+    if momentum != 0:
+        existing = [i for i, buf in enumerate(momentum_buffers) if buf is not None]
+        if len(existing) > 0:
+            bufs = [momentum_buffers[i] for i in existing]
+            torch._foreach_mul_(bufs, momentum)
+            torch._foreach_add_(bufs, [decayed_grads[i] for i in existing])
+        momentum_buffers = [g.clone() if buf is None else buf for g, buf in zip(decayed_grads, momentum_buffers)]
+        decayed_grads = momentum_buffers
+
+    torch._foreach_sub_(p_l, torch._foreach_mul(decayed_grads, scaled_lrs))
+    return momentum_buffers
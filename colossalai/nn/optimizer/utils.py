@@ -1,3 +1,12 @@
+import mmap
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Dict, List, Tuple
+
+import torch
+import torch.nn.functional as F
+
+
 class CpuAdamCounter(object):
     """Used to record the total number of CPU Adam.
     We must use it to avoid hybrid cpu adam and cpu adam using the same id.
@@ -12,3 +21,186 @@ class CpuAdamCounter(object):
 
 
 CPU_ADAM_CNT = CpuAdamCounter()
+
+
+_DYNAMIC_MAPS: Dict[Tuple[bool, torch.device], torch.Tensor] = {}
+
+
+def get_dynamic_map(signed: bool, device: torch.device) -> torch.Tensor:
+    """Return the sorted 8-bit code of blockwise dynamic quantization.
+    Codes are spaced logarithmically over 7 decades below 1, so small values of a block keep their relative precision.
+    """
+    key = (signed, torch.device(device))
+    if key not in _DYNAMIC_MAPS:
+        if signed:
+            positive = torch.logspace(-7, 0, 127, dtype=torch.float64)
+            code = torch.cat([-positive.flip(0), positive.new_zeros(1), positive])
+        else:
+            code = torch.cat([torch.zeros(1, dtype=torch.float64), torch.logspace(-7, 0, 255, dtype=torch.float64)])
+        _DYNAMIC_MAPS[key] = code.float().to(device)
+    return _DYNAMIC_MAPS[key]
+
+
+def quantize_dynamic_blockwise(tensor: torch.Tensor, block_size: int,
+                               signed: bool) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Quantize a flat tensor to uint8 indices of the dynamic map, with an absmax scale per block.
+    The tensor is padded to a multiple of ``block_size``.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: uint8 indices of shape ``(num_blocks, block_size)``
+        and fp32 absmax of shape ``(num_blocks,)``.
+    """
+    code = get_dynamic_map(signed, tensor.device)
+    blocks = F.pad(tensor.float(), [0, -tensor.numel() % block_size]).view(-1, block_size)
+    absmax = blocks.abs().amax(dim=-1).clamp_(min=torch.finfo(torch.float).tiny)
+    # round to the nearest code
+    indices = torch.bucketize(blocks / absmax.unsqueeze(-1), (code[1:] + code[:-1]) / 2)
+    return indices.to(torch.uint8), absmax
+
+
+def dequantize_dynamic_blockwise(indices: torch.Tensor, absmax: torch.Tensor, numel: int,
+                                 signed: bool) -> torch.Tensor:
+    """Dequantize the output of :func:`quantize_dynamic_blockwise` to a flat fp32 tensor of ``numel`` elements."""
+    code = get_dynamic_map(signed, indices.device)
+    return code[indices.long()].mul_(absmax.unsqueeze(-1)).view(-1)[:numel]
+
+
+# names of the quantized Adam states and whether they are quantized with the signed map
+QUANTIZED_ADAM_STATES = {'exp_avg': True, 'exp_avg_sq': False}
+
+
+def init_quantized_adam_states(state: dict, numel: int, block_size: int, device: torch.device) -> None:
+    """Initialize zero ``exp_avg`` and ``exp_avg_sq`` as blockwise dynamic quantized states."""
+    num_blocks = (numel + block_size - 1) // block_size
+    for name, signed in QUANTIZED_ADAM_STATES.items():
+        zero_index = torch.nonzero(get_dynamic_map(signed, device) == 0).item()
+        state[name] = torch.full((num_blocks, block_size), zero_index, dtype=torch.uint8, device=device)
+        state[f'{name}_absmax'] = torch.zeros(num_blocks, device=device)
+
+
+def quantized_adam_update(data: torch.Tensor, grad: torch.Tensor, state: dict, chunk_size: int,
+                          update_fn: Callable[[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor], None]) -> None:
+    """Update a param with blockwise dynamic quantized Adam states, see :func:`init_quantized_adam_states`.
+
+    The param is processed in chunks of about ``chunk_size`` elements. States of a chunk are dequantized to fp32,
+    ``update_fn(data, grad, exp_avg, exp_avg_sq)`` is called on flat views of the chunk, and states are re-quantized.
+    The square root of ``exp_avg_sq`` is quantized, which halves the dynamic range to cover.
+    """
+    assert data.is_contiguous() and grad.is_contiguous(), 'param and gradient must be contiguous'
+    numel = data.numel()
+    block_size = state['exp_avg'].size(-1)
+    chunk_blocks = max(1, chunk_size // block_size)
+    flat_data, flat_grad = data.view(-1), grad.view(-1)
+    for block_start in range(0, state['exp_avg'].size(0), chunk_blocks):
+        block_end = min(block_start + chunk_blocks, state['exp_avg'].size(0))
+        start, end = block_start * block_size, min(block_end * block_size, numel)
+        exp_avg = dequantize_dynamic_blockwise(state['exp_avg'][block_start:block_end],
+                                               state['exp_avg_absmax'][block_start:block_end], end - start, True)
+        exp_avg_sq = dequantize_dynamic_blockwise(state['exp_avg_sq'][block_start:block_end],
+                                                  state['exp_avg_sq_absmax'][block_start:block_end], end - start,
+                                                  False).pow_(2)
+        update_fn(flat_data[start:end], flat_grad[start:end], exp_avg, exp_avg_sq)
+        state['exp_avg'][block_start:block_end], state['exp_avg_absmax'][block_start:block_end] = \
+            quantize_dynamic_blockwise(exp_avg, block_size, True)
+        state['exp_avg_sq'][block_start:block_end], state['exp_avg_sq_absmax'][block_start:block_end] = \
+            quantize_dynamic_blockwise(exp_avg_sq.sqrt_(), block_size, False)
+
+
+class DiskAdamStates(object):
+    """Keep ``exp_avg`` and ``exp_avg_sq`` of CPU params in memory-mapped temporary files under ``offload_dir``.
+
+    The states are ordinary fp32 CPU tensors backed by the files, so any update kernel can run on them directly.
+    :meth:`update` processes params in blocks of ``block_size`` elements instead. States of the next block are read
+    into memory on a background thread, and states of the previous block are written back and flushed on another
+    thread, both overlapped with the update of the current block. At most 3 blocks of states are in memory.
+
+    Args:
+        offload_dir (str): Directory of the files. The files are removed when they are closed.
+        block_size (int, optional): Number of elements in a block. Defaults to 2**24.
+    """
+
+    def __init__(self, offload_dir: str, block_size: int = 2**24) -> None:
+        assert block_size > 0, 'block_size must be positive'
+        self.offload_dir = offload_dir
+        self.block_size = block_size
+        self._files: Dict[torch.Tensor, Tuple[BinaryIO, mmap.mmap, torch.Tensor]] = {}
+        self._reader = ThreadPoolExecutor(max_workers=1)
+        self._writer = ThreadPoolExecutor(max_workers=1)
+
+    def init_states(self, p: torch.Tensor, state: dict) -> None:
+        numel = p.numel()
+        if numel == 0:
+            # empty files can't be mapped, and there is nothing to offload
+            state['exp_avg'] = torch.zeros_like(p, dtype=torch.float)
+            state['exp_avg_sq'] = torch.zeros_like(p, dtype=torch.float)
+            return
+        f = tempfile.TemporaryFile(dir=self.offload_dir)
+        f.truncate(2 * numel * 4)
+        buffer = mmap.mmap(f.fileno(), 2 * numel * 4)
+        flat_states = torch.frombuffer(buffer, dtype=torch.float)
+        self._files[p] = (f, buffer, flat_states)
+        state['exp_avg'] = flat_states[:numel].view(p.shape)
+        state['exp_avg_sq'] = flat_states[numel:].view(p.shape)
+
+    def load_states(self, p: torch.Tensor, state: dict) -> None:
+        """Copy in-memory states, e.g. loaded from a state dict, into the files of ``p`` and rebind them."""
+        exp_avg, exp_avg_sq = state['exp_avg'], state['exp_avg_sq']
+        if p in self._files:
+            numel, flat_states = p.numel(), self._files[p][2]
+            state['exp_avg'] = flat_states[:numel].view(p.shape)
+            state['exp_avg_sq'] = flat_states[numel:].view(p.shape)
+        else:
+            self.init_states(p, state)
+        if state['exp_avg'].data_ptr() != exp_avg.data_ptr():
+            state['exp_avg'].copy_(exp_avg)
+            state['exp_avg_sq'].copy_(exp_avg_sq)
+
+    def is_offloaded(self, p: torch.Tensor, state: dict) -> bool:
+        # states are replaced by in-memory tensors after loading a state dict, until :meth:`load_states` is called
+        return p in self._files and state['exp_avg'].data_ptr() == self._files[p][2].data_ptr()
+
+    def _read(self, p: torch.Tensor, start: int, end: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        flat_states = self._files[p][2]
+        return flat_states[start:end].clone(), flat_states[p.numel() + start:p.numel() + end].clone()
+
+    def _write(self, p: torch.Tensor, start: int, end: int, exp_avg: torch.Tensor, exp_avg_sq: torch.Tensor) -> None:
+        _, buffer, flat_states = self._files[p]
+        for offset, t in ((start, exp_avg), (p.numel() + start, exp_avg_sq)):
+            flat_states[offset:offset + t.numel()].copy_(t)
+            # flush the written pages, so that they are clean and can be reclaimed
+            byte_start = offset * 4 // mmap.PAGESIZE * mmap.PAGESIZE
+            buffer.flush(byte_start, (offset + t.numel()) * 4 - byte_start)
+
+    def update(self, tasks: List[Tuple[torch.Tensor, Callable]]) -> None:
+        """Update params block by block.
+
+        Args:
+            tasks (List[Tuple[torch.Tensor, Callable]]): list of ``(param, update_fn)``.
+                ``update_fn(data, grad, exp_avg, exp_avg_sq)`` is called on flat views of a block.
+        """
+        blocks = [(p, update_fn, start, min(start + self.block_size, p.numel()))
+                  for p, update_fn in tasks
+                  for start in range(0, p.numel(), self.block_size)]
+        if len(blocks) == 0:
+            return
+        read_future = self._reader.submit(self._read, blocks[0][0], blocks[0][2], blocks[0][3])
+        write_future = None
+        for i, (p, update_fn, start, end) in enumerate(blocks):
+            exp_avg, exp_avg_sq = read_future.result()
+            if i + 1 < len(blocks):
+                next_p, _, next_start, next_end = blocks[i + 1]
+                read_future = self._reader.submit(self._read, next_p, next_start, next_end)
+            data, grad = p.data, p.grad.data
+            assert data.is_contiguous() and grad.is_contiguous(), 'param and gradient must be contiguous'
+            update_fn(data.view(-1)[start:end], grad.view(-1)[start:end], exp_avg, exp_avg_sq)
+            if write_future is not None:
+                write_future.result()
+            write_future = self._writer.submit(self._write, p, start, end, exp_avg, exp_avg_sq)
+        write_future.result()
+
+    def close(self) -> None:
+        self._reader.shutdown()
+        self._writer.shutdown()
+        for f, buffer, _ in self._files.values():
+            f.close()
+        self._files.clear()
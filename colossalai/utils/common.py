@@ -4,17 +4,12 @@ import os
 import random
 import socket
 from pathlib import Path
-from typing import Callable, List, Union
+from typing import Callable, Dict, List, Tuple
 import functools
 import torch
 from torch._six import inf
 from torch.nn.parameter import Parameter
 
-try:
-    import colossal_C
-except:
-    pass
-
 from contextlib import contextmanager
 
 import torch.distributed as dist
@@ -25,6 +20,11 @@ from colossalai.global_variables import tensor_parallel_env as env
 
 from .multi_tensor_apply import multi_tensor_applier
 
+try:
+    import colossal_C
+except ImportError:
+    colossal_C = None
+
 
 def print_rank_0(msg: str, logger=None):
     """Print messages and save logs(optional). This is executed only if you are the rank-0 gpu.
@@ -124,31 +124,14 @@ def is_model_parallel_parameter(p):
     return hasattr(p, IS_TENSOR_PARALLEL) and getattr(p, IS_TENSOR_PARALLEL)
 
 
-def _calc_l2_norm(grads):
-    norm = 0.0
-    if len(grads) > 0:
-        dummy_overflow_buf = torch.cuda.IntTensor([0])
-        norm, _ = multi_tensor_applier(
-            colossal_C.multi_tensor_l2norm,
-            dummy_overflow_buf,
-            [grads],
-            False    # no per-parameter norm
-        )
-    return norm
-
-
-def _calc_lp(grads, norm_type):
-    norm = 0.0
-    for grad in grads:
-        grad_norm = torch.norm(grad, norm_type)
-        norm += grad_norm**norm_type
-    return norm
+def _get_world_size(parallel_mode: ParallelMode) -> int:
+    return gpc.get_world_size(parallel_mode) if gpc.is_initialized(parallel_mode) else 1
 
 
-def _move_norm_to_cuda(norm: Union[float, torch.Tensor]) -> Union[float, torch.Tensor]:
-    if torch.is_tensor(norm) and norm.device.type != 'cuda':
-        norm = norm.to(torch.cuda.current_device())
-    return norm
+def _get_comm_device(group) -> torch.device:
+    if dist.get_backend(group) == dist.Backend.NCCL:
+        return torch.device('cuda', torch.cuda.current_device())
+    return torch.device('cpu')
 
 
 # ======== Gradient Clipping =========
@@ -170,7 +153,7 @@ def clip_grad_norm_fp32(parameters, max_norm, norm_type=2):
         norm_type (Union[float, int, 'inf']): Type of the used p-norm. Can be ``'inf'`` for infinity norm.
 
     Returns:
-        float: Total norm of the parameters.
+        torch.Tensor: Total norm of the parameters, a 0-dim tensor.
     """
 
     if isinstance(parameters, torch.Tensor):
@@ -192,83 +175,62 @@ def clip_grad_norm_fp32(parameters, max_norm, norm_type=2):
             params.append(param)
 
     if len(params) == 0:
-        return 0.0
+        return torch.zeros(())
     # Norm parameters.
     max_norm = float(max_norm)
     norm_type = float(norm_type)
 
-    # Parameters can be on CPU or CUDA
-    # If parameters are on CPU, disable CUDA kernerls
-    enable_cuda_kernels = params[0].grad.device.type == 'cuda'
-
-    # Calculate norm.
-    if norm_type == inf:
-        total_norm = max(p.grad.data.abs().max() for p in params)
-        total_norm_cuda = torch.cuda.FloatTensor([float(total_norm)])
-        # Take max across all model-parallel GPUs.
-        if gpc.is_initialized(ParallelMode.MODEL) and gpc.get_world_size(ParallelMode.MODEL) > 1:
-            dist.all_reduce(total_norm_cuda,
-                            op=dist.ReduceOp.MAX,
-                            group=gpc.get_group(ParallelMode.MODEL),
-                            async_op=False)
-        if has_zero_shared_param:
-            dist.all_reduce(total_norm_cuda,
-                            op=dist.ReduceOp.MAX,
-                            group=gpc.get_group(ParallelMode.DATA),
-                            async_op=False)
-        total_norm = total_norm_cuda[0].item()
+    # Partial norms are reduced by one all-reduce, over the model parallel group,
+    # or over all ranks if zero sharded grads need to be summed across the data parallel group.
+    # Grads replicated over ranks of this group are weighted by the inverse of their number of replicas.
+    tp_world_size = _get_world_size(ParallelMode.TENSOR)
+    if has_zero_shared_param:
+        reduce_mode, dp_world_size = ParallelMode.GLOBAL, _get_world_size(ParallelMode.DATA)
     else:
-        tensor_parallel_grads = []
-        no_tensor_parallel_grads = []
-        zero_sharded_grads = []
-        for p in params:
-            if is_model_parallel_parameter(p):
-                reductor = (gpc.get_world_size(ParallelMode.TENSOR) / getattr(p, NUM_PARTITIONS))**(1 / norm_type)
-                tensor_parallel_grads.append(p.grad.data / reductor)
-            elif hasattr(p, 'zero_is_sharded'):
-                zero_sharded_grads.append(p.grad.data)
-            else:
-                no_tensor_parallel_grads.append(p.grad.data)
+        reduce_mode, dp_world_size = ParallelMode.MODEL, 1
+
+    # Group grads by device and weight, so that norms are computed by one foreach launch per group.
+    # Parameters can be on CPU or CUDA.
+    grad_groups: Dict[Tuple[torch.device, float], List[torch.Tensor]] = {}
+    for p in params:
+        if is_model_parallel_parameter(p):
+            weight = getattr(p, NUM_PARTITIONS) / (tp_world_size * dp_world_size)
+        elif hasattr(p, 'zero_is_sharded'):
+            weight = 1 / tp_world_size
+        else:
+            weight = 1 / (tp_world_size * dp_world_size)
+        grad_groups.setdefault((p.grad.device, weight), []).append(p.grad.detach())
 
-        if norm_type == 2.0 and enable_cuda_kernels:
-            tensor_parallel_norm = _calc_l2_norm(tensor_parallel_grads)**norm_type
-            no_tensor_parallel_norm = _calc_l2_norm(no_tensor_parallel_grads)**norm_type
-            zero_sharded_norm = _calc_l2_norm(zero_sharded_grads)**norm_type
+    reduce_group = gpc.get_group(reduce_mode) if _get_world_size(reduce_mode) > 1 else None
+    norm_device = params[0].grad.device if reduce_group is None else _get_comm_device(reduce_group)
+
+    # Calculate norm.
+    total_norm = torch.zeros((), device=norm_device)
+    for (_, weight), grads in grad_groups.items():
+        norms = torch.stack(torch._foreach_norm(grads, norm_type))
+        if norm_type == inf:
+            total_norm = torch.maximum(total_norm, norms.max().to(norm_device))
         else:
-            tensor_parallel_norm = _calc_lp(tensor_parallel_grads, norm_type)
-            no_tensor_parallel_norm = _calc_lp(no_tensor_parallel_grads, norm_type)
-            zero_sharded_norm = _calc_lp(zero_sharded_grads, norm_type)
-
-        # If grads are on CPU, the norms is also on CPU. Cast them to CUDA tensors
-        if not enable_cuda_kernels:
-            tensor_parallel_norm = _move_norm_to_cuda(tensor_parallel_norm)
-            no_tensor_parallel_norm = _move_norm_to_cuda(no_tensor_parallel_norm)
-            zero_sharded_norm = _move_norm_to_cuda(zero_sharded_norm)
-
-        # Sum across all model-parallel GPUs.
-        if gpc.is_initialized(ParallelMode.TENSOR) and len(tensor_parallel_grads) > 0:
-            dist.all_reduce(tensor_parallel_norm, op=dist.ReduceOp.SUM, group=gpc.get_group(ParallelMode.TENSOR))
-        # Sum across all zero sharded GPUs
-        if len(zero_sharded_grads) > 0:
-            dist.all_reduce(zero_sharded_norm, group=gpc.get_group(ParallelMode.DATA))
-            no_tensor_parallel_norm += zero_sharded_norm
-        total_norm = tensor_parallel_norm + no_tensor_parallel_norm
-        if gpc.is_initialized(ParallelMode.PIPELINE) and gpc.get_world_size(ParallelMode.PIPELINE) > 1:
-            dist.all_reduce(total_norm, op=dist.ReduceOp.SUM, group=gpc.get_group(ParallelMode.PIPELINE))
+            total_norm += (norms.pow(norm_type).sum() * weight).to(norm_device)
+    if reduce_group is not None:
+        op = dist.ReduceOp.MAX if norm_type == inf else dist.ReduceOp.SUM
+        dist.all_reduce(total_norm, op=op, group=reduce_group)
+    if norm_type != inf:
         total_norm = total_norm**(1.0 / norm_type)
-        if torch.is_tensor(total_norm):
-            total_norm = total_norm.item()
 
-    # Scale.
-    clip_coeff = max_norm / (total_norm + 1.0e-6)
+    # Scale only if needed, by one launch per device if the CUDA kernels are available.
+    clip_coeff = max_norm / (total_norm.item() + 1.0e-6)
     if clip_coeff < 1.0:
-        if enable_cuda_kernels:
-            grads = [p.grad.detach() for p in params]
-            dummy_overflow_buf = torch.cuda.IntTensor([0])
-            multi_tensor_applier(colossal_C.multi_tensor_scale, dummy_overflow_buf, [grads, grads], clip_coeff)
-        else:
-            for p in params:
-                p.grad.detach().mul_(clip_coeff)
+        device_grads: Dict[torch.device, List[torch.Tensor]] = {}
+        for (device, _), grads in grad_groups.items():
+            device_grads.setdefault(device, []).extend(grads)
+        for device, grads in device_grads.items():
+            if device.type == 'cuda' and colossal_C is not None:
+                dummy_overflow_buf = torch.zeros(1, dtype=torch.int, device=device)
+                multi_tensor_applier(colossal_C.multi_tensor_scale, dummy_overflow_buf, [grads, grads], clip_coeff)
+            else:
+                for grad in grads:
+                    grad.mul_(clip_coeff)
     return total_norm
 
 
@@ -3,7 +3,8 @@ import functools
 import inspect
 from colossalai.amp.naive_amp import NaiveAMPModel
 from colossalai.utils.model.utils import _substitute_init_recursively, InsertPostInitMethodToModuleSubClasses, call_to_str
-from colossalai.builder.pipeline import partition_uniform, partition_balanced
+from colossalai.builder.pipeline import (partition_uniform, partition_balanced, partition_profiled, profile_layers,
+                                         predict_pipeline_bubble)
 from colossalai.core import global_context as gpc
 from colossalai.nn.layer.utils import CheckpointModule
 from colossalai.tensor import ColoTensor
@@ -19,6 +20,10 @@ class PipelinableContext(InsertPostInitMethodToModuleSubClasses):
         self._layer_spec_list = []
         self._func_dict = {}
         self._policy = "balanced"
+        self._layer_profiles = None
+        self._num_microbatches = None
+        self._max_memory = None
+        self._predicted_bubble = None
 
     @property
     def policy(self):
@@ -32,6 +37,14 @@ class PipelinableContext(InsertPostInitMethodToModuleSubClasses):
     def funcs_count(self):
         return len(self._func_dict)
 
+    @property
+    def layer_profiles(self):
+        return self._layer_profiles
+
+    @property
+    def predicted_bubble(self):
+        return self._predicted_bubble
+
     def _pre_context_exec(self):
         """ 
         The Callback function when entering the context
@@ -39,7 +52,8 @@ class PipelinableContext(InsertPostInitMethodToModuleSubClasses):
 
         # reserve rng states
         self.cpu_rng_state = torch.get_rng_state()
-        self.cuda_rng_state = torch.cuda.get_rng_state()
+        if torch.cuda.is_available():
+            self.cuda_rng_state = torch.cuda.get_rng_state()
 
     def _post_context_exec(self):
         """
@@ -48,7 +62,8 @@ class PipelinableContext(InsertPostInitMethodToModuleSubClasses):
 
         # reset rng states
         torch.set_rng_state(self.cpu_rng_state)
-        torch.cuda.set_rng_state(self.cuda_rng_state)
+        if torch.cuda.is_available():
+            torch.cuda.set_rng_state(self.cuda_rng_state)
 
     def _post_init_method(self, module: torch.nn.Module, *args, **kwargs):
         """
@@ -136,6 +151,30 @@ class PipelinableContext(InsertPostInitMethodToModuleSubClasses):
                     else:
                         self._func_dict[func_key].append(element)
 
+    def profile_layers(self, sample_input, num_microbatches, max_memory=None, num_iters=3):
+        """
+        Profile the layers in the layer list on a sample micro batch for the "profiled" partition policy,
+        which minimizes the largest forward and backward time of a stage, optionally under a per stage
+        activation memory cap in bytes. The layers are built from their specs and discarded afterwards,
+        without consuming the random state, so that the partitioned model is initialized in the same way.
+        The bubble predicted for num_microbatches is available as predicted_bubble after partitioning.
+        """
+        layers = []
+        rng_devices = [torch.cuda.current_device()] if torch.cuda.is_available() else []
+        with torch.random.fork_rng(devices=rng_devices):
+            modules = [layer_spec.build() for layer_spec in self._layer_spec_list]
+        for layer_spec, module in zip(self._layer_spec_list, modules):
+            front_funcs, behind_funcs = {}, {}
+            if (layer_spec, "front") in self._func_dict:
+                front_funcs[id(module)] = self._func_dict[(layer_spec, "front")]
+            elif (layer_spec, "behind") in self._func_dict:
+                behind_funcs[id(module)] = self._func_dict[(layer_spec, "behind")]
+            layers.append(PipelinableModel(torch.nn.ModuleList([module]), front_funcs, behind_funcs))
+        self._layer_profiles = profile_layers(layers, sample_input, num_iters=num_iters)
+        self._num_microbatches = num_microbatches
+        self._max_memory = max_memory
+        return self._layer_profiles
+
     def partition(self, num_chunks, pipeline_size, rank):
         """
         Partitioned model will be built respect to partion policy.
@@ -149,8 +188,14 @@ class PipelinableContext(InsertPostInitMethodToModuleSubClasses):
                 for layer_spec in self._layer_spec_list:
                     param_counts.append(layer_spec.count_params())
                 parts = partition_balanced(param_counts, pipeline_size, num_chunks)[rank]
+            elif self._policy == "profiled":
+                assert self._layer_profiles is not None, 'layers should be profiled by profile_layers() first'
+                all_parts = partition_profiled(self._layer_profiles, pipeline_size, num_chunks, self._max_memory)
+                self._predicted_bubble = predict_pipeline_bubble(self._layer_profiles, all_parts,
+                                                                 self._num_microbatches)
+                parts = all_parts[rank]
             else:
-                raise ValueError("A string partition policy should be one of ['uniform', 'balanced'].")
+                raise ValueError("A string partition policy should be one of ['uniform', 'balanced', 'profiled'].")
         elif isinstance(self._policy, dict):
             parts = self._policy[rank]
         else:
@@ -1,6 +1,6 @@
 import contextlib
 import functools
-from typing import Optional
+from typing import Dict, Optional
 import torch
 import torch.nn as nn
 import torch.distributed as dist
@@ -8,6 +8,7 @@ from colossalai.context.parallel_mode import ParallelMode
 from colossalai.core import global_context as gpc
 from colossalai.context.singleton_meta import SingletonMeta
 from colossalai.logging import get_dist_logger
+from colossalai.zero.init_ctx.lazy_init import LazyInitRecorder
 from colossalai.zero.shard_utils import BaseShardStrategy
 from colossalai.zero.sharded_model._utils import cast_tensor_to_fp16
 from colossalai.zero.sharded_model.sharded_model_v2 import ShardedModelV2
@@ -55,6 +56,11 @@ class ZeroInitContext(InsertPostInitMethodToModuleSubClasses):
         shard_param (bool, optional): Is param sharded after exiting the context. Defaults to False.
         default_dtype (torch.dtype, optional): If it's not None, parameters will be initialized as ``default_dtype`` then converted to fp16.
         model_numel_tensor (torch.Tensor, optional): A tensor which will store the number of elements of model. Defaults to torch.zeros(1, dtype=torch.int).
+        lazy_init (bool, optional): If True, parameters are created on the meta device and the ops initializing them
+            are recorded. When the constructor of a module returns, each rank materializes only the local shard of
+            its parameters, without allocating full parameters. See :class:`LazyInitRecorder` for supported ops.
+            Defaults to False.
+        lazy_init_block_size (int, optional): Number of elements materialized at a time in lazy init. Defaults to 2**20.
     """
 
     def __init__(self,
@@ -63,7 +69,9 @@ class ZeroInitContext(InsertPostInitMethodToModuleSubClasses):
                  seed: int = 2**10 - 1,
                  shard_param: bool = False,
                  default_dtype: Optional[torch.dtype] = None,
-                 model_numel_tensor: torch.Tensor = torch.zeros(1, dtype=torch.long)):
+                 model_numel_tensor: torch.Tensor = torch.zeros(1, dtype=torch.long),
+                 lazy_init: bool = False,
+                 lazy_init_block_size: int = 2**20):
 
         super().__init__(default_dtype=default_dtype)
         self.shard_strategy = shard_strategy
@@ -71,6 +79,8 @@ class ZeroInitContext(InsertPostInitMethodToModuleSubClasses):
         self.model_numel_tensor = model_numel_tensor
         self.seed = seed
         self.dp_process_group = gpc.get_group(ParallelMode.DATA)
+        self.lazy_init = lazy_init
+        self.lazy_init_recorder = LazyInitRecorder(seed, lazy_init_block_size) if lazy_init else None
 
         self.config = ZeroContextConfig(target_device=target_device, replicated=True, shard_param=shard_param)
 
@@ -148,9 +158,15 @@ class ZeroInitContext(InsertPostInitMethodToModuleSubClasses):
         offset = self.seed + 1    # we want to have more 1 in binary format seed
         torch.manual_seed(self.seed + offset * dist.get_rank())
 
+        if self.lazy_init:
+            self.lazy_init_recorder.enable()
+
     def _post_context_exec(self):
         """The callback function when exiting context.
         """
+        if self.lazy_init:
+            self.lazy_init_recorder.disable()
+
         # broadcast replicated no-shard parameters
         src_rank = gpc.get_ranks_in_group(ParallelMode.DATA)[0]
         for param in self.param_list:
@@ -176,12 +192,15 @@ class ZeroInitContext(InsertPostInitMethodToModuleSubClasses):
         def half_fn(t: torch.Tensor):
             return t.half() if t.is_floating_point() else t
 
+        lazy_origin_shapes = self._materialize_lazy_params(module) if self.lazy_init else {}
+
         for param in module.parameters(recurse=False):
             # avoid adapting a param to ShardedParam twice
             if hasattr(param, 'colo_attr'):
                 continue
 
-            self.model_numel_tensor += param.numel()
+            origin_shape = lazy_origin_shapes.get(id(param), param.shape)
+            self.model_numel_tensor += origin_shape.numel()
 
             # convert parameters to half
             param_half = half_fn(param)
@@ -199,7 +218,11 @@ class ZeroInitContext(InsertPostInitMethodToModuleSubClasses):
             param.colo_attr = ShardedParamV2(param, set_data_none=True)
 
             if self.shard_param:
-                self.shard_strategy.shard([param.colo_attr.sharded_data_tensor], self.dp_process_group)
+                if id(param) in lazy_origin_shapes:
+                    # lazily initialized params are materialized as local shards
+                    param.colo_attr.sharded_data_tensor.mark_sharded(origin_shape)
+                else:
+                    self.shard_strategy.shard([param.colo_attr.sharded_data_tensor], self.dp_process_group)
 
             param.data = param.colo_attr.data_payload    # set param.data to payload
 
@@ -219,6 +242,24 @@ class ZeroInitContext(InsertPostInitMethodToModuleSubClasses):
             buffer.data = buffer.data.to(device=torch.cuda.current_device())
             buffer.data = cast_tensor_to_fp16(buffer.data)
 
+    def _materialize_lazy_params(self, module: torch.nn.Module) -> Dict[int, torch.Size]:
+        """Replace meta params of the module with their materialized local shards.
+        Returns the original shapes of the new params, indexed by ``id``.
+        """
+        rank, world_size = 0, 1
+        if self.shard_param:
+            rank, world_size = dist.get_rank(self.dp_process_group), dist.get_world_size(self.dp_process_group)
+        # params which are not replicated, e.g. MoE experts, should be initialized differently on each rank
+        seed_rank = None if self.is_replicated else dist.get_rank(self.dp_process_group)
+        origin_shapes = {}
+        for name, param in module._parameters.items():
+            if param is None or not param.is_meta:
+                continue
+            new_param = self.lazy_init_recorder.materialize(param, rank, world_size, seed_rank=seed_rank)
+            module._parameters[name] = new_param
+            origin_shapes[id(new_param)] = param.shape
+        return origin_shapes
+
 
 class ZeroContextMgr(metaclass=SingletonMeta):
     current_context: Optional[ZeroInitContext] = None
@@ -0,0 +1,220 @@
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+# in-place ops which are recorded on lazily initialized params
+_RANDOM_OPS = ('uniform_', 'normal_')
+_ELEMENTWISE_OPS = _RANDOM_OPS + ('fill_', 'zero_', 'mul_', 'add_', 'sub_', 'div_', 'clamp_', 'erfinv_', 'copy_')
+_RECORDED_OPS = _ELEMENTWISE_OPS + ('__setitem__',)
+# ops after which the previous values of the param don't matter
+_OVERWRITE_OPS = _RANDOM_OPS + ('fill_', 'zero_', 'copy_')
+
+
+def _storage_key(tensor: torch.Tensor) -> int:
+    # `param.data` and views of a meta param are different tensors sharing the storage of the param
+    return tensor.storage()._cdata
+
+
+class _LazyParamRecord(object):
+
+    def __init__(self, param: nn.Parameter, index: int, shape: torch.Size, dtype: torch.dtype,
+                 init_data: torch.Tensor) -> None:
+        self.param_ref = weakref.ref(param)
+        self.index = index
+        self.shape = shape
+        self.numel = shape.numel()
+        self.dtype = dtype
+        # the tensor passed to nn.Parameter, it's released once the param is overwritten
+        self.init_data: Optional[torch.Tensor] = init_data
+        # (op name, (size, stride, storage offset) of the tensor the op is applied on, args, kwargs)
+        self.ops: List[Tuple[str, Tuple, tuple, Dict[str, Any]]] = []
+        # whether the param can be materialized block by block
+        self.elementwise = True
+        # version counter of the param after the last recorded op, other in-place ops on the param bump it
+        self.version = param._version
+        self.has_unrecorded_ops = False
+
+    def sync_version(self) -> None:
+        param = self.param_ref()
+        if param is not None:
+            self.has_unrecorded_ops = self.has_unrecorded_ops or param._version != self.version
+            self.version = param._version
+
+    def add_op(self, name: str, tensor: torch.Tensor, args: tuple, kwargs: Dict[str, Any]) -> None:
+        for arg in list(args) + list(kwargs.values()):
+            if torch.is_tensor(arg) and arg.is_meta:
+                raise RuntimeError(f'Lazy init does not support `{name}` with a meta tensor argument')
+        # lazy init uses its own generators
+        kwargs = {k: v for k, v in kwargs.items() if k != 'generator'}
+        covers_param = tensor.storage_offset() == 0 and tensor.numel() == self.numel and tensor.is_contiguous()
+
+        if covers_param and name in _OVERWRITE_OPS:
+            self.init_data = None
+            self.ops.clear()
+            self.elementwise = True
+        if not covers_param or name not in _ELEMENTWISE_OPS:
+            self.elementwise = False
+        elif name == 'copy_':
+            self.elementwise = self.elementwise and args[0].numel() == self.numel
+        elif any(torch.is_tensor(arg) and arg.numel() > 1 for arg in list(args) + list(kwargs.values())):
+            self.elementwise = False
+        self.ops.append((name, (tensor.size(), tensor.stride(), tensor.storage_offset()), args, kwargs))
+
+
+class LazyInitRecorder(object):
+    """Create params on the meta device and record the in-place ops which initialize them,
+    so that each rank can materialize only its own shard later.
+
+    Floating point params are replaced with meta tensors when they are constructed.
+    The in-place ops in ``_RECORDED_OPS`` applied on them, e.g. by ``torch.nn.init``, are recorded.
+    Other in-place ops on meta params (e.g. ``+=`` or ``out=``) can't be replayed, so materializing such a param
+    raises an error. They are detected by the version counter of the param, which is not shared by ``param.data``,
+    so unrecorded ops on ``param.data`` can't be detected.
+
+    If all recorded ops are elementwise and cover the whole param, the param is materialized in blocks of
+    ``block_size`` elements, and only blocks overlapping the local shard are computed.
+    Each block has its own generator seeded by ``seed``, the index of the param and the index of the block,
+    so the values of a param don't depend on the number of ranks. Params which are not replicated among ranks
+    are given a ``seed_rank``, which is mixed into the seeds as well.
+    Otherwise, e.g. a slice of the param is assigned, the full param is materialized on every rank and sharded.
+
+    Args:
+        seed (int): Random seed for initialization. It must be the same on all ranks.
+        block_size (int, optional): Number of elements in a block. Defaults to 2**20.
+    """
+
+    def __init__(self, seed: int, block_size: int = 2**20) -> None:
+        assert block_size > 0, 'block_size must be positive'
+        self.seed = seed
+        self.block_size = block_size
+        self._records: Dict[int, _LazyParamRecord] = {}
+        # meta param and its materialized param, the meta param is kept alive so that its storage key is not reused
+        self._materialized: Dict[int, Tuple[nn.Parameter, nn.Parameter]] = {}
+        self._num_params = 0
+        self._orig_param_new = None
+        self._orig_tensor_ops: Dict[str, Any] = {}
+
+    def enable(self) -> None:
+        self._orig_param_new = nn.Parameter.__dict__['__new__']
+        orig_new = nn.Parameter.__new__
+
+        def _lazy_new(cls, data=None, requires_grad=True):
+            if data is None or data.is_meta or not data.is_floating_point():
+                return orig_new(cls, data, requires_grad)
+            data = data.detach()
+            param = orig_new(cls, torch.empty_like(data, device='meta'), requires_grad)
+            self._records[_storage_key(param)] = _LazyParamRecord(param, self._num_params, data.shape, data.dtype,
+                                                                  data)
+            self._num_params += 1
+            return param
+
+        nn.Parameter.__new__ = _lazy_new
+
+        for name in _RECORDED_OPS:
+            self._orig_tensor_ops[name] = torch.Tensor.__dict__.get(name)
+            setattr(torch.Tensor, name, self._make_recorded_op(name, getattr(torch.Tensor, name)))
+
+    def disable(self) -> None:
+        nn.Parameter.__new__ = self._orig_param_new
+        for name, op in self._orig_tensor_ops.items():
+            if op is None:
+                delattr(torch.Tensor, name)
+            else:
+                setattr(torch.Tensor, name, op)
+        self._orig_tensor_ops.clear()
+        self._records.clear()
+        self._materialized.clear()
+
+    def _make_recorded_op(self, name: str, op):
+
+        def _recorded_op(tensor: torch.Tensor, *args, **kwargs):
+            record = self._records.get(_storage_key(tensor)) if tensor.is_meta else None
+            if record is None:
+                return op(tensor, *args, **kwargs)
+            record.sync_version()
+            record.add_op(name, tensor, args, kwargs)
+            out = op(tensor, *args, **kwargs)
+            # the recorded op itself bumps the version
+            param = record.param_ref()
+            if param is not None:
+                record.version = param._version
+            return out
+
+        return _recorded_op
+
+    def materialize(self,
+                    param: nn.Parameter,
+                    rank: int,
+                    world_size: int,
+                    seed_rank: Optional[int] = None) -> nn.Parameter:
+        """Materialize the local shard of a lazily initialized param as a new param.
+        The shard is flattened and padded in the same way as :func:`colossalai.zero.shard_utils.commons.get_shard`.
+        If ``world_size`` is 1, the new param has the original shape.
+        If ``seed_rank`` is given, it's mixed into the seeds of random ops, so that params which are not replicated
+        get different values on each rank.
+        """
+        key = _storage_key(param)
+        if key in self._materialized:
+            return self._materialized[key][1]
+        if key not in self._records:
+            raise RuntimeError('The meta param is not created by lazy init, or its data is replaced by a meta tensor')
+        record = self._records.pop(key)
+        record.sync_version()
+        if record.has_unrecorded_ops:
+            raise RuntimeError(f'The lazily initialized param of shape {tuple(record.shape)} is modified by in-place '
+                               f'ops which are not recorded, only {list(_RECORDED_OPS)} are supported')
+        chunk_size = (record.numel + world_size - 1) // world_size
+        start, end = min(rank * chunk_size, record.numel), min((rank + 1) * chunk_size, record.numel)
+
+        with torch.no_grad():
+            shard = torch.zeros(chunk_size, dtype=record.dtype)
+            if record.elementwise:
+                for block_start in range(start - start % self.block_size, end, self.block_size):
+                    block_end = min(block_start + self.block_size, record.numel)
+                    block = self._replay_block(record, block_start, block_end, seed_rank)
+                    lo, hi = max(start, block_start), min(end, block_end)
+                    shard[lo - start:hi - start].copy_(block[lo - block_start:hi - block_start])
+            else:
+                shard[:end - start].copy_(self._replay_full(record, seed_rank).view(-1)[start:end])
+        if world_size == 1:
+            shard = shard.view(record.shape)
+
+        new_param = torch.Tensor._make_subclass(type(param), shard, param.requires_grad)
+        new_param.__dict__.update(param.__dict__)
+        self._materialized[key] = (param, new_param)
+        return new_param
+
+    def _generator(self, index: int, block_idx: int, seed_rank: Optional[int]) -> torch.Generator:
+        # hash of a tuple of ints is the same across processes
+        key = (self.seed, index, block_idx) if seed_rank is None else (self.seed, seed_rank, index, block_idx)
+        return torch.Generator().manual_seed(hash(key) % 2**63)
+
+    def _init_data(self, record: _LazyParamRecord, start: int, end: int) -> torch.Tensor:
+        if record.init_data is None:
+            return torch.zeros(end - start, dtype=record.dtype)
+        return record.init_data.reshape(-1)[start:end].to(device='cpu', dtype=record.dtype, copy=True)
+
+    def _replay_block(self, record: _LazyParamRecord, block_start: int, block_end: int,
+                      seed_rank: Optional[int]) -> torch.Tensor:
+        generator = self._generator(record.index, block_start // self.block_size, seed_rank)
+        block = self._init_data(record, block_start, block_end)
+        for name, _, args, kwargs in record.ops:
+            if name == 'copy_':
+                block.copy_(args[0].reshape(-1)[block_start:block_end])
+            elif name in _RANDOM_OPS:
+                getattr(block, name)(*args, generator=generator, **kwargs)
+            else:
+                getattr(block, name)(*args, **kwargs)
+        return block
+
+    def _replay_full(self, record: _LazyParamRecord, seed_rank: Optional[int]) -> torch.Tensor:
+        generator = self._generator(record.index, -1, seed_rank)
+        full = self._init_data(record, 0, record.numel)
+        for name, view, args, kwargs in record.ops:
+            target = full.as_strided(*view)
+            if name in _RANDOM_OPS:
+                kwargs = dict(kwargs, generator=generator)
+            getattr(target, name)(*args, **kwargs)
+        return full
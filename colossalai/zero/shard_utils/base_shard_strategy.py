@@ -17,5 +17,11 @@ class BaseShardStrategy(ABC):
         pass
 
     @abstractmethod
-    def gather(self, tensor_list: List[ShardedTensor], process_group: Optional[dist.ProcessGroup] = None):
+    def gather(self,
+               tensor_list: List[ShardedTensor],
+               process_group: Optional[dist.ProcessGroup] = None,
+               quantize: bool = False):
+        """Gather sharded tensors. ``quantize`` allows strategies supporting lossy gathers to use them,
+        it should only be set by gathers for computation.
+        """
         pass
@@ -16,7 +16,10 @@ class BucketTensorShardStrategy(TensorShardStrategy):
     since we cannot utilize network bandwidth well if we only gather a bias tensor (bias is usaully small).
     """
 
-    def gather(self, tensor_list: List[ShardedTensor], process_group: Optional[dist.ProcessGroup] = None):
+    def gather(self,
+               tensor_list: List[ShardedTensor],
+               process_group: Optional[dist.ProcessGroup] = None,
+               quantize: bool = False):
 
         tensor_list: List[ShardedTensor] = [t for t in tensor_list if t.is_sharded]
         if len(tensor_list) == 0:
@@ -28,12 +31,15 @@ class BucketTensorShardStrategy(TensorShardStrategy):
         buffer_size = sum(tensor_numels)
         world_size = dist.get_world_size(process_group)
         rank = dist.get_rank(process_group)
-        for i in range(world_size):
-            if i == rank:
-                buffer_list.append(flatten([t.payload for t in tensor_list]).cuda(get_current_device()))
-            else:
-                buffer_list.append(torch.zeros(buffer_size, dtype=dtype, device=get_current_device()))
-        dist.all_gather(buffer_list, buffer_list[rank], group=process_group)
+        if quantize and self.quantized_gather and dtype.is_floating_point:
+            buffer_list = list(self._quantized_all_gather(flatten([t.payload for t in tensor_list]), process_group))
+        else:
+            for i in range(world_size):
+                if i == rank:
+                    buffer_list.append(flatten([t.payload for t in tensor_list]).to(get_current_device()))
+                else:
+                    buffer_list.append(torch.zeros(buffer_size, dtype=dtype, device=get_current_device()))
+            dist.all_gather(buffer_list, buffer_list[rank], group=process_group)
         # Move to target device before splitting buffer
         # Ensure we utilize maximum PCIE bandwidth
         buffer_list = [buffer.to(target_device) for buffer in buffer_list]
@@ -20,3 +20,23 @@ def get_shard(tensor: torch.Tensor, rank: int, world_size: int) -> Tuple[torch.T
     shard_temp.copy_(chunks[rank])
 
     return shard, num_to_pad
+
+
+def quantize_blockwise(tensor: torch.Tensor, block_size: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Quantize the last dimension of a tensor to int8 with an absmax scale per block.
+    The last dimension is padded to a multiple of ``block_size``.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: int8 tensor of shape ``(*tensor.shape[:-1], num_blocks, block_size)``
+        and fp32 scales of shape ``(*tensor.shape[:-1], num_blocks)``.
+    """
+    num_to_pad = -tensor.size(-1) % block_size
+    blocks = F.pad(tensor.float(), [0, num_to_pad]).view(*tensor.shape[:-1], -1, block_size)
+    scales = blocks.abs().amax(dim=-1).div_(127.).clamp_(min=torch.finfo(torch.float).tiny)
+    quantized = blocks.div(scales.unsqueeze(-1)).round_().clamp_(-127, 127).to(torch.int8)
+    return quantized, scales
+
+
+def dequantize_blockwise(quantized: torch.Tensor, scales: torch.Tensor, numel: int) -> torch.Tensor:
+    """Dequantize the output of :func:`quantize_blockwise` to a fp32 tensor whose last dimension is ``numel``."""
+    return quantized.float().mul_(scales.unsqueeze(-1)).flatten(-2)[..., :numel]
@@ -4,7 +4,7 @@ import torch
 import torch.distributed as dist
 from colossalai.utils import get_current_device
 from colossalai.zero.shard_utils import BaseShardStrategy
-from colossalai.zero.shard_utils.commons import get_shard
+from colossalai.zero.shard_utils.commons import dequantize_blockwise, get_shard, quantize_blockwise
 from colossalai.zero.sharded_param.sharded_tensor import ShardedTensor
 from colossalai.gemini.tensor_utils import colo_model_data_tensor_move_inline
 
@@ -12,15 +12,33 @@ from colossalai.gemini.tensor_utils import colo_model_data_tensor_move_inline
 class TensorShardStrategy(BaseShardStrategy):
     """
     A naive implementation which shard each tensor evenly over all ranks
+
+    Args:
+        quantized_gather (bool, optional): Whether to quantize shards to int8 with a scale per block before
+            all-gather, which halves the gather volume of fp16 payloads. Gathered payloads are approximate,
+            but the local shard is kept exact, so that sharding a gathered tensor restores the original shard.
+            Only gathers called with ``quantize=True``, i.e. the gathers for forward and backward computation,
+            are quantized. Other gathers, e.g. for state dicts, are exact. Defaults to False.
+        quantize_block_size (int, optional): Number of elements sharing a scale in quantized gather.
+            Defaults to 256.
     """
 
+    def __init__(self, quantized_gather: bool = False, quantize_block_size: int = 256) -> None:
+        super().__init__()
+        assert quantize_block_size > 0, 'quantize_block_size must be positive'
+        self.quantized_gather = quantized_gather
+        self.quantize_block_size = quantize_block_size
+
     def shard(self, tensor_list: List[ShardedTensor], process_group: Optional[dist.ProcessGroup] = None):
         for t in tensor_list:
             self._shard_tensor(t, process_group)
 
-    def gather(self, tensor_list: List[ShardedTensor], process_group: Optional[dist.ProcessGroup] = None):
+    def gather(self,
+               tensor_list: List[ShardedTensor],
+               process_group: Optional[dist.ProcessGroup] = None,
+               quantize: bool = False):
         for t in tensor_list:
-            self._gather_tensor(t, process_group)
+            self._gather_tensor(t, process_group, quantize)
 
     def _shard_tensor(self, t: ShardedTensor, process_group: Optional[dist.ProcessGroup] = None):
         """ Shard tensor among processes.
@@ -39,7 +57,10 @@ class TensorShardStrategy(BaseShardStrategy):
         t.payload_reset(sharded_payload)
         t.is_sharded = True
 
-    def _gather_tensor(self, t: ShardedTensor, process_group: Optional[dist.ProcessGroup] = None):
+    def _gather_tensor(self,
+                       t: ShardedTensor,
+                       process_group: Optional[dist.ProcessGroup] = None,
+                       quantize: bool = False):
         if not t.is_sharded:
             return
         target_device = t.device
@@ -47,12 +68,35 @@ class TensorShardStrategy(BaseShardStrategy):
         world_size = dist.get_world_size(process_group)
         rank = dist.get_rank(process_group)
 
-        buffer = torch.empty(payload_numel * world_size, dtype=t.payload.dtype, device=get_current_device())
-        buffer_list = list(torch.chunk(buffer, chunks=world_size, dim=0))
-        buffer_list[rank].copy_(t.payload)
+        if quantize and self.quantized_gather and t.payload.is_floating_point():
+            buffer = self._quantized_all_gather(t.payload, process_group).flatten()
+        else:
+            buffer = torch.empty(payload_numel * world_size, dtype=t.payload.dtype, device=get_current_device())
+            buffer_list = list(torch.chunk(buffer, chunks=world_size, dim=0))
+            buffer_list[rank].copy_(t.payload)
 
-        dist.all_gather(buffer_list, buffer_list[rank], group=process_group, async_op=False)
+            dist.all_gather(buffer_list, buffer_list[rank], group=process_group, async_op=False)
         gathered_payload = torch.narrow(buffer, 0, 0, t.origin_numel).reshape(t.origin_shape)
         t.payload_reset(gathered_payload)
         colo_model_data_tensor_move_inline(t, target_device)
         t.is_sharded = False
+
+    def _quantized_all_gather(self, payload: torch.Tensor, process_group: Optional[dist.ProcessGroup] = None):
+        """All-gather int8 quantized shards and scales, and dequantize them.
+
+        Returns:
+            torch.Tensor: gathered shards of shape ``(world_size, payload.numel())`` on the current device.
+        """
+        world_size = dist.get_world_size(process_group)
+        rank = dist.get_rank(process_group)
+        payload = payload.flatten().to(get_current_device())
+        quantized, scales = quantize_blockwise(payload, self.quantize_block_size)
+        quantized_list = [torch.empty_like(quantized) for _ in range(world_size)]
+        scales_list = [torch.empty_like(scales) for _ in range(world_size)]
+        dist.all_gather(quantized_list, quantized, group=process_group)
+        dist.all_gather(scales_list, scales, group=process_group)
+        gathered = dequantize_blockwise(torch.stack(quantized_list), torch.stack(scales_list), payload.numel())
+        gathered = gathered.to(payload.dtype)
+        # the local shard is exact
+        gathered[rank].copy_(payload)
+        return gathered
@@ -9,6 +9,7 @@ from typing import Callable, Dict, List, Optional, Tuple
 
 import torch
 import torch.distributed as dist
+from colossalai.zero.shard_utils.commons import dequantize_blockwise, quantize_blockwise
 from torch import Tensor
 from torch.distributed import ProcessGroup
 
@@ -19,6 +20,42 @@ else:
     enable_nccl_base_collectives = True
 
 
+def _reduce_scatter_base(output: Tensor, input_flattened: Tensor, group: ProcessGroup) -> None:
+    """Reduce-scatter a flattened input, which holds ``group.size()`` chunks, into ``output``."""
+    if dist.get_backend(group) == dist.Backend.GLOO:
+        # gloo doesn't support reduce-scatter, so we all-reduce the whole input and take the local chunk
+        reduced = input_flattened.clone()
+        dist.all_reduce(reduced, group=group)
+        output.copy_(reduced.view(group.size(), -1)[dist.get_rank(group)].view_as(output))
+    elif hasattr(dist, "_reduce_scatter_base") and enable_nccl_base_collectives:
+        dist._reduce_scatter_base(output, input_flattened, group=group)
+    else:
+        dist.reduce_scatter(output, list(input_flattened.view(group.size(), -1).unbind(0)), group=group)
+
+
+def _compressed_reduce_scatter_base(output: Tensor, input_flattened: Tensor, group: ProcessGroup,
+                                    block_size: int) -> Tensor:
+    """Reduce-scatter a flattened input, which holds ``group.size()`` chunks, into ``output`` with int8 payloads.
+    Each chunk is quantized with a scale per block and sent to its owner by all-to-all.
+    The owner dequantizes received chunks and sums them in fp32, so the reduction itself never overflows.
+
+    Returns:
+        Tensor: the quantization error of the input, which has the same shape as the input.
+    """
+    world_size = group.size()
+    input_2d = input_flattened.view(world_size, -1)
+    chunk_numel = input_2d.size(1)
+    quantized, scales = quantize_blockwise(input_2d, block_size)
+    recv_quantized = torch.empty_like(quantized)
+    recv_scales = torch.empty_like(scales)
+    dist.all_to_all_single(recv_quantized, quantized, group=group)
+    dist.all_to_all_single(recv_scales, scales, group=group)
+    output.copy_(dequantize_blockwise(recv_quantized, recv_scales, chunk_numel).sum(dim=0).view_as(output))
+    error = input_2d.float() - dequantize_blockwise(quantized, scales, chunk_numel)
+    # inf or nan gradients will be skipped by the optimizer, don't feed them back
+    return torch.nan_to_num_(error, nan=0., posinf=0., neginf=0.).view_as(input_flattened)
+
+
 class Bucket:
     def __init__(self, shard_size: int, dtype: torch.dtype, device: torch.device, group: ProcessGroup):
         self.buffer = torch.zeros((group.size(), shard_size), dtype=dtype, device=device)
@@ -33,14 +70,7 @@ class Bucket:
             assert len(self.callbacks) == 0
             return
         # reduce-scatter bucket
-        if hasattr(dist, "_reduce_scatter_base") and enable_nccl_base_collectives:
-            dist._reduce_scatter_base(
-                self.output_shard[: self.offset], self.buffer[:, : self.offset].contiguous(), group=self.group
-            )
-        else:
-            dist.reduce_scatter(
-                self.output_shard[: self.offset], list(self.buffer[:, : self.offset].unbind(0)), group=self.group
-            )
+        self._reduce_scatter()
         # execute post-reduction callbacks
         for callback_fn in self.callbacks:
             callback_fn()
@@ -50,6 +80,9 @@ class Bucket:
         self.callbacks.clear()
         self.output_shard = torch.zeros_like(self.buffer[0])
 
+    def _reduce_scatter(self) -> None:
+        _reduce_scatter_base(self.output_shard[: self.offset], self.buffer[:, : self.offset].contiguous(), self.group)
+
     def alloc(self) -> None:
         """Setup the buffers if they are not allocated.
 
@@ -82,6 +115,35 @@ class Bucket:
             self.callbacks.append(functools.partial(callback_fn, result_view))
 
 
+class CompressedBucket(Bucket):
+    """A bucket which reduce-scatters its content with int8 payloads.
+    The quantization error of each appended tensor is written back to its residual,
+    which is added to the input of the next reduction (error feedback).
+    """
+
+    def __init__(self, shard_size: int, dtype: torch.dtype, device: torch.device, group: ProcessGroup,
+                 block_size: int):
+        super().__init__(shard_size, dtype, device, group)
+        self.block_size = block_size
+        self.residuals: List[Tuple[int, int, Tensor]] = []
+
+    def _reduce_scatter(self) -> None:
+        error = _compressed_reduce_scatter_base(self.output_shard[: self.offset],
+                                                self.buffer[:, : self.offset].contiguous(), self.group,
+                                                self.block_size)
+        for offset, size, residual in self.residuals:
+            residual.copy_(error[:, offset: offset + size])
+        self.residuals.clear()
+
+    def append(self, tensor_list: List[Tensor], callback_fn: Callable, residual: Optional[Tensor] = None):
+        offset = self.offset
+        super().append(tensor_list, callback_fn)
+        if residual is not None:
+            tensor_size = tensor_list[0].numel()
+            self.buffer[:, offset: offset + tensor_size].add_(residual)
+            self.residuals.append((offset, tensor_size, residual))
+
+
 class ReduceScatterBucketer:
     """
     Helper for bucketing multiple reduce-scatter operations on small tensors
@@ -153,12 +215,8 @@ class ReduceScatterBucketer:
             # TODO: investigate how to avoid using torch.cat (because it seems to be slow for CPU tensors)
             # input is too big to fit in the bucket, reduce-scatter directly
             output = torch.zeros_like(input_list[0])
-            if hasattr(dist, "_reduce_scatter_base") and enable_nccl_base_collectives:
-                input_flattened = torch.cat(input_list)
-                dist._reduce_scatter_base(output, input_flattened, group=group)
-            else:
-                # fallback
-                dist.reduce_scatter(output, input_list, group=group)
+            input_flattened = torch.cat([t.view(-1) for t in input_list])
+            _reduce_scatter_base(output, input_flattened, group)
             if callback_fn is not None:
                 callback_fn(output)
             return
@@ -169,11 +227,56 @@ class ReduceScatterBucketer:
             bucket.flush()
         bucket.append(input_list, callback_fn)
 
+    @torch.no_grad()
+    def hierarchical_reduce_scatter_async(
+        self,
+        input_list: List[Tensor],
+        intra_node_group: ProcessGroup,
+        inter_node_group: ProcessGroup,
+        callback_fn: Optional[Callable] = None,
+    ) -> None:
+        """
+        Reduce-scatter a list of tensors in two levels. Tensors are reduce-scattered within the node first,
+        then reduce-scattered across nodes among ranks with the same local index.
+        The result is the same as a flat reduce-scatter over ``intra_node_group.size() * inter_node_group.size()``
+        ranks, where the rank is ``node_index * intra_node_group.size() + local_index``.
+        Only ``1 / intra_node_group.size()`` of the gradient volume goes through the inter-node links.
+
+        Args:
+            input_list (List[Tensor]): list of tensors to reduce-scatter. List should contain
+                ``intra_node_group.size() * inter_node_group.size()`` tensors with identical shape, dtype and device.
+            intra_node_group (ProcessGroup): process group of ranks in the same node
+            inter_node_group (ProcessGroup): process group of ranks with the same local index on different nodes
+            callback_fn (Callable, Optional): callback function to call after the reduction executes.
+        """
+        intra_node_size = intra_node_group.size()
+        inter_node_size = inter_node_group.size()
+        assert len(input_list) == intra_node_size * inter_node_size, \
+            f"reduce_scatter received {len(input_list)} inputs, expected {intra_node_size * inter_node_size}"
+
+        # the local rank `i` in the node reduces chunks `i, i + intra_node_size, i + 2 * intra_node_size, ...`
+        # which are owned by ranks with local index `i` on each node
+        intra_node_input_list = [
+            torch.cat([input_list[node * intra_node_size + i].view(-1) for node in range(inter_node_size)])
+            for i in range(intra_node_size)
+        ]
+
+        def _inter_node_reduce_scatter(partial_reduced: Tensor) -> None:
+            inter_node_input_list = [
+                chunk.view_as(input_list[0]) for chunk in partial_reduced.view(-1).chunk(inter_node_size)
+            ]
+            self.reduce_scatter_async(inter_node_input_list, group=inter_node_group, callback_fn=callback_fn)
+
+        self.reduce_scatter_async(intra_node_input_list, group=intra_node_group, callback_fn=_inter_node_reduce_scatter)
+
     @torch.no_grad()
     def flush(self) -> None:
         """Reduce-scatter any partial buckets."""
-        for bucket in self.buckets.values():
-            bucket.flush()
+        # callbacks may append tensors to other buckets, e.g. in hierarchical reduce-scatter
+        # so we flush until all buckets are empty
+        while any(bucket.offset > 0 for bucket in self.buckets.values()):
+            for bucket in list(self.buckets.values()):
+                bucket.flush()
 
     @torch.no_grad()
     def free(self) -> None:
@@ -189,12 +292,87 @@ class ReduceScatterBucketer:
         bucket_size = self.bucket_size_mb * MB / element_size
         return int(bucket_size // num_shards)
 
+    def _create_bucket(self, shard_size: int, dtype: torch.dtype, device: torch.device, group: ProcessGroup) -> Bucket:
+        return Bucket(shard_size, dtype, device, group)
+
     def _get_bucket(self, tensor: Tensor, group: ProcessGroup) -> Bucket:
         key = (tensor.dtype, tensor.device, group)
         if key not in self.buckets:
             # buckets are divided into world_size pieces, bucket.data shaped (world_size, shard_size)
             world_size = group.size()
             shard_size = self._get_shard_size(tensor.element_size(), world_size)
-            self.buckets[key] = Bucket(shard_size, tensor.dtype, tensor.device, group)
+            self.buckets[key] = self._create_bucket(shard_size, tensor.dtype, tensor.device, group)
         self.buckets[key].alloc()
         return self.buckets[key]
+
+
+class CompressedReduceScatterBucketer(ReduceScatterBucketer):
+    """
+    A ``ReduceScatterBucketer`` which quantizes buckets to int8 with a scale per block before communication.
+    It cuts gradient traffic by about 4x compared with fp32 and 2x compared with fp16.
+    The reduction is done by all-to-all followed by local dequantize-and-sum in fp32.
+
+    If a residual is given with the input, the quantization error is written back to it,
+    and it's added to the input of the next reduction (error feedback).
+
+    Args:
+        bucket_size_mb (int, Optional): bucket size for communicating. Buckets
+            are sub-divided based on world_size. Values <= 0 disable bucketing.
+        block_size (int, Optional): number of elements sharing a scale. Defaults to 2048.
+    """
+
+    def __init__(self, bucket_size_mb: int = 25, block_size: int = 2048):
+        super().__init__(bucket_size_mb)
+        self.block_size = block_size
+
+    @torch.no_grad()
+    def reduce_scatter_async(
+        self,
+        input_list: List[Tensor],
+        group: ProcessGroup,
+        callback_fn: Optional[Callable] = None,
+        residual: Optional[Tensor] = None,
+    ) -> None:
+        """
+        Reduce-scatter a list of tensors asynchronously with int8 payloads.
+        See ``ReduceScatterBucketer.reduce_scatter_async``.
+
+        Args:
+            input_list (List[Tensor]): list of tensors to reduce-scatter.
+            group (ProcessGroup): process group for reduction
+            callback_fn (Callable, Optional): callback function to call after
+                the reduction executes.
+            residual (Tensor, Optional): quantization error of the last reduction,
+                shaped (world_size, tensor numel). It's updated in place.
+        """
+        world_size = group.size()
+
+        assert (
+            len(input_list) == world_size
+        ), f"reduce_scatter received {len(input_list)} inputs, expected group.size() ({world_size})"
+
+        first_input = input_list[0]
+        first_input_size = first_input.numel()
+
+        bucket_shard_size = self._get_shard_size(first_input.element_size(), world_size)
+        if first_input_size > bucket_shard_size:
+            # input is too big to fit in the bucket, reduce-scatter directly
+            output = torch.zeros_like(first_input)
+            input_2d = torch.stack(input_list).view(world_size, first_input_size)
+            if residual is not None:
+                input_2d = input_2d + residual
+            error = _compressed_reduce_scatter_base(output, input_2d.view(-1), group, self.block_size)
+            if residual is not None:
+                residual.copy_(error.view_as(residual))
+            if callback_fn is not None:
+                callback_fn(output)
+            return
+
+        bucket = self._get_bucket(first_input, group)
+        if first_input_size > bucket.buffer.size(1) - bucket.offset:
+            # not enough space remaining in bucket, flush it now
+            bucket.flush()
+        bucket.append(input_list, callback_fn, residual)
+
+    def _create_bucket(self, shard_size: int, dtype: torch.dtype, device: torch.device, group: ProcessGroup) -> Bucket:
+        return CompressedBucket(shard_size, dtype, device, group, self.block_size)
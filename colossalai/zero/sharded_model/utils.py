@@ -1,8 +1,14 @@
+import json
+import os
+
 import torch
 from colossalai.zero.sharded_model import ShardedModelV2
 
 import copy
 
+STATE_DICT_INDEX_NAME = 'state_dict_index.json'
+STATE_DICT_FILE_NAME = 'state_dict_{:05d}.bin'
+
 
 def col_model_deepcopy(sharded_model: ShardedModelV2, other_model: torch.nn.Module):
     """
@@ -17,3 +23,74 @@ def col_model_deepcopy(sharded_model: ShardedModelV2, other_model: torch.nn.Modu
         param.data = copy.deepcopy(zero_param.colo_attr.data_payload)
         if shard_flag:
             sharded_model.shard_strategy.shard([zero_param.colo_attr.sharded_data_tensor])
+
+
+def save_state_dict_streaming(sharded_model: ShardedModelV2,
+                              checkpoint_dir: str,
+                              max_file_size_mb: int = 1024,
+                              save_rank: int = 0) -> None:
+    """
+    Export the full state dict of ShardedModelV2 without materializing the whole model.
+    Modules are gathered one by one, and their states are written to files of at most ``max_file_size_mb``.
+    An index file which maps keys to files is written as well.
+    All ranks in the data parallel group must call this function, but only ``save_rank`` writes files.
+
+    Args:
+        sharded_model (ShardedModelV2): The model to save.
+        checkpoint_dir (str): The directory to save files.
+        max_file_size_mb (int, optional): Max size of each file in *MB*. Defaults to 1024.
+        save_rank (int, optional): The rank in data parallel group which writes files. Defaults to 0.
+    """
+    should_save = sharded_model.rank == save_rank
+    if should_save:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    max_file_size = max_file_size_mb * 1024**2
+    weight_map = {}
+    buffer, buffer_size, file_idx = {}, 0, 0
+
+    def _flush():
+        nonlocal buffer, buffer_size, file_idx
+        if len(buffer) == 0:
+            return
+        file_name = STATE_DICT_FILE_NAME.format(file_idx)
+        torch.save(buffer, os.path.join(checkpoint_dir, file_name))
+        for key in buffer:
+            weight_map[key] = file_name
+        buffer, buffer_size, file_idx = {}, 0, file_idx + 1
+
+    for module_state in sharded_model.state_dict_iter(to_cpu=True):
+        if not should_save:
+            continue
+        for key, val in module_state.items():
+            buffer[key] = val
+            if torch.is_tensor(val):
+                buffer_size += val.numel() * val.element_size()
+        if buffer_size >= max_file_size:
+            _flush()
+
+    if should_save:
+        _flush()
+        with open(os.path.join(checkpoint_dir, STATE_DICT_INDEX_NAME), 'w') as f:
+            json.dump({'weight_map': weight_map}, f, indent=2)
+
+
+def load_state_dict_streaming(sharded_model: ShardedModelV2, checkpoint_dir: str, strict: bool = True) -> None:
+    """
+    Load a state dict saved by :func:`save_state_dict_streaming` file by file,
+    so at most one file is held in memory at the same time.
+
+    Args:
+        sharded_model (ShardedModelV2): The model to load.
+        checkpoint_dir (str): The directory of saved files.
+        strict (bool, optional): Whether to check that all parameters are loaded. Defaults to True.
+    """
+    with open(os.path.join(checkpoint_dir, STATE_DICT_INDEX_NAME)) as f:
+        weight_map = json.load(f)['weight_map']
+    if strict:
+        missing_keys = [name for name, _ in sharded_model.named_parameters() if name not in weight_map]
+        if len(missing_keys) > 0:
+            raise RuntimeError(f'Missing key(s) in state_dict: {", ".join(missing_keys)}')
+    for file_name in sorted(set(weight_map.values())):
+        state_dict = torch.load(os.path.join(checkpoint_dir, file_name), map_location='cpu')
+        sharded_model.load_state_dict(state_dict, strict=False)
+        del state_dict
@@ -251,3 +251,46 @@ def sync_param(flat_tensor, tensor_list):
     # update the tensor data
     for p, q in zip(tensor_list, updated_params):
         p.data = q.data
+
+
+def knapsack(weights, values, capacity, num_units=1024):
+    """
+    Solve the 0/1 knapsack problem approximately by dynamic programming over ``num_units`` units of capacity.
+    Weights are rounded up to whole units, so the selected items always fit in the capacity.
+
+    :param weights: Weights of items
+    :param values: Values of items
+    :param capacity: Capacity of the knapsack
+    :param num_units: Number of units the capacity is divided into, which controls the precision and the cost
+    :type weights: List[int]
+    :type values: List[float]
+    :type capacity: float
+    :type num_units: int
+
+    :return: Indices of selected items in ascending order
+    :rtype: List[int]
+    """
+    if capacity <= 0:
+        return [i for i, w in enumerate(weights) if w == 0]
+    unit = max(1, math.ceil(capacity / num_units))
+    num_capacity_units = int(capacity // unit)
+    unit_weights = [math.ceil(w / unit) for w in weights]
+
+    # best[c] is the max value with c units of capacity
+    best = torch.zeros(num_capacity_units + 1, dtype=torch.double)
+    taken = torch.zeros(len(weights), num_capacity_units + 1, dtype=torch.bool)
+    for i, (w, v) in enumerate(zip(unit_weights, values)):
+        if w > num_capacity_units:
+            continue
+        candidate = best[:num_capacity_units + 1 - w] + v
+        take = candidate > best[w:]
+        taken[i, w:] = take
+        best[w:] = torch.where(take, candidate, best[w:])
+
+    selected = []
+    c = num_capacity_units
+    for i in reversed(range(len(weights))):
+        if taken[i, c]:
+            selected.append(i)
+            c -= unit_weights[i]
+    return sorted(selected)
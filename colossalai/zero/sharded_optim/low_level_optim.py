@@ -0,0 +1,305 @@
+from typing import Dict, List
+
+import torch
+import torch.distributed as dist
+from colossalai.amp.naive_amp.grad_scaler import DynamicGradScaler
+from colossalai.context.parallel_mode import ParallelMode
+from colossalai.core import global_context as gpc
+from colossalai.logging import get_dist_logger
+from colossalai.nn.optimizer import ColossalaiOptimizer
+from colossalai.utils import get_current_device
+from torch import Tensor
+from torch.nn.parameter import Parameter
+from torch.optim import Optimizer
+
+from ._utils import (compute_norm, flatten, get_grad_accumulate_object, has_inf_or_nan, reduce_tensor,
+                     release_param_grad, sync_param, unflatten)
+
+
+class LowLevelZeroOptimizer(ColossalaiOptimizer):
+    """A wrapper for optimizer, which implements ZeRO stage 1 and stage 2 for replicated fp16 models.
+
+    Params of each param group are partitioned among ranks of the data parallel group by their numbers of elements.
+    Params owned by the same rank are flattened into a contiguous buffer and params become views of it.
+    Each rank keeps a flat fp32 master copy of its own partition, and the inner optimizer only updates it.
+    After the step, each rank broadcasts its updated partition, so fp16 params are replicated again.
+
+    Gradients are flattened into buckets and reduced to the ranks owning them.
+    In stage 1, gradients are kept on all ranks during backward and reduced in ``step()``,
+    so gradient accumulation needs no extra communication.
+    In stage 2 (``partition_grad=True``), gradients are reduced in buckets during backward,
+    and gradients which are not owned by this rank are freed after reduction.
+
+    Note:
+        Call ``backward()`` of this optimizer instead of ``loss.backward()``, since the loss is scaled there.
+
+    Args:
+        optimizer (Optimizer): An Optimizer instance, whose params are fp16 (or fp32) params of the model.
+        initial_scale (float, optional): Initial scale used by DynamicGradScaler. Defaults to 2**16.
+        min_scale (float, optional): Min scale used by DynamicGradScaler. Defaults to 1.
+        growth_factor (float, optional): growth_factor used by DynamicGradScaler. Defaults to 2.
+        backoff_factor (float, optional): backoff_factor used by DynamicGradScaler. Defaults to 0.5.
+        growth_interval (int, optional): growth_interval used by DynamicGradScaler. Defaults to 1000.
+        hysteresis (int, optional): hysteresis used by DynamicGradScaler. Defaults to 2.
+        max_scale (float, optional): max_scale used by DynamicGradScaler. Defaults to 2**32.
+        clip_grad_norm (float, optional): Max norm of gradients, gradients are not clipped if it is 0.
+            Defaults to 0.0.
+        reduce_bucket_size (int, optional): Max number of elements of a gradient bucket. Defaults to 2**24.
+        partition_grad (bool, optional): Whether to partition gradients, i.e. use ZeRO stage 2. Defaults to False.
+        dp_parallel_mode (ParallelMode, optional): Parallel mode of data parallelism. Defaults to ParallelMode.DATA.
+        mp_parallel_mode (ParallelMode, optional): Parallel mode of model parallelism. Defaults to ParallelMode.MODEL.
+        verbose (bool, optional): Whether to print partition information. Defaults to False.
+    """
+
+    def __init__(self,
+                 optimizer: Optimizer,
+                 initial_scale: float = 2**16,
+                 min_scale: float = 1,
+                 growth_factor: float = 2,
+                 backoff_factor: float = 0.5,
+                 growth_interval: int = 1000,
+                 hysteresis: int = 2,
+                 max_scale: float = 2**32,
+                 clip_grad_norm: float = 0.0,
+                 reduce_bucket_size: int = 2**24,
+                 partition_grad: bool = False,
+                 dp_parallel_mode: ParallelMode = ParallelMode.DATA,
+                 mp_parallel_mode: ParallelMode = ParallelMode.MODEL,
+                 verbose: bool = False) -> None:
+        super().__init__(optimizer)
+        self._logger = get_dist_logger("LowLevelZeroOptimizer")
+        self._verbose = verbose
+        self._clip_grad_norm = clip_grad_norm
+        self._reduce_bucket_size = reduce_bucket_size
+        self._partition_grad = partition_grad
+
+        self._dp_parallel_mode = dp_parallel_mode
+        self._dp_group = gpc.get_group(dp_parallel_mode)
+        self._dp_ranks = gpc.get_ranks_in_group(dp_parallel_mode)
+        self._local_rank = gpc.get_local_rank(dp_parallel_mode)
+        self._world_size = gpc.get_world_size(dp_parallel_mode)
+        if gpc.is_initialized(mp_parallel_mode) and gpc.get_world_size(mp_parallel_mode) > 1:
+            self._mp_group = gpc.get_group(mp_parallel_mode)
+        else:
+            self._mp_group = None
+
+        self.grad_scaler = DynamicGradScaler(initial_scale=initial_scale,
+                                             min_scale=min_scale,
+                                             growth_factor=growth_factor,
+                                             backoff_factor=backoff_factor,
+                                             growth_interval=growth_interval,
+                                             hysteresis=hysteresis,
+                                             max_scale=max_scale)
+        self._found_overflow = torch.zeros(1, dtype=torch.float, device=get_current_device())
+
+        # the rank owning each param
+        self._param_owner: Dict[Parameter, int] = {}
+        # params of each param group owned by each rank
+        self._fp16_param_groups: List[List[List[Parameter]]] = []
+        # flat buffers of params of each param group owned by each rank
+        self._fp16_flat_params: List[List[Tensor]] = []
+        # flat fp32 master params of each param group owned by this rank
+        self._fp32_flat_params: List[Tensor] = []
+        # reduced gradients of params owned by this rank
+        self._reduced_grads: Dict[Parameter, Tensor] = {}
+        self._partition_params()
+
+        # stage 2 reduces gradients in buckets as soon as they are accumulated
+        self._bucket: List[Parameter] = []
+        self._bucket_numel = 0
+        self._grad_acc_objs = []
+        if self._partition_grad:
+            self._register_grad_hooks()
+
+    @property
+    def loss_scale(self) -> float:
+        return self.grad_scaler.scale.item()
+
+    def _partition_params(self):
+        for group_id, param_group in enumerate(self.optim.param_groups):
+            params = [p for p in param_group['params'] if p.requires_grad]
+
+            # assign params to the rank with the least elements, larger params first
+            rank_params = [[] for _ in range(self._world_size)]
+            rank_numels = [0] * self._world_size
+            for p in sorted(params, key=lambda p: p.numel(), reverse=True):
+                rank = rank_numels.index(min(rank_numels))
+                rank_params[rank].append(p)
+                rank_numels[rank] += p.numel()
+                self._param_owner[p] = rank
+            # keep the original order within a partition
+            order = {p: i for i, p in enumerate(params)}
+            rank_params = [sorted(ps, key=order.__getitem__) for ps in rank_params]
+
+            flat_params = []
+            for ps in rank_params:
+                if len(ps) > 0:
+                    flat = flatten([p.data for p in ps])
+                    # params become views of the flat buffer, so the buffer is updated and broadcast in one piece
+                    sync_param(flat, ps)
+                elif len(params) > 0:
+                    flat = torch.empty(0, dtype=params[0].dtype, device=params[0].device)
+                else:
+                    flat = torch.empty(0, device=get_current_device())
+                flat_params.append(flat)
+            self._fp16_param_groups.append(rank_params)
+            self._fp16_flat_params.append(flat_params)
+
+            fp32_flat = flat_params[self._local_rank].detach().to(dtype=torch.float, copy=True)
+            fp32_flat.requires_grad = True
+            self._fp32_flat_params.append(fp32_flat)
+            param_group['params'] = [fp32_flat]
+
+            if self._verbose:
+                self._logger.info(f'param group {group_id}: number of elements of each rank: {rank_numels}',
+                                  ranks=[0])
+
+    def _register_grad_hooks(self):
+        for rank_params in self._fp16_param_groups:
+            for ps in rank_params:
+                for p in ps:
+                    # the hook is called after the gradient is accumulated into p.grad
+                    grad_acc = get_grad_accumulate_object(p)
+                    grad_acc.register_hook(self._make_grad_hook(p))
+                    # keep grad accumulators alive, otherwise hooks may be lost
+                    self._grad_acc_objs.append(grad_acc)
+
+    def _make_grad_hook(self, param: Parameter):
+
+        def _grad_hook(*args):
+            self._add_to_bucket(param)
+
+        return _grad_hook
+
+    def _add_to_bucket(self, param: Parameter):
+        if param.grad is None:
+            return
+        if self._bucket_numel + param.numel() > self._reduce_bucket_size:
+            self._reduce_bucket()
+        self._bucket.append(param)
+        self._bucket_numel += param.numel()
+
+    def _reduce_bucket(self):
+        if len(self._bucket) > 0:
+            self._reduce_grads(self._bucket)
+        self._bucket = []
+        self._bucket_numel = 0
+
+    def _reduce_grads(self, params: List[Parameter]):
+        """Reduce gradients of params to their owners, and release gradients.
+        Reduced gradients are accumulated into ``self._reduced_grads`` on the owners.
+        """
+        owner_params: Dict[int, List[Parameter]] = {}
+        for p in params:
+            owner_params.setdefault(self._param_owner[p], []).append(p)
+
+        for owner, ps in sorted(owner_params.items()):
+            grads = [p.grad for p in ps]
+            flat_grad = flatten(grads)
+            if self._world_size > 1:
+                reduce_tensor(flat_grad, flat_grad.dtype, dst_rank=owner, parallel_mode=self._dp_parallel_mode)
+            if owner == self._local_rank:
+                for p, reduced_grad in zip(ps, unflatten(flat_grad, grads)):
+                    if p in self._reduced_grads:
+                        self._reduced_grads[p].add_(reduced_grad)
+                    else:
+                        self._reduced_grads[p] = reduced_grad.clone()
+            release_param_grad(ps)
+
+    def backward(self, loss: Tensor) -> None:
+        loss = self.loss_scale * loss
+        loss.backward()
+        if self._partition_grad:
+            self._reduce_bucket()
+
+    def backward_by_grad(self, tensor: Tensor, grad: Tensor) -> None:
+        torch.autograd.backward(tensors=tensor, grad_tensors=grad)
+        if self._partition_grad:
+            self._reduce_bucket()
+
+    def sync_grad(self) -> None:
+        """Reduce gradients which are not reduced yet. It's called in ``step()``.
+        """
+        self._reduce_bucket()
+        params = []
+        for rank_params in self._fp16_param_groups:
+            for ps in rank_params:
+                params.extend(p for p in ps if p.grad is not None)
+        # reduce in buckets of at most reduce_bucket_size elements
+        for p in params:
+            self._add_to_bucket(p)
+        self._reduce_bucket()
+
+    def zero_grad(self, set_to_none: bool = True) -> None:
+        """Release all gradients. Gradients are always set to None, as they are reduced into separate buffers.
+        """
+        for rank_params in self._fp16_param_groups:
+            for ps in rank_params:
+                release_param_grad(ps)
+        self._reduced_grads.clear()
+        self._bucket = []
+        self._bucket_numel = 0
+        for fp32_flat in self._fp32_flat_params:
+            fp32_flat.grad = None
+
+    def _check_overflow(self) -> bool:
+        self._found_overflow.fill_(0.0)
+        for grad in self._reduced_grads.values():
+            if has_inf_or_nan(grad):
+                self._found_overflow.fill_(1.0)
+                break
+        if self._world_size > 1:
+            dist.all_reduce(self._found_overflow, op=dist.ReduceOp.MAX, group=self._dp_group)
+        if self._mp_group is not None:
+            dist.all_reduce(self._found_overflow, op=dist.ReduceOp.MAX, group=self._mp_group)
+        return self._found_overflow.item() > 0
+
+    def step(self, closure=None):
+        assert closure is None, 'closure is not supported by step()'
+        self.sync_grad()
+
+        found_inf = self._check_overflow()
+        self.grad_scaler.update(found_inf)
+        if found_inf:
+            self._logger.warning('found inf during LowLevelZeroOptimizer step')
+            self.zero_grad()
+            return
+
+        # gather reduced gradients of owned params into flat fp32 gradients
+        owned_params = []
+        for group_id, rank_params in enumerate(self._fp16_param_groups):
+            ps = rank_params[self._local_rank]
+            owned_params.extend(ps)
+            fp32_flat = self._fp32_flat_params[group_id]
+            grads = [self._reduced_grads[p] if p in self._reduced_grads else torch.zeros_like(p) for p in ps]
+            fp32_flat.grad = flatten(grads).float() if len(grads) > 0 else torch.zeros_like(fp32_flat)
+        self._reduced_grads.clear()
+
+        self._unscale_and_clip_grads(owned_params)
+        ret = self.optim.step()
+
+        # copy updated master params back to fp16 params, and broadcast them to all ranks
+        for group_id, flat_params in enumerate(self._fp16_flat_params):
+            flat_params[self._local_rank].copy_(self._fp32_flat_params[group_id].data)
+            self._fp32_flat_params[group_id].grad = None
+            if self._world_size > 1:
+                for rank, flat in enumerate(flat_params):
+                    if flat.numel() > 0:
+                        dist.broadcast(flat, src=self._dp_ranks[rank], group=self._dp_group)
+        return ret
+
+    def _unscale_and_clip_grads(self, owned_params: List[Parameter]):
+        combined_scale = self.loss_scale
+        if self._clip_grad_norm > 0.0:
+            # views of flat fp32 gradients in the order of owned params
+            grads = []
+            for group_id, rank_params in enumerate(self._fp16_param_groups):
+                ps = rank_params[self._local_rank]
+                if len(ps) > 0:
+                    grads.extend(unflatten(self._fp32_flat_params[group_id].grad, ps))
+            total_norm = compute_norm(grads, owned_params, self._dp_group, self._mp_group)
+            clip = ((total_norm / self.loss_scale) + 1e-6) / self._clip_grad_norm
+            if clip > 1:
+                combined_scale = clip * self.loss_scale
+        for fp32_flat in self._fp32_flat_params:
+            fp32_flat.grad.div_(combined_scale)
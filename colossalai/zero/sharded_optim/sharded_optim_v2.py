@@ -1,6 +1,7 @@
+from concurrent.futures import Future, ThreadPoolExecutor
 from enum import Enum
 from os import stat
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import torch
 import torch.distributed as dist
@@ -13,6 +14,7 @@ from colossalai.nn.optimizer import ColossalaiOptimizer
 from colossalai.gemini.tensor_utils import (colo_model_data_tensor_move_inline, colo_tensor_mem_usage)
 from colossalai.zero.sharded_model import ShardedModelV2
 from colossalai.zero.sharded_model._utils import cast_tensor_to_fp32
+from colossalai.zero.sharded_optim._utils import knapsack
 from torch import Tensor
 from torch.distributed import ProcessGroup
 from torch.nn.parameter import Parameter
@@ -67,6 +69,11 @@ class ShardedOptimizerV2(ColossalaiOptimizer):
         max_scale (int, optional): max_scale used by DynamicGradScaler. Defaults to 2**32.
         dp_process_group (Optional[ProcessGroup], optional): data paralle process group. Defaults to None.
         mp_process_group (Optional[ProcessGroup], optional): model paralle process group. Defaults to None.
+        pipeline_step_chunk_size (int, optional): If it's positive, ``step()`` updates params in chunks of about
+            this number of elements, and copies updated fp32 params of a chunk back to fp16 params in a background
+            thread while the next chunk is updated. It's useful when the inner optimizer runs on CPU,
+            e.g. ``CPUAdam`` and ``HybridAdam``. The inner optimizer must update each param independently.
+            Defaults to 0, which means all params are updated at once.
 
     .. _PatrickStar\: Parallel Training of Pre-trained Models via Chunk-based Memory Management:
         https://arxiv.org/abs/2108.05818
@@ -85,7 +92,8 @@ class ShardedOptimizerV2(ColossalaiOptimizer):
                  max_scale: float = 2**32,
                  dp_process_group: Optional[ProcessGroup] = None,
                  mp_process_group: Optional[ProcessGroup] = None,
-                 verbose: bool = False) -> None:
+                 verbose: bool = False,
+                 pipeline_step_chunk_size: int = 0) -> None:
         assert isinstance(sharded_model, ShardedModelV2), 'model must be wrapped with ShardedModel'
 
         super().__init__(optimizer)
@@ -100,6 +108,8 @@ class ShardedOptimizerV2(ColossalaiOptimizer):
         self._should_move_fp32_shards_h2d: bool = sharded_model.cpu_offload and self.gpu_margin_mem_ratio > 0.0 and getattr(
             optimizer, 'num_fp32_shards_per_param', 0) >= 2
         self.device = sharded_model._tensor_placement_policy.device or torch.device('cpu')
+        # the margin space used by the current placement of fp32 shards
+        self._placed_cuda_margin_space: Optional[int] = None
         self.optim_state: OptimState = OptimState.UNSCALED
         self.dp_process_group = dp_process_group or gpc.get_group(ParallelMode.DATA)
         self.mp_process_group = mp_process_group or gpc.get_group(ParallelMode.MODEL)
@@ -128,6 +138,15 @@ class ShardedOptimizerV2(ColossalaiOptimizer):
 
         self._use_memory_tracer = self.model.use_memory_tracer
 
+        self._pipeline_step_chunk_size = pipeline_step_chunk_size
+        self._copy_executor: Optional[ThreadPoolExecutor] = None
+        if pipeline_step_chunk_size > 0:
+            # the current cuda device is thread local
+            initializer, initargs = None, ()
+            if torch.cuda.is_available():
+                initializer, initargs = torch.cuda.set_device, (torch.cuda.current_device(),)
+            self._copy_executor = ThreadPoolExecutor(max_workers=1, initializer=initializer, initargs=initargs)
+
     @property
     def loss_scale(self):
         return self.grad_scaler.scale.item()
@@ -179,6 +198,9 @@ class ShardedOptimizerV2(ColossalaiOptimizer):
         self._prepare_grads()
         self._maybe_move_fp32_shards()
 
+        if self._copy_executor is not None:
+            return self._pipelined_step(*args, **kwargs)
+
         # unscale grads if scaled
         if self.optim_state == OptimState.SCALED:
             self._unscale_grads()
@@ -210,16 +232,97 @@ class ShardedOptimizerV2(ColossalaiOptimizer):
         self._copy_master_model_to_model_fp16()
         return ret
 
+    def _pipelined_step(self, *args, **kwargs):
+        """Update params chunk by chunk. Updated params of chunk i are copied back to fp16 params in the background,
+        while chunk i+1 is unscaled and updated.
+        """
+        found_inf = self._check_overflow()
+        # grads are unscaled by the scale used in backward, which may be changed by the update
+        loss_scale = self.loss_scale
+        self.grad_scaler.update(found_inf)
+
+        if found_inf:
+            self._logger.warning('found inf during ShardedOptimV2 step')
+            self._zero_grad(recover_data=True)
+            return
+
+        should_unscale = self.optim_state == OptimState.SCALED
+        ret = None
+        pending_copy: Optional[Tuple[Future, List[Parameter]]] = None
+        for chunk in self._get_step_chunks():
+            params = [p for group_params in chunk for p in group_params]
+            for p in params:
+                if should_unscale and p.grad is not None:
+                    p.grad.data.div_(loss_scale)
+                self.master_params[p].trans_state(TensorState.COMPUTE)
+                p.data = self.master_params[p].payload
+
+            ret = self._step_params(chunk, *args, **kwargs)
+
+            for p in params:
+                self._prepare_param_fp16_payload(p)
+            copy_future = self._copy_executor.submit(self._copy_master_payloads, params)
+            if pending_copy is not None:
+                self._finish_copy(*pending_copy)
+            pending_copy = (copy_future, params)
+        if pending_copy is not None:
+            self._finish_copy(*pending_copy)
+        self.optim_state = OptimState.UNSCALED
+        return ret
+
+    def _get_step_chunks(self) -> List[List[List[Parameter]]]:
+        """Split params into chunks of about ``pipeline_step_chunk_size`` elements.
+        Each chunk is a list of params of each param group.
+        """
+        num_groups = len(self.optim.param_groups)
+        chunks = []
+        chunk, chunk_numel = [[] for _ in range(num_groups)], 0
+        for group_idx, group in enumerate(self.optim.param_groups):
+            for p in group['params']:
+                chunk[group_idx].append(p)
+                chunk_numel += self.master_params[p].payload.numel()
+                if chunk_numel >= self._pipeline_step_chunk_size:
+                    chunks.append(chunk)
+                    chunk, chunk_numel = [[] for _ in range(num_groups)], 0
+        if chunk_numel > 0 or len(chunks) == 0:
+            chunks.append(chunk)
+        return chunks
+
+    def _step_params(self, chunk: List[List[Parameter]], *args, **kwargs):
+        # let the inner optimizer only see params of the chunk
+        all_params = [group['params'] for group in self.optim.param_groups]
+        for group, group_params in zip(self.optim.param_groups, chunk):
+            group['params'] = group_params
+        try:
+            return self.optim.step(*args, **kwargs)
+        finally:
+            for group, group_params in zip(self.optim.param_groups, all_params):
+                group['params'] = group_params
+
+    def _copy_master_payloads(self, params: List[Parameter]):
+        # only tensor copies run in the background thread, states of stateful tensors are updated in the main thread
+        for p in params:
+            self._copy_master_payload(p)
+
+    def _finish_copy(self, copy_future: Future, params: List[Parameter]):
+        copy_future.result()
+        for p in params:
+            self._finish_param_fp16_copy(p)
+
     def _check_overflow(self):
         # clear previous overflow record
-        self._found_overflow.fill_(self.model.overflow_counter)
+        # the overflow counter of the model is accumulated on device, no host sync happens here
+        self._found_overflow.copy_(self.model.overflow_counter)
 
         # all-reduce across dp group
         dist.all_reduce(self._found_overflow, group=self.dp_process_group)
 
         # all-reduce over model parallel group
-        dist.all_reduce(self._found_overflow, group=self.mp_process_group)
+        # skip it when there is no model parallelism, so only one collective is issued per step
+        if dist.get_world_size(self.mp_process_group) > 1:
+            dist.all_reduce(self._found_overflow, group=self.mp_process_group)
 
+        # the only host sync of overflow detection in a step
         return self._found_overflow.item() > 0
 
     def _unscale_grads(self):
@@ -254,13 +357,71 @@ class ShardedOptimizerV2(ColossalaiOptimizer):
                 else:
                     # release saved gradient
                     p.colo_attr.saved_grad.set_null()
-        self.model.overflow_counter = 0    # set overflow counter to zero
+        self.model.overflow_counter.zero_()    # set overflow counter to zero
 
     def sync_grad(self):
         pass
 
+    def state_dict(self) -> Dict:
+        """Returns the optimizer states of this rank without gathering.
+        It includes fp32 master param shards, states of the inner optimizer (which are sharded as master params)
+        and the grad scaler. Shard metadata is saved as well, so that the state dict can be loaded by the same rank
+        of the same data parallel size, or be resharded offline by
+        :func:`colossalai.zero.sharded_optim.utils.reshard_optimizer_state_dicts`.
+        """
+        master_params = {}
+        param_metadata = {}
+        idx = 0
+        for group in self.optim.param_groups:
+            for p in group['params']:
+                master_params[idx] = self.master_params[p].payload
+                param_metadata[idx] = dict(origin_shape=p.colo_attr.sharded_data_tensor.origin_shape,
+                                           is_sharded=self._master_is_sharded[p],
+                                           is_replicated=p.colo_attr.is_replicated)
+                idx += 1
+        return {
+            'optim_state_dict': self.optim.state_dict(),
+            'master_params': master_params,
+            'grad_scaler': self.grad_scaler.state_dict(),
+            'shard_metadata': {
+                'rank': dist.get_rank(self.dp_process_group),
+                'world_size': dist.get_world_size(self.dp_process_group),
+                'params': param_metadata
+            }
+        }
+
+    def load_state_dict(self, state_dict: Dict) -> None:
+        """Loads the optimizer states saved by :meth:`state_dict` of the same rank.
+        Master params are copied in place, so their placement is kept, and fp16 params are updated from them.
+        """
+        shard_metadata = state_dict['shard_metadata']
+        rank = dist.get_rank(self.dp_process_group)
+        world_size = dist.get_world_size(self.dp_process_group)
+        if shard_metadata['rank'] != rank or shard_metadata['world_size'] != world_size:
+            raise RuntimeError(f'The optimizer state dict is saved by rank {shard_metadata["rank"]} of '
+                               f'{shard_metadata["world_size"]}, but it is loaded by rank {rank} of {world_size}. '
+                               'Please reshard it offline by `reshard_optimizer_state_dicts` first.')
+        params = [p for group in self.optim.param_groups for p in group['params']]
+        if len(params) != len(state_dict['master_params']):
+            raise RuntimeError(f'The optimizer state dict has {len(state_dict["master_params"])} params, '
+                               f'but current optimizer has {len(params)} params')
+
+        for idx, p in enumerate(params):
+            self.master_params[p].payload.copy_(state_dict['master_params'][idx])
+        # The inner optimizer casts states to the device and dtype of params
+        # So we point params to fp32 master params before loading
+        self._point_param_fp16_to_master_param()
+        self.optim.load_state_dict(state_dict['optim_state_dict'])
+        for p in params:
+            self.master_params[p].trans_state(TensorState.HOLD)
+            p.colo_attr.set_data_none()
+        self.grad_scaler.load_state_dict(state_dict['grad_scaler'])
+        self._copy_master_model_to_model_fp16()
+
     def _register_master_weight(self):
         self.master_params: Dict[Parameter, StatefulTensor] = {}
+        # whether the master param is a shard, which is not always the case of the fp16 param
+        self._master_is_sharded: Dict[Parameter, bool] = {}
         for group in self.optim.param_groups:
             for p in group['params']:
                 assert hasattr(p, 'colo_attr'), 'The parameter must be wrapped with ShardedParam'
@@ -268,6 +429,7 @@ class ShardedOptimizerV2(ColossalaiOptimizer):
                 if shard_flag:
                     # we always shard replicated paramters
                     self.shard_strategy.shard([p.colo_attr.sharded_data_tensor], self.dp_process_group)
+                self._master_is_sharded[p] = p.colo_attr.sharded_data_tensor.is_sharded
                 self.master_params[p] = StatefulTensor(cast_tensor_to_fp32(p.colo_attr.data_payload.to(self.device)))
                 if shard_flag:
                     # In this branch, there's no need to shard param
@@ -275,19 +437,37 @@ class ShardedOptimizerV2(ColossalaiOptimizer):
                     self.shard_strategy.gather([p.colo_attr.sharded_data_tensor], self.dp_process_group)
 
     def _maybe_move_fp32_shards(self):
-        if self._should_move_fp32_shards_h2d:
-            self._should_move_fp32_shards_h2d = False
-            available_cuda_margin_mem = self.model.cuda_margin_space * self.gpu_margin_mem_ratio
-            fp32_shards_available_cuda_margin_mem = available_cuda_margin_mem / self.optim.num_fp32_shards_per_param
-            fp32_shards_used_cuda_margin_mem = 0
-            for group in self.optim.param_groups:
-                for p in group['params']:
-                    shard_mem = self.master_params[p].payload.numel() * self.master_params[p].payload.element_size()
-                    if fp32_shards_used_cuda_margin_mem + shard_mem < fp32_shards_available_cuda_margin_mem:
-                        colo_model_data_tensor_move_inline(self.master_params[p], torch.cuda.current_device())
-                        colo_model_data_tensor_move_inline(p.colo_attr.saved_grad, torch.cuda.current_device())
-                        p.colo_attr.offload_grad = False
-                        fp32_shards_used_cuda_margin_mem += shard_mem
+        if not self._should_move_fp32_shards_h2d:
+            return
+        # recompute the placement only when the margin space given by the memory tracer changes
+        cuda_margin_space = self.model.cuda_margin_space
+        if cuda_margin_space == self._placed_cuda_margin_space:
+            return
+        self._placed_cuda_margin_space = cuda_margin_space
+
+        available_cuda_margin_mem = cuda_margin_space * self.gpu_margin_mem_ratio
+        fp32_shards_available_cuda_margin_mem = available_cuda_margin_mem / self.optim.num_fp32_shards_per_param
+        params = [p for group in self.optim.param_groups for p in group['params']]
+        shard_numels = [self.master_params[p].payload.numel() for p in params]
+        shard_mems = [numel * self.master_params[p].payload.element_size() for p, numel in zip(params, shard_numels)]
+        # choose shards to maximize the number of elements updated on CUDA within the margin space,
+        # instead of taking shards in order until the margin space is used up
+        selected = set(knapsack(shard_mems, shard_numels, fp32_shards_available_cuda_margin_mem))
+        for idx, p in enumerate(params):
+            target_device = torch.device(f'cuda:{torch.cuda.current_device()}') if idx in selected else self.device
+            self._move_fp32_shard(p, target_device)
+
+    def _move_fp32_shard(self, p: Parameter, target_device: torch.device):
+        if self.master_params[p].device.type == target_device.type:
+            return
+        colo_model_data_tensor_move_inline(self.master_params[p], target_device)
+        if not p.colo_attr.saved_grad.is_null():
+            colo_model_data_tensor_move_inline(p.colo_attr.saved_grad, target_device)
+        p.colo_attr.offload_grad = target_device.type == 'cpu'
+        # optimizer states must be on the same device as the master param
+        for v in self.optim.state[p].values():
+            if torch.is_tensor(v) and v.dim() > 0:
+                colo_model_data_tensor_move_inline(v, target_device)
 
     def _prepare_grads(self):
         for group in self.optim.param_groups:
@@ -326,6 +506,11 @@ class ShardedOptimizerV2(ColossalaiOptimizer):
                 self._copy_master_param_to_param_fp16(p)
 
     def _copy_master_param_to_param_fp16(self, p):
+        self._prepare_param_fp16_payload(p)
+        self._copy_master_payload(p)
+        self._finish_param_fp16_copy(p)
+
+    def _prepare_param_fp16_payload(self, p):
         # flush gradient
         if p.colo_attr.sharded_data_tensor.payload_size == 0:
             # here reuse_fp16_shard is True
@@ -334,16 +519,21 @@ class ShardedOptimizerV2(ColossalaiOptimizer):
         else:
             p.colo_attr.saved_grad.set_null()
 
-        p.data = self.master_params[p].payload
+        master_payload = self.master_params[p].payload
 
         # we need to allocate new memory for keep_not_shard paramters
         # in order to use copy, otherwise, the sizes of tensor is not compatible
-        if p.colo_attr.data_payload.numel() != p.data.numel():
+        if p.colo_attr.data_payload.numel() != master_payload.numel():
             p.colo_attr.data_payload_reset(
-                torch.empty(p.data.shape, dtype=p.colo_attr.data_payload.dtype, device=p.colo_attr.data_payload.device))
+                torch.empty(master_payload.shape,
+                            dtype=p.colo_attr.data_payload.dtype,
+                            device=p.colo_attr.data_payload.device))
 
+    def _copy_master_payload(self, p):
         # TODO() optimize this line CPU (fp32) -> GPU (fp16)
-        p.colo_attr.sharded_data_tensor.payload_copy(p.half().detach())
+        p.colo_attr.sharded_data_tensor.payload_copy(self.master_params[p].payload.half().detach())
+
+    def _finish_param_fp16_copy(self, p):
         p.colo_attr.set_data_none()
 
         if p.colo_attr.keep_not_shard and p.colo_attr.is_replicated:
@@ -0,0 +1,102 @@
+from copy import deepcopy
+from typing import Dict, List
+
+import torch
+from colossalai.nn.optimizer.utils import (QUANTIZED_ADAM_STATES, dequantize_dynamic_blockwise,
+                                           quantize_dynamic_blockwise)
+from colossalai.zero.shard_utils.commons import get_shard
+
+
+def _reshard_tensor(shards: List[torch.Tensor], origin_numel: int, world_size: int) -> List[torch.Tensor]:
+    full_tensor = torch.cat([shard.flatten() for shard in shards])[:origin_numel]
+    return [get_shard(full_tensor, rank, world_size)[0] for rank in range(world_size)]
+
+
+def _reshard_states(states: List[Dict], master_shards: List[torch.Tensor], origin_numel: int,
+                    world_size: int) -> List[Dict]:
+    new_states = [{} for _ in range(world_size)]
+    shard_shape = master_shards[0].shape
+    for key, val in states[0].items():
+        if key.endswith('_absmax') and key[:-len('_absmax')] in states[0]:
+            # resharded with its quantized state
+            continue
+        if key in QUANTIZED_ADAM_STATES and f'{key}_absmax' in states[0]:
+            # blocks of quantized states do not match the new shards, so they are resharded in fp32
+            signed = QUANTIZED_ADAM_STATES[key]
+            block_size = val.shape[-1]
+            shards = [
+                dequantize_dynamic_blockwise(state[key], state[f'{key}_absmax'], shard.numel(), signed)
+                for state, shard in zip(states, master_shards)
+            ]
+            for new_state, shard in zip(new_states, _reshard_tensor(shards, origin_numel, world_size)):
+                new_state[key], new_state[f'{key}_absmax'] = quantize_dynamic_blockwise(shard, block_size, signed)
+        elif torch.is_tensor(val) and val.dim() > 0:
+            if any(state[key].shape != shard_shape for state in states):
+                raise RuntimeError(f'State {key} of shape {tuple(val.shape)} is not sharded as master params '
+                                   f'of shape {tuple(shard_shape)}, which can not be resharded')
+            for new_state, new_val in zip(new_states, _reshard_tensor([state[key] for state in states],
+                                                                      origin_numel, world_size)):
+                new_state[key] = new_val
+        else:
+            for new_state in new_states:
+                new_state[key] = deepcopy(val)
+    return new_states
+
+
+def reshard_optimizer_state_dicts(state_dicts: List[Dict], world_size: int) -> List[Dict]:
+    """Reshard state dicts of ``ShardedOptimizerV2`` to a different data parallel size offline.
+    Sharded master params and their optimizer states are concatenated and re-chunked,
+    quantized states are dequantized before and quantized again after. Other states (e.g. step)
+    and unsharded replicated master params are copied from rank 0.
+
+    Args:
+        state_dicts (List[Dict]): State dicts returned by ``ShardedOptimizerV2.state_dict()`` of all ranks.
+        world_size (int): The new data parallel size.
+
+    Returns:
+        List[Dict]: New state dicts, the i-th one should be loaded by rank i.
+    """
+    state_dicts = sorted(state_dicts, key=lambda sd: sd['shard_metadata']['rank'])
+    old_world_size = state_dicts[0]['shard_metadata']['world_size']
+    ranks = [sd['shard_metadata']['rank'] for sd in state_dicts]
+    assert ranks == list(range(old_world_size)), \
+        f'Expect state dicts of ranks {list(range(old_world_size))}, but got ranks {ranks}'
+    param_metadata = state_dicts[0]['shard_metadata']['params']
+
+    new_state_dicts = []
+    for rank in range(world_size):
+        new_state_dicts.append({
+            'optim_state_dict': {
+                'state': {},
+                'param_groups': deepcopy(state_dicts[0]['optim_state_dict']['param_groups'])
+            },
+            'master_params': {},
+            'grad_scaler': deepcopy(state_dicts[0]['grad_scaler']),
+            'shard_metadata': {
+                'rank': rank,
+                'world_size': world_size,
+                'params': deepcopy(param_metadata)
+            }
+        })
+
+    for idx, meta in param_metadata.items():
+        master_shards = [sd['master_params'][idx] for sd in state_dicts]
+        states = [sd['optim_state_dict']['state'].get(idx) for sd in state_dicts]
+        if meta['is_sharded']:
+            origin_numel = torch.Size(meta['origin_shape']).numel()
+            new_masters = _reshard_tensor(master_shards, origin_numel, world_size)
+            new_states = None if states[0] is None else \
+                _reshard_states(states, master_shards, origin_numel, world_size)
+        elif meta['is_replicated']:
+            # the full master param and its states are the same on all ranks
+            new_masters = [master_shards[0].clone() for _ in range(world_size)]
+            new_states = None if states[0] is None else [deepcopy(states[0]) for _ in range(world_size)]
+        else:
+            raise RuntimeError(f'Param {idx} is not replicated among data parallel ranks, which can not be resharded')
+
+        for rank in range(world_size):
+            new_state_dicts[rank]['master_params'][idx] = new_masters[rank]
+            if new_states is not None:
+                new_state_dicts[rank]['optim_state_dict']['state'][idx] = new_states[rank]
+
+    return new_state_dicts
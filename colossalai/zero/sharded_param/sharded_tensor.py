@@ -37,3 +37,12 @@ class ShardedTensor(StatefulTensor):
     @is_sharded.setter
     def is_sharded(self, flag: bool):
         self._is_sharded = flag
+
+    def mark_sharded(self, origin_shape: torch.Size):
+        """Mark the payload as a shard of a tensor of ``origin_shape``,
+        e.g. the payload is materialized as a shard directly.
+        """
+        assert not self._is_sharded, "The tensor is already sharded"
+        self._origin_shape = origin_shape
+        self._origin_numel = origin_shape.numel()
+        self._is_sharded = True
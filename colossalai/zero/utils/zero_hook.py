@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, Optional
 
 import torch
 import torch.distributed as dist
@@ -8,6 +8,7 @@ from colossalai.registry import OPHOOKS
 from colossalai.utils import get_current_device
 
 from colossalai.zero.shard_utils import BaseShardStrategy
+from colossalai.zero.shard_utils.commons import get_shard
 from colossalai.engine.ophooks import BaseOpHook
 
 from colossalai.gemini.stateful_tensor_mgr import StatefulTensorMgr
@@ -19,17 +20,24 @@ from colossalai.gemini.stateful_tensor import TensorState
 class ZeroHook(BaseOpHook):
     """
     A hook to process sharded param for ZeRO method.
+
+    If ``intra_node_process_group`` is given, a secondary shard of each gathered param, partitioned within the node,
+    is kept after forward. Backward gathers params from secondary shards in the node,
+    instead of gathering primary shards across the whole data parallel group.
     """
 
     def __init__(self,
                  shard_strategy: BaseShardStrategy,
                  memstarts_collector: Optional[MemStatsCollector] = None,
                  stateful_tensor_mgr: Optional[StatefulTensorMgr] = None,
-                 process_group: Optional[dist.ProcessGroup] = None):
+                 process_group: Optional[dist.ProcessGroup] = None,
+                 intra_node_process_group: Optional[dist.ProcessGroup] = None):
         super().__init__()
         self.logger = get_dist_logger("ZeROHook")
         self.shard_strategy = shard_strategy
         self.process_group = process_group
+        self.intra_node_process_group = intra_node_process_group
+        self._secondary_shards: Dict[torch.nn.Parameter, torch.Tensor] = {}
 
         # NOTE(jiaruifang) Now the computing device of FWD and BWD is always on GPU
         self.computing_device = get_current_device()
@@ -44,7 +52,8 @@ class ZeroHook(BaseOpHook):
             for param in module.parameters(recurse=False):
                 assert hasattr(param, 'colo_attr')
                 tensor_list.append(param.colo_attr.sharded_data_tensor)
-            self.shard_strategy.gather(tensor_list, self.process_group)
+            # params gathered for computation may be quantized
+            self.shard_strategy.gather(tensor_list, self.process_group, quantize=True)
 
     def shard_parameters(self, module: torch.nn.Module):
         # shard gathered parameters
@@ -55,6 +64,41 @@ class ZeroHook(BaseOpHook):
                 tensor_list.append(param.colo_attr.sharded_data_tensor)
             self.shard_strategy.shard(tensor_list, self.process_group)
 
+    def save_secondary_shards(self, module: torch.nn.Module):
+        # keep the intra-node shard of gathered parameters for backward,
+        # forwards without grad or in eval mode have no backward
+        if self.intra_node_process_group is None or not module.param_is_sharded:
+            return
+        if not (torch.is_grad_enabled() and module.training):
+            return
+        rank = dist.get_rank(self.intra_node_process_group)
+        world_size = dist.get_world_size(self.intra_node_process_group)
+        for param in module.parameters(recurse=False):
+            if not param.colo_attr.sharded_data_tensor.is_sharded:
+                self._secondary_shards[param] = get_shard(param.colo_attr.data_payload, rank, world_size)[0]
+
+    def drop_secondary_shards(self):
+        self._secondary_shards.clear()
+
+    def gather_secondary_shards(self, module: torch.nn.Module) -> bool:
+        """Gather parameters from secondary shards within the node.
+        Returns False if any parameter of the module has no secondary shard.
+        """
+        params = list(module.parameters(recurse=False))
+        if not module.param_is_sharded or not all(param in self._secondary_shards for param in params):
+            return False
+        world_size = dist.get_world_size(self.intra_node_process_group)
+        for param in params:
+            shard = self._secondary_shards.pop(param)
+            t = param.colo_attr.sharded_data_tensor
+            if not t.is_sharded:
+                continue
+            buffer = torch.empty(shard.numel() * world_size, dtype=shard.dtype, device=self.computing_device)
+            dist.all_gather(list(torch.chunk(buffer, world_size)), shard, group=self.intra_node_process_group)
+            t.payload_reset(torch.narrow(buffer, 0, 0, t.origin_numel).reshape(t.origin_shape))
+            t.is_sharded = False
+        return True
+
     def adjust_module_data(self, module: torch.nn.Module):
         # record overall data statistics
         if self._memstarts_collector:
@@ -83,6 +127,7 @@ class ZeroHook(BaseOpHook):
         for param in module.parameters(recurse=False):
             param.colo_attr.sharded_data_tensor.trans_state(TensorState.HOLD_AFTER_FWD)
 
+        self.save_secondary_shards(module)
         self.shard_parameters(module)
 
         # remove torch payload
@@ -91,7 +136,8 @@ class ZeroHook(BaseOpHook):
 
     def pre_bwd_exec(self, module: torch.nn.Module, input, output):
         self.adjust_module_data(module)
-        self.gather_parameters(module)
+        if not self.gather_secondary_shards(module):
+            self.gather_parameters(module)
         for param in module.parameters(recurse=False):
             param.data = param.colo_attr.data_payload
             assert param.data.device.type == 'cuda', f"PRE BWD param.data must be on CUDA"
@@ -112,6 +158,8 @@ class ZeroHook(BaseOpHook):
         pass
 
     def post_iter(self):
+        # secondary shards of modules not used in backward are stale after the optimizer step
+        self.drop_secondary_shards()
         if self._stateful_tensor_mgr:
             self.logger.info(
                 f"CPU-GPU data moving this iteration {self._stateful_tensor_mgr.cpu_gpu_move_volume/1e9} GB, get layout info time: {self._stateful_tensor_mgr._layout_time}, evict cpu time: {self._stateful_tensor_mgr._evict_time}",
@@ -0,0 +1,62 @@
+import copy
+
+import pytest
+import torch
+import torch.nn as nn
+from colossalai.amp import AMP_TYPE, convert_to_amp
+from colossalai.testing import parameterize
+
+
+class MlpModel(nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.linear1 = nn.Linear(16, 32)
+        self.linear2 = nn.Linear(32, 4)
+
+    def forward(self, x):
+        return self.linear2(torch.relu(self.linear1(x)))
+
+
+@parameterize('master_weights', [True, False])
+def run_bf16_amp(master_weights):
+    torch.manual_seed(42)
+    torch_model = MlpModel()
+    amp_model = copy.deepcopy(torch_model)
+    torch_optim = torch.optim.SGD(torch_model.parameters(), lr=1e-1)
+    amp_optim = torch.optim.SGD(amp_model.parameters(), lr=1e-1)
+    amp_model, amp_optim, _ = convert_to_amp(amp_model,
+                                             amp_optim,
+                                             None,
+                                             AMP_TYPE.BF16,
+                                             amp_config=dict(master_weights=master_weights))
+
+    for _ in range(3):
+        data = torch.rand(8, 16)
+        amp_output = amp_model(data)
+        assert amp_output.dtype == torch.float
+        amp_optim.zero_grad()
+        amp_optim.backward(amp_output.pow(2).mean())
+        success, _ = amp_optim.step()
+        assert success
+
+        torch_optim.zero_grad()
+        torch_model(data).pow(2).mean().backward()
+        torch_optim.step()
+
+    for amp_param, torch_param in zip(amp_model.parameters(), torch_model.parameters()):
+        assert amp_param.dtype == torch.bfloat16
+        assert torch.allclose(amp_param.float(), torch_param, rtol=2e-2, atol=2e-2)
+    if master_weights:
+        for amp_param, master_param in zip(amp_model.parameters(), amp_optim.param_groups[0]['params']):
+            assert master_param.dtype == torch.float
+            assert torch.equal(amp_param, master_param.bfloat16())
+
+
+@pytest.mark.cpu
+def test_bf16_amp():
+    run_bf16_amp()
+
+
+if __name__ == '__main__':
+    test_bf16_amp()
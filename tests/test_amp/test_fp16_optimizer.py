@@ -0,0 +1,172 @@
+import copy
+from functools import partial
+
+import colossalai
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+from colossalai.amp.naive_amp import FP16Optimizer
+from colossalai.amp.naive_amp._fp16_optimizer import _get_union_process_group
+from colossalai.amp.naive_amp._utils import unscale_and_check_overflow
+from colossalai.amp.naive_amp.grad_scaler import ConstantGradScaler, DynamicGradScaler
+from colossalai.testing import rerun_if_address_is_in_use
+from colossalai.utils import free_port
+
+SHAPES = [(4, 3), (5,), (2, 2), (3,)]
+LOSS_SCALE = 2**4
+
+
+def _step(optim, torch_optim, params, torch_params, no_grad_idx=None):
+    for idx, (p, torch_p) in enumerate(zip(params, torch_params)):
+        if idx == no_grad_idx:
+            p.grad, torch_p.grad = None, None
+            continue
+        # grads representable in the low precision dtype, so that both optimizers see the same grads
+        grad = torch.randn_like(torch_p).to(p.dtype)
+        p.grad = grad * LOSS_SCALE
+        torch_p.grad = grad.float()
+    success, _ = optim.step()
+    assert success
+    torch_optim.step()
+
+
+def _check_params(optim, params, torch_params):
+    master_params = optim.param_groups[0]['params']
+    for p, master_p, torch_p in zip(params, master_params, torch_params):
+        assert torch.allclose(master_p, torch_p, rtol=1e-6, atol=1e-6)
+        assert torch.equal(p, master_p.to(p.dtype))
+
+
+@pytest.mark.cpu
+@pytest.mark.parametrize('dtype', [torch.half, torch.bfloat16])
+def test_fp16_optimizer(dtype):
+    torch.manual_seed(42)
+    torch_params = [nn.Parameter(torch.randn(shape).to(dtype).float()) for shape in SHAPES]
+    # the last param is kept in fp32 and updated in place
+    params = [nn.Parameter(p.detach().to(dtype)) for p in torch_params[:-1]]
+    params.append(nn.Parameter(torch_params[-1].detach().clone()))
+    torch_optim = torch.optim.Adam(torch_params, lr=1e-2)
+    optim = FP16Optimizer(torch.optim.Adam(params, lr=1e-2), ConstantGradScaler(LOSS_SCALE, verbose=False))
+
+    # low precision params and their fp32 master params and grads are views of flat buffers
+    flat_param, flat_master_param = optim._fp16_flat_params[0], optim._fp32_flat_master_params[0]
+    master_params = optim.param_groups[0]['params']
+    for p, master_p in zip(params[:-1], master_params):
+        assert p.data.storage().data_ptr() == flat_param.storage().data_ptr()
+        assert master_p.storage().data_ptr() == flat_master_param.storage().data_ptr()
+    assert master_params[-1] is params[-1]
+
+    # all grads are cast into the flat buffer at once, or copied one by one if a param has no grad
+    for no_grad_idx in [None, 1, None, 0]:
+        _step(optim, torch_optim, params, torch_params, no_grad_idx)
+        _check_params(optim, params, torch_params)
+    assert all(p.grad is None for p in params[:-1])
+
+    state_dict = copy.deepcopy(optim.state_dict())
+    new_params = [nn.Parameter(p.detach().clone()) for p in params]
+    new_optim = FP16Optimizer(torch.optim.Adam(new_params, lr=1e-2), ConstantGradScaler(1, verbose=False))
+    new_optim.load_state_dict(state_dict)
+    assert new_optim.loss_scale.item() == LOSS_SCALE
+    for p, new_p in zip(optim.param_groups[0]['params'], new_optim.param_groups[0]['params']):
+        assert torch.equal(p, new_p)
+        for k, v in optim.state[p].items():
+            assert torch.equal(torch.as_tensor(v), torch.as_tensor(new_optim.state[new_p][k]))
+
+    # the loaded optimizer continues in the same way
+    for no_grad_idx in [None, 2]:
+        _step(new_optim, torch_optim, new_params, torch_params, no_grad_idx)
+        _check_params(new_optim, new_params, torch_params)
+
+
+@pytest.mark.cpu
+def test_unscale_and_check_overflow():
+    tensors = [torch.full((3,), 4.), torch.full((2,), 8.)]
+    found_overflow = torch.zeros(1)
+    unscale_and_check_overflow(tensors, torch.tensor([0.25]), found_overflow)
+    assert found_overflow.item() == 0
+    assert torch.equal(tensors[0], torch.ones(3)) and torch.equal(tensors[1], torch.full((2,), 2.))
+
+    tensors = [torch.tensor([1., float('inf')]), torch.tensor([float('nan')]), torch.ones(2)]
+    unscale_and_check_overflow(tensors, torch.tensor([0.5]), found_overflow)
+    assert found_overflow.item() == 1
+    assert torch.equal(tensors[2], torch.full((2,), 0.5))
+
+
+def run_union_process_group():
+    rank = dist.get_rank()
+    # groups of ranks {0, 1}, {2, 3} and {0, 2}, {1, 3}, every rank creates all groups in the same order
+    row_groups = [dist.new_group(ranks) for ranks in [[0, 1], [2, 3]]]
+    col_groups = [dist.new_group(ranks) for ranks in [[0, 2], [1, 3]]]
+    row_group, col_group = row_groups[rank // 2], col_groups[rank % 2]
+
+    assert _get_union_process_group(row_group, None) is row_group
+    assert _get_union_process_group(None, None) is None
+
+    # connected groups span all ranks
+    union_group = _get_union_process_group(row_group, col_group)
+    assert dist.get_world_size(union_group) == 4
+    # the same ranks in different groups are merged
+    other_row_groups = [dist.new_group(ranks) for ranks in [[0, 1], [2, 3]]]
+    union_group = _get_union_process_group(row_group, other_row_groups[rank // 2])
+    assert dist.get_world_size(union_group) == 2
+    rank_sum = torch.tensor([rank])
+    dist.all_reduce(rank_sum, group=union_group)
+    assert rank_sum.item() == (1 if rank < 2 else 5)
+
+
+def run_overflow():
+    rank = dist.get_rank()
+    torch.manual_seed(42)
+    params = [nn.Parameter(torch.randn(shape).bfloat16()) for shape in SHAPES]
+    grad_scaler = DynamicGradScaler(initial_scale=LOSS_SCALE, growth_interval=2, hysteresis=1)
+    # the overflow flag is reduced over the data parallel group
+    optim = FP16Optimizer(torch.optim.SGD(params, lr=1e-1), grad_scaler)
+    assert optim._overflow_process_group is not None
+
+    # overflow on a single rank skips the step on all ranks
+    for p in params:
+        p.grad = torch.ones_like(p)
+    if rank == 1:
+        params[0].grad[0, 0] = float('inf')
+    origin_params = [p.detach().clone() for p in params]
+    success, _ = optim.step()
+    assert not success
+    assert optim.loss_scale.item() == LOSS_SCALE / 2
+    for p, origin_p in zip(params, origin_params):
+        assert torch.equal(p, origin_p)
+        assert p.grad is None
+    for p in optim.param_groups[0]['params']:
+        assert p.grad is None
+
+    # the scale grows after growth_interval steps without overflow
+    for i in range(2):
+        for p in params:
+            p.grad = torch.ones_like(p)
+        success, _ = optim.step()
+        assert success
+    assert optim.loss_scale.item() == LOSS_SCALE
+    for p, origin_p in zip(params, origin_params):
+        assert not torch.equal(p, origin_p)
+
+
+def run_dist(rank, world_size, port):
+    colossalai.launch(config=dict(), rank=rank, world_size=world_size, host='localhost', port=port, backend='gloo')
+    if world_size == 4:
+        run_union_process_group()
+    else:
+        run_overflow()
+
+
+@pytest.mark.dist
+@pytest.mark.parametrize("world_size", [2, 4])
+@rerun_if_address_is_in_use()
+def test_fp16_optimizer_dist(world_size):
+    run_func = partial(run_dist, world_size=world_size, port=free_port())
+    mp.spawn(run_func, nprocs=world_size)
+
+
+if __name__ == '__main__':
+    test_fp16_optimizer(torch.bfloat16)
+    test_fp16_optimizer_dist(2)
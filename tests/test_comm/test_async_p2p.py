@@ -0,0 +1,102 @@
+import time
+from functools import partial
+
+import pytest
+import torch
+import torch.multiprocessing as mp
+import torch.nn as nn
+from colossalai.communication import P2PWork, recv_forward, send_forward
+from colossalai.context import ParallelMode
+from colossalai.core import global_context as gpc
+from colossalai.engine import Engine
+from colossalai.engine.schedule import InterleavedPipelineSchedule, PipelineSchedule
+from colossalai.initialize import launch
+from colossalai.logging import disable_existing_loggers
+from colossalai.nn.optimizer import ColossalaiOptimizer
+from colossalai.testing import rerun_if_address_is_in_use
+from colossalai.utils import free_port
+
+CONFIG = dict(parallel=dict(pipeline=2))
+TENSOR_SIZE = torch.Size((4, 8))
+DELAY = 0.5
+NUM_LAYERS = 4
+NUM_MICRO_BATCHES = 4
+
+
+def check_async_recv_overlap():
+    data = torch.arange(32, dtype=torch.float).view(TENSOR_SIZE)
+    if gpc.is_first_rank(ParallelMode.PIPELINE):
+        # the receiver is busy computing while this stage is still producing its output
+        time.sleep(DELAY)
+        send_forward(data, async_op=True).wait()
+    else:
+        start = time.time()
+        work = recv_forward(TENSOR_SIZE, async_op=True)
+        assert isinstance(work, P2PWork)
+        assert not work.is_completed()
+        time.sleep(DELAY)
+        tensor = work.wait()
+        elapsed = time.time() - start
+        assert torch.equal(tensor, data)
+        # the receive has overlapped with the simulated compute
+        assert elapsed < 1.5 * DELAY, elapsed
+
+
+def build_layers():
+    torch.manual_seed(42)
+    return [nn.Linear(8, 8) for _ in range(NUM_LAYERS)]
+
+
+def check_schedule(num_model_chunks):
+    layers = build_layers()
+    torch.manual_seed(0)
+    data, label = torch.randn(8, 8), torch.randn(8, 8)
+
+    # reference: the whole model on one process, loss averaged over micro batches
+    ref_model = nn.Sequential(*build_layers())
+    for micro_data, micro_label in zip(data.chunk(NUM_MICRO_BATCHES), label.chunk(NUM_MICRO_BATCHES)):
+        loss = nn.functional.mse_loss(ref_model(micro_data), micro_label) / NUM_MICRO_BATCHES
+        loss.backward()
+
+    pp_rank = gpc.get_local_rank(ParallelMode.PIPELINE)
+    pp_size = gpc.get_world_size(ParallelMode.PIPELINE)
+    layer_ids = list(range(pp_rank, NUM_LAYERS, pp_size)) if num_model_chunks > 1 else \
+        list(range(pp_rank * NUM_LAYERS // pp_size, (pp_rank + 1) * NUM_LAYERS // pp_size))
+    if num_model_chunks > 1:
+        model = nn.ModuleList([layers[i] for i in layer_ids])
+        schedule = InterleavedPipelineSchedule(NUM_MICRO_BATCHES, num_model_chunks)
+    else:
+        model = nn.Sequential(*[layers[i] for i in layer_ids])
+        schedule = PipelineSchedule(NUM_MICRO_BATCHES)
+    optimizer = ColossalaiOptimizer(torch.optim.SGD(model.parameters(), lr=0.1))
+    engine = Engine(model, optimizer, criterion=nn.MSELoss(), schedule=schedule, verbose=False)
+    engine.train()
+    _, _, loss = engine.execute_schedule(iter([(data, label)]), forward_only=False, return_loss=True)
+
+    if gpc.is_last_rank(ParallelMode.PIPELINE):
+        assert loss is not None
+    ref_layers = list(ref_model.children())
+    for i in layer_ids:
+        for param, ref_param in zip(layers[i].parameters(), ref_layers[i].parameters()):
+            assert torch.allclose(param.grad, ref_param.grad, atol=1e-6)
+
+
+def run_async_p2p(rank, world_size, port):
+    disable_existing_loggers()
+    launch(config=CONFIG, rank=rank, world_size=world_size, host='localhost', port=port, backend='gloo')
+    check_async_recv_overlap()
+    check_schedule(num_model_chunks=1)
+    check_schedule(num_model_chunks=2)
+    gpc.destroy()
+
+
+@pytest.mark.dist
+@rerun_if_address_is_in_use()
+def test_async_p2p():
+    world_size = 2
+    run_func = partial(run_async_p2p, world_size=world_size, port=free_port())
+    mp.spawn(run_func, nprocs=world_size)
+
+
+if __name__ == '__main__':
+    test_async_p2p()
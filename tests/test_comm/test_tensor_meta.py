@@ -0,0 +1,55 @@
+from functools import partial
+
+import pytest
+import torch
+import torch.multiprocessing as mp
+from colossalai.communication import recv_tensor_meta, send_tensor_meta, wait_tensor_meta_sends
+from colossalai.communication.utils import _pending_meta_sends
+from colossalai.context import ParallelMode
+from colossalai.core import global_context as gpc
+from colossalai.initialize import launch
+from colossalai.logging import disable_existing_loggers
+from colossalai.testing import rerun_if_address_is_in_use
+from colossalai.utils import free_port
+
+CONFIG = dict(parallel=dict(pipeline=2))
+
+# shapes of consecutive microbatches, e.g. with variable sequence lengths
+SHAPES = [(4, 16, 8), (4, 16, 8), (4, 32, 8), (7,), (2, 3, 4, 5, 6)]
+
+
+def check_tensor_meta():
+    for shape in SHAPES:
+        if gpc.is_first_rank(ParallelMode.PIPELINE):
+            assert send_tensor_meta(torch.empty(shape)) is False
+        else:
+            assert recv_tensor_meta(None) == torch.Size(shape)
+
+    # meta information is not exchanged when the shape is known
+    if gpc.is_first_rank(ParallelMode.PIPELINE):
+        send_tensor_meta(torch.empty(2, 2), need_meta=False)
+    else:
+        assert recv_tensor_meta(torch.Size((2, 2))) == torch.Size((2, 2))
+
+    # headers are released once they are received
+    wait_tensor_meta_sends()
+    assert len(_pending_meta_sends) == 0
+
+
+def run_tensor_meta(rank, world_size, port):
+    disable_existing_loggers()
+    launch(config=CONFIG, rank=rank, world_size=world_size, host='localhost', port=port, backend='gloo')
+    check_tensor_meta()
+    gpc.destroy()
+
+
+@pytest.mark.dist
+@rerun_if_address_is_in_use()
+def test_tensor_meta():
+    world_size = 2
+    run_func = partial(run_tensor_meta, world_size=world_size, port=free_port())
+    mp.spawn(run_func, nprocs=world_size)
+
+
+if __name__ == '__main__':
+    test_tensor_meta()
@@ -1,3 +1,4 @@
+import copy
 import math
 import torch
 
@@ -116,3 +117,134 @@ def test_cpu_adam(adamw, step, p_dtype, g_dtype):
         assertTrue(max_exp_avg_diff < threshold, f"max_exp_avg_diff {max_exp_avg_diff}")
         max_exp_avg_sq_diff = torch.max(torch.abs(exp_avg_sq_copy - exp_avg_sq))
         assertTrue(max_exp_avg_sq_diff < threshold, f"max_exp_avg_sq_diff {max_exp_avg_sq_diff}")
+
+
+@parameterize('adamw', [True, False])
+@parameterize('weight_decay', [0, 0.01])
+@parameterize('p_dtype', [torch.float, torch.half])
+def test_cpu_adam_multi_tensor_fallback(adamw, weight_decay, p_dtype):
+    from colossalai.nn.optimizer import CPUAdam
+
+    torch.manual_seed(42)
+    params = [torch.nn.Parameter(torch.rand(shape, dtype=p_dtype)) for shape in [(64,), (7, 33), (1,)]]
+    params_copy = [torch.nn.Parameter(p.data.float()) for p in params]
+    optim = CPUAdam(params, lr=1e-3, weight_decay=weight_decay, adamw_mode=adamw)
+    # use the PyTorch fallback even if the extension is installed
+    optim.cpu_adam_op = None
+    torch_optim_class = torch.optim.AdamW if adamw else torch.optim.Adam
+    torch_optim = torch_optim_class(params_copy, lr=1e-3, weight_decay=weight_decay)
+
+    for _ in range(8):
+        for p, p_copy in zip(params, params_copy):
+            p_copy.grad = torch.rand_like(p_copy)
+            p.grad = p_copy.grad.to(p_dtype)
+        optim.step()
+        torch_optim.step()
+
+        threshold = 1e-5 if p_dtype == torch.float else 4e-3
+        for p, p_copy in zip(params, params_copy):
+            data_diff = torch.max(torch.abs(p.data.float() - p_copy.data))
+            assertLess(data_diff, threshold, f"p_data diff {data_diff}, adamw {adamw}, p_dtype {p_dtype}")
+
+
+@parameterize('signed', [True, False])
+def test_dynamic_blockwise_quantization(signed):
+    from colossalai.nn.optimizer.utils import dequantize_dynamic_blockwise, quantize_dynamic_blockwise
+
+    torch.manual_seed(42)
+    # values spanning several orders of magnitude
+    x = torch.randn(5000) * torch.logspace(-6, 0, 5000)
+    if not signed:
+        x = x.abs()
+    indices, absmax = quantize_dynamic_blockwise(x, 256, signed)
+    assert indices.dtype == torch.uint8 and indices.shape == (20, 256) and absmax.shape == (20,)
+    y = dequantize_dynamic_blockwise(indices, absmax, x.numel(), signed)
+    assert y.shape == x.shape
+    # relative error of values above the smallest code
+    mask = x.abs() > 1e-6 * absmax.repeat_interleave(256)[:x.numel()]
+    rel_error = ((y - x).abs() / x.abs())[mask]
+    assertLess(rel_error.max(), 0.1 if signed else 0.05, f"max relative error {rel_error.max()}")
+
+
+@parameterize('adamw', [True, False])
+def test_cpu_adam_quantized_states(adamw):
+    from colossalai.nn.optimizer import CPUAdam
+
+    def train(quantized_states):
+        torch.manual_seed(42)
+        model = torch.nn.Sequential(torch.nn.Linear(16, 64), torch.nn.Tanh(), torch.nn.Linear(64, 1))
+        optim = CPUAdam(model.parameters(),
+                        lr=1e-2,
+                        weight_decay=1e-2,
+                        adamw_mode=adamw,
+                        quantized_states=quantized_states,
+                        quantize_block_size=64)
+        data = torch.randn(256, 16)
+        label = torch.sin(data.sum(dim=-1, keepdim=True))
+        losses = []
+        for _ in range(100):
+            loss = torch.nn.functional.mse_loss(model(data), label)
+            optim.zero_grad()
+            loss.backward()
+            optim.step()
+            losses.append(loss.item())
+        return losses, optim
+
+    losses, _ = train(False)
+    quantized_losses, quantized_optim = train(True)
+    state = next(iter(quantized_optim.state.values()))
+    assert state['exp_avg'].dtype == torch.uint8 and state['exp_avg_sq'].dtype == torch.uint8
+    assertLess(quantized_losses[-1], 0.5 * quantized_losses[0], f"loss {quantized_losses[0]} -> {quantized_losses[-1]}")
+    assertLess(abs(quantized_losses[-1] - losses[-1]), 0.1 * losses[-1] + 1e-3,
+               f"quantized loss {quantized_losses[-1]} vs fp32 loss {losses[-1]}")
+
+
+@parameterize('block_size', [100, 2**24])
+def test_cpu_adam_offload_states(block_size):
+    import tempfile
+
+    from colossalai.nn.optimizer import CPUAdam
+
+    torch.manual_seed(42)
+    # states of empty params are not offloaded
+    params = [torch.nn.Parameter(torch.rand(shape)) for shape in [(64,), (7, 33), (1,), (0,)]]
+    params_copy = [torch.nn.Parameter(p.data.clone()) for p in params]
+
+    def run_steps(optim, ref_optim, num_steps):
+        for _ in range(num_steps):
+            for p, p_copy in zip(params, params_copy):
+                p.grad = torch.rand_like(p)
+                p_copy.grad = p.grad.clone()
+            optim.step()
+            ref_optim.step()
+            for p, p_copy in zip(params, params_copy):
+                assert optim.disk_states.is_offloaded(p, optim.state[p]) == (p.numel() > 0)
+                assert torch.equal(p.data, p_copy.data)
+                assert torch.equal(optim.state[p]['exp_avg'], ref_optim.state[p_copy]['exp_avg'])
+                assert torch.equal(optim.state[p]['exp_avg_sq'], ref_optim.state[p_copy]['exp_avg_sq'])
+
+    with tempfile.TemporaryDirectory() as offload_dir:
+        optim = CPUAdam(params,
+                        lr=1e-3,
+                        weight_decay=1e-2,
+                        offload_states_dir=offload_dir,
+                        offload_states_block_size=block_size)
+        ref_optim = CPUAdam(params_copy, lr=1e-3, weight_decay=1e-2)
+        run_steps(optim, ref_optim, 4)
+
+        # loaded states are moved back to disk, by both a resumed and a fresh optimizer
+        state_dict = copy.deepcopy(optim.state_dict())
+        optim.load_state_dict(state_dict)
+        run_steps(optim, ref_optim, 1)
+        state_dict = copy.deepcopy(optim.state_dict())
+        del optim
+        new_optim = CPUAdam(params,
+                            lr=1e-3,
+                            weight_decay=1e-2,
+                            offload_states_dir=offload_dir,
+                            offload_states_block_size=block_size)
+        new_optim.load_state_dict(state_dict)
+        for p in params:
+            assert new_optim.disk_states.is_offloaded(p, new_optim.state[p]) == (p.numel() > 0)
+        run_steps(new_optim, ref_optim, 2)
+        del new_optim
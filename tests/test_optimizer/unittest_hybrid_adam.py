@@ -39,3 +39,61 @@ def test_adam(adamw, device, p_dtype, g_dtype):
             continue
         assert torch.allclose(p.data, p_copy.data, 1e-4, 1e-2), \
                               f"adaw mode {adamw}, device {device}, p_dtype {p_dtype}, g_dtype {g_dtype}"
+
+
+def test_param_partition_cache():
+    from colossalai.gemini.tensor_utils import colo_model_data_tensor_move_inline
+
+    torch.manual_seed(42)
+    # small and large params on CPU and GPU
+    params = [nn.Parameter(torch.rand(shape)) for shape in [(64,), (512, 512), (64,), (512, 512)]]
+    params[2].data = params[2].data.cuda()
+    params[3].data = params[3].data.cuda()
+    params_copy = [nn.Parameter(p.data.clone()) for p in params]
+    optim = HybridAdam(params, lr=1e-3, weight_decay=1e-2)
+    torch_optim = AdamW(params_copy, lr=1e-3, weight_decay=1e-2)
+
+    for i in range(6):
+        if i == 3:
+            # move a param and its states to GPU, the cached partition must be invalidated
+            for t in [params[1], optim.state[params[1]]['exp_avg'], optim.state[params[1]]['exp_avg_sq']]:
+                colo_model_data_tensor_move_inline(t, torch.device('cuda', torch.cuda.current_device()))
+        for p, p_copy in zip(params, params_copy):
+            p_copy.grad = torch.rand_like(p_copy)
+            p.grad = p_copy.grad.to(p.device)
+        optim.step()
+        torch_optim.step()
+        for p, p_copy in zip(params, params_copy):
+            assert torch.allclose(p.data, p_copy.data.to(p.device), 1e-4, 1e-3)
+
+    partition = optim._param_partitions[(0, tuple(map(id, params)))][1]
+    assert [id(p) for p, _ in partition['cuda']] == [id(p) for p in params[1:]]
+    assert [id(p) for p, _ in partition['cpu_batch']] == [id(params[0])]
+
+    # partitions are cached per list of params, e.g. chunks of a group stepped by ShardedOptimizerV2
+    group = optim.param_groups[0]
+    chunk_partitions = []
+    for chunk in [params[:2], params[2:]] * 2:
+        group['params'] = chunk
+        optim.step()
+        chunk_partitions.append(optim._get_param_partition(0, group))
+    group['params'] = params
+    assert chunk_partitions[0] is chunk_partitions[2] and chunk_partitions[1] is chunk_partitions[3]
+    assert optim._get_param_partition(0, group) is partition
+
+
+def test_param_partition_cache_offload():
+    from colossalai.gemini.tensor_utils import colo_model_data_move_to_cpu
+
+    # offloaded params whose grads are moved from GPU to CPU on every step
+    params = [nn.Parameter(torch.rand(shape)) for shape in [(64,), (512, 512)]]
+    optim = HybridAdam(params, lr=1e-3)
+    partitions = []
+    for _ in range(2):
+        for p in params:
+            p.grad = torch.rand_like(p, device=torch.cuda.current_device())
+            colo_model_data_move_to_cpu(p.grad)
+        optim.step()
+        partitions.append(optim._get_param_partition(0, optim.param_groups[0]))
+    # moving grads doesn't invalidate the cache
+    assert partitions[0] is partitions[1]
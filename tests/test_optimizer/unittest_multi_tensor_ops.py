@@ -0,0 +1,131 @@
+import copy
+
+import torch
+import torch.nn as nn
+from torch.optim import SGD, Adam, AdamW
+
+from colossalai.nn.optimizer import FusedAdam, FusedLAMB, FusedSGD, Lars
+from colossalai.testing import parameterize
+
+
+def run_optim(model, optim, steps=5):
+    torch.manual_seed(0)
+    for _ in range(steps):
+        optim.zero_grad()
+        model(torch.rand(16, 32)).pow(2).sum().backward()
+        optim.step()
+
+
+def make_models():
+    torch.manual_seed(42)
+    model = nn.Sequential(nn.Linear(32, 64), nn.ReLU(), nn.Linear(64, 8))
+    return model, copy.deepcopy(model)
+
+
+def assert_params_close(model, ref_model, rtol=1e-5, atol=1e-6):
+    for p, ref_p in zip(model.parameters(), ref_model.parameters()):
+        assert torch.allclose(p, ref_p, rtol=rtol, atol=atol)
+
+
+@parameterize('adamw', [False, True])
+@parameterize('weight_decay', [0., 0.1])
+def test_fused_adam_cpu(adamw, weight_decay):
+    model, ref_model = make_models()
+    torch_optim_cls = AdamW if adamw else Adam
+    run_optim(model, FusedAdam(model.parameters(), lr=1e-2, adamw_mode=adamw, weight_decay=weight_decay))
+    run_optim(ref_model, torch_optim_cls(ref_model.parameters(), lr=1e-2, weight_decay=weight_decay))
+    assert_params_close(model, ref_model)
+
+
+@parameterize('momentum', [0., 0.9])
+@parameterize('nesterov', [False, True])
+@parameterize('weight_decay', [0., 0.1])
+def test_fused_sgd_cpu(momentum, nesterov, weight_decay):
+    if nesterov and momentum == 0:
+        return
+    model, ref_model = make_models()
+    kwargs = dict(lr=1e-2, momentum=momentum, nesterov=nesterov, weight_decay=weight_decay)
+    run_optim(model, FusedSGD(model.parameters(), **kwargs))
+    run_optim(ref_model, SGD(ref_model.parameters(), **kwargs))
+    assert_params_close(model, ref_model)
+
+
+class RefLAMB(torch.optim.Optimizer):
+    """Per-tensor LAMB following the ``colossal_C.multi_tensor_lamb`` kernel."""
+
+    def __init__(self, params, lr, betas=(0.9, 0.999), eps=1e-6, weight_decay=0.01, max_grad_norm=1.0):
+        super().__init__(params, dict(lr=lr, betas=betas, eps=eps, weight_decay=weight_decay))
+        self.max_grad_norm = max_grad_norm
+
+    @torch.no_grad()
+    def step(self):
+        params = [p for group in self.param_groups for p in group['params'] if p.grad is not None]
+        global_grad_norm = torch.norm(torch.stack([p.grad.norm() for p in params]))
+        clip = global_grad_norm / self.max_grad_norm if global_grad_norm > self.max_grad_norm else 1.0
+        for group in self.param_groups:
+            beta1, beta2 = group['betas']
+            group['step'] = group.get('step', 0) + 1
+            for p in group['params']:
+                state = self.state[p]
+                if len(state) == 0:
+                    state['exp_avg'] = torch.zeros_like(p)
+                    state['exp_avg_sq'] = torch.zeros_like(p)
+                grad = p.grad / clip
+                state['exp_avg'].mul_(beta1).add_(grad, alpha=1 - beta1)
+                state['exp_avg_sq'].mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+                update = (state['exp_avg'] / (1 - beta1**group['step'])) / \
+                    ((state['exp_avg_sq'] / (1 - beta2**group['step'])).sqrt() + group['eps'])
+                update.add_(p, alpha=group['weight_decay'])
+                w_norm, u_norm = p.norm(), update.norm()
+                ratio = group['lr'] * w_norm / u_norm if w_norm > 0 and u_norm > 0 else group['lr']
+                p.sub_(ratio * update)
+
+
+def test_fused_lamb_cpu():
+    model, ref_model = make_models()
+    run_optim(model, FusedLAMB(model.parameters(), lr=1e-2))
+    run_optim(ref_model, RefLAMB(ref_model.parameters(), lr=1e-2))
+    assert_params_close(model, ref_model)
+
+
+class RefLars(torch.optim.Optimizer):
+    """Per-tensor LARS loop."""
+
+    def __init__(self, params, lr, momentum, eeta, weight_decay, epsilon=0.):
+        super().__init__(params, dict(lr=lr, momentum=momentum, eeta=eeta, weight_decay=weight_decay, epsilon=epsilon))
+
+    @torch.no_grad()
+    def step(self):
+        for group in self.param_groups:
+            for p in group['params']:
+                w_norm, g_norm = torch.norm(p), torch.norm(p.grad)
+                trust_ratio = torch.where(w_norm > 0 and g_norm > 0,
+                                          group['eeta'] * w_norm / (g_norm + group['weight_decay'] * w_norm +
+                                                                    group['epsilon']), torch.ones_like(w_norm))
+                scaled_lr = group['lr'] * trust_ratio.clamp_(0.0, 50).item()
+                decayed_grad = torch.clamp(p.grad.add(p, alpha=group['weight_decay']), -10.0, 10.0)
+                if group['momentum'] != 0:
+                    state = self.state[p]
+                    if 'momentum_buffer' not in state:
+                        state['momentum_buffer'] = decayed_grad.clone()
+                    else:
+                        state['momentum_buffer'].mul_(group['momentum']).add_(decayed_grad)
+                    decayed_grad = state['momentum_buffer']
+                p.add_(decayed_grad, alpha=-scaled_lr)
+
+
+@parameterize('momentum', [0., 0.9])
+@parameterize('weight_decay', [0., 0.1])
+def test_lars_multi_tensor(momentum, weight_decay):
+    model, ref_model = make_models()
+    kwargs = dict(lr=1e-1, momentum=momentum, eeta=1e-3, weight_decay=weight_decay)
+    run_optim(model, Lars(model.parameters(), **kwargs))
+    run_optim(ref_model, RefLars(ref_model.parameters(), **kwargs))
+    assert_params_close(model, ref_model)
+
+
+if __name__ == '__main__':
+    test_fused_adam_cpu()
+    test_fused_sgd_cpu()
+    test_fused_lamb_cpu()
+    test_lars_multi_tensor()
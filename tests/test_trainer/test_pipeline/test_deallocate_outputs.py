@@ -0,0 +1,84 @@
+import weakref
+from functools import partial
+
+import pytest
+import torch
+import torch.multiprocessing as mp
+import torch.nn as nn
+from colossalai.context import ParallelMode
+from colossalai.core import global_context as gpc
+from colossalai.engine import Engine
+from colossalai.engine.schedule import PipelineSchedule
+from colossalai.initialize import launch
+from colossalai.logging import disable_existing_loggers
+from colossalai.nn.optimizer import ColossalaiOptimizer
+from colossalai.testing import rerun_if_address_is_in_use
+from colossalai.utils import free_port
+
+CONFIG = dict(parallel=dict(pipeline=2))
+NUM_MICRO_BATCHES = 4
+HIDDEN_SIZE = 256
+
+
+def build_stage():
+    torch.manual_seed(42)
+    layers = [nn.Linear(HIDDEN_SIZE, HIDDEN_SIZE) for _ in range(4)]
+    if gpc.is_first_rank(ParallelMode.PIPELINE):
+        return nn.Sequential(layers[0], nn.ReLU(), layers[1])
+    return nn.Sequential(layers[2], nn.ReLU(), layers[3])
+
+
+def run_step(deallocate_outputs):
+    model = build_stage()
+    # account the bytes still held by the outputs of previous micro batches whenever a new one is produced
+    live_outputs, held_bytes = [], []
+
+    def account_outputs(module, inputs, output):
+        held_bytes.append(sum(out().storage().nbytes() for out in live_outputs if out() is not None))
+        live_outputs.append(weakref.ref(output))
+
+    model.register_forward_hook(account_outputs)
+    schedule = PipelineSchedule(NUM_MICRO_BATCHES, deallocate_outputs=deallocate_outputs)
+    optimizer = ColossalaiOptimizer(torch.optim.SGD(model.parameters(), lr=0.1))
+    engine = Engine(model, optimizer, criterion=nn.MSELoss(), schedule=schedule, verbose=False)
+    engine.train()
+
+    torch.manual_seed(0)
+    batch = (torch.randn(8 * NUM_MICRO_BATCHES, HIDDEN_SIZE), torch.randn(8 * NUM_MICRO_BATCHES, HIDDEN_SIZE))
+    engine.execute_schedule(iter([batch]), forward_only=False, return_loss=True)
+    return [p.grad for p in model.parameters()], max(held_bytes)
+
+
+def check_deallocate_outputs():
+    grads, held_bytes = run_step(deallocate_outputs=False)
+    dealloc_grads, dealloc_held_bytes = run_step(deallocate_outputs=True)
+
+    for grad, dealloc_grad in zip(grads, dealloc_grads):
+        assert torch.equal(grad, dealloc_grad)
+    if gpc.is_first_rank(ParallelMode.PIPELINE):
+        # the first stage keeps the output of the warmup micro batch until its backward pass
+        activation_bytes = 8 * HIDDEN_SIZE * 4
+        assert held_bytes >= activation_bytes
+        assert dealloc_held_bytes < activation_bytes
+    else:
+        # the last stage outputs the loss, which is not freed
+        assert dealloc_held_bytes == held_bytes
+
+
+def run_deallocate_outputs(rank, world_size, port):
+    disable_existing_loggers()
+    launch(config=CONFIG, rank=rank, world_size=world_size, host='localhost', port=port, backend='gloo')
+    check_deallocate_outputs()
+    gpc.destroy()
+
+
+@pytest.mark.dist
+@rerun_if_address_is_in_use()
+def test_deallocate_outputs():
+    world_size = 2
+    run_func = partial(run_deallocate_outputs, world_size=world_size, port=free_port())
+    mp.spawn(run_func, nprocs=world_size)
+
+
+if __name__ == '__main__':
+    test_deallocate_outputs()
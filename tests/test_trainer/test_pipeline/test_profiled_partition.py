@@ -0,0 +1,103 @@
+import itertools
+
+import pytest
+import torch
+import torch.nn as nn
+from colossalai.builder.pipeline import LayerProfile, partition_profiled, predict_pipeline_bubble, profile_layers
+
+
+def make_profiles(times, memory=None):
+    memory = memory or [0] * len(times)
+    return [LayerProfile(t / 3, 2 * t / 3, m) for t, m in zip(times, memory)]
+
+
+def brute_force_min_max(times, num_parts, max_memory=float('inf'), memory=None):
+    memory = memory or [0] * len(times)
+    best = float('inf')
+    for cuts in itertools.combinations(range(1, len(times)), num_parts - 1):
+        bounds = (0, *cuts, len(times))
+        parts = list(zip(bounds[:-1], bounds[1:]))
+        if any(sum(memory[st:ed]) > max_memory for st, ed in parts):
+            continue
+        best = min(best, max(sum(times[st:ed]) for st, ed in parts))
+    return best
+
+
+def stage_times(profiles, parts):
+    return [sum(p.time for st, ed in part for p in profiles[st:ed]) for part in parts]
+
+
+@pytest.mark.cpu
+def test_partition_profiled():
+    torch.manual_seed(0)
+    times = torch.randint(1, 20, (10,)).tolist()
+    memory = torch.randint(1, 10, (10,)).tolist()
+    profiles = make_profiles(times, memory)
+
+    parts = partition_profiled(profiles, 4, 1)
+    assert [len(part) for part in parts] == [1, 1, 1, 1]
+    assert sum(ed - st for part in parts for st, ed in part) == len(times)
+    assert max(stage_times(profiles, parts)) == pytest.approx(brute_force_min_max(times, 4))
+
+    # a memory cap trades time balance for activation memory
+    max_memory = 15
+    parts = partition_profiled(profiles, 4, 1, max_memory=max_memory)
+    assert all(sum(memory[st:ed]) <= max_memory for part in parts for st, ed in part)
+    assert max(stage_times(profiles, parts)) == pytest.approx(brute_force_min_max(times, 4, max_memory, memory))
+
+    with pytest.raises(ValueError):
+        partition_profiled(profiles, 4, 1, max_memory=max(memory) - 1)
+
+    # chunks are assigned to stages round robin
+    parts = partition_profiled(profiles, 2, 2)
+    assert [st for part in zip(*parts) for st, _ in part] == sorted(st for part in parts for st, _ in part)
+
+
+@pytest.mark.cpu
+def test_predict_pipeline_bubble():
+    profiles = make_profiles([1.] * 8)
+    parts = partition_profiled(profiles, 4, 1)
+    # balanced stages give the usual 1F1B bubble of (p - 1) / (m + p - 1)
+    assert predict_pipeline_bubble(profiles, parts, 8) == pytest.approx(3 / 11)
+    # interleaving shortens the bubble
+    interleaved_parts = partition_profiled(profiles, 4, 2)
+    assert predict_pipeline_bubble(profiles, interleaved_parts, 8) < predict_pipeline_bubble(profiles, parts, 8)
+    # an unbalanced partition has a larger bubble
+    assert predict_pipeline_bubble(profiles, [[(0, 5)], [(5, 6)], [(6, 7)], [(7, 8)]], 8) > 3 / 11
+
+
+@pytest.mark.cpu
+def test_profile_layers():
+    layers = [nn.Linear(16, 16), nn.ReLU(), nn.Linear(16, 1024), nn.Linear(1024, 16)]
+    profiles = profile_layers(layers, torch.randn(64, 16))
+    assert len(profiles) == len(layers)
+    assert all(p.forward_time > 0 and p.backward_time > 0 for p in profiles)
+    # linear layers save their input, relu its output, parameters are not counted
+    assert [p.activation_bytes for p in profiles] == [64 * 16 * 4, 64 * 16 * 4, 64 * 16 * 4, 64 * 1024 * 4]
+    assert all(p.grad is None for layer in layers for p in layer.parameters())
+
+    # the layers are split on their profiled cost
+    parts = partition_profiled(profiles, 2, 1)
+    assert parts[0][0][0] == 0 and parts[1][0][1] == len(layers)
+
+
+@pytest.mark.cpu
+def test_profile_layers_keeps_state():
+    torch.manual_seed(0)
+    layers = [nn.Linear(16, 16), nn.BatchNorm1d(16), nn.Dropout(0.5), nn.Linear(16, 16)]
+    sample_input = torch.randn(64, 16)
+    buffers = [buffer.clone() for layer in layers for buffer in layer.buffers()]
+    rng_state = torch.get_rng_state()
+
+    profile_layers(layers, sample_input)
+    # running statistics and the random state are restored after profiling
+    assert all(torch.equal(buffer, origin) for buffer, origin in zip(
+        [buffer for layer in layers for buffer in layer.buffers()], buffers))
+    assert torch.equal(torch.get_rng_state(), rng_state)
+
+
+if __name__ == '__main__':
+    test_partition_profiled()
+    test_predict_pipeline_bubble()
+    test_profile_layers()
+    test_profile_layers_keeps_state()
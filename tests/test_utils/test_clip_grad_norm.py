@@ -0,0 +1,73 @@
+from functools import partial
+
+import colossalai
+import pytest
+import torch
+import torch.multiprocessing as mp
+from colossalai.constants import IS_TENSOR_PARALLEL, NUM_PARTITIONS
+from colossalai.logging import disable_existing_loggers
+from colossalai.testing import parameterize, rerun_if_address_is_in_use
+from colossalai.utils import clip_grad_norm_fp32, free_port
+from torch._six import inf
+from torch.nn.utils import clip_grad_norm_
+
+
+def make_params(num_params=4, seed=0):
+    torch.manual_seed(seed)
+    params = []
+    for i in range(num_params):
+        p = torch.nn.Parameter(torch.randn(i + 3, 5))
+        p.grad = torch.randn_like(p) * (i + 1)
+        params.append(p)
+    return params
+
+
+@pytest.mark.cpu
+@parameterize('norm_type', [1.0, 2.0, inf])
+@parameterize('max_norm', [0.5, 1e4])
+def test_clip_grad_norm_local(norm_type, max_norm):
+    params = make_params()
+    torch_params = make_params()
+    total_norm = clip_grad_norm_fp32(params, max_norm, norm_type)
+    torch_total_norm = clip_grad_norm_(torch_params, max_norm, norm_type)
+    assert torch.is_tensor(total_norm)
+    assert torch.allclose(total_norm, torch_total_norm)
+    for p, torch_p in zip(params, torch_params):
+        assert torch.allclose(p.grad, torch_p.grad)
+    # params without grads have a zero norm
+    assert torch.equal(clip_grad_norm_fp32([torch.nn.Parameter(torch.randn(3))], max_norm, norm_type), torch.zeros(()))
+
+
+def run_tensor_parallel_clip(rank, world_size, port):
+    disable_existing_loggers()
+    config = dict(parallel=dict(tensor=dict(size=world_size, mode='1d')))
+    colossalai.launch(config=config, rank=rank, world_size=world_size, host='localhost', port=port, backend='gloo')
+
+    # a replicated param and a param partitioned over tensor parallel ranks
+    replicated, partitioned = make_params(2)
+    full_partitioned_grad = torch.randn(world_size * 4, 5)
+    partitioned.data = torch.empty(4, 5)
+    partitioned.grad = full_partitioned_grad.chunk(world_size)[rank].clone()
+    setattr(partitioned, IS_TENSOR_PARALLEL, True)
+    setattr(partitioned, NUM_PARTITIONS, world_size)
+
+    expected_norm = torch.cat([replicated.grad.flatten(), full_partitioned_grad.flatten()]).norm()
+    clip_coeff = 0.5 / (expected_norm + 1e-6)
+    expected_grads = [replicated.grad * clip_coeff, partitioned.grad * clip_coeff]
+    total_norm = clip_grad_norm_fp32([replicated, partitioned], 0.5)
+    assert torch.allclose(total_norm, expected_norm)
+    for p, expected_grad in zip((replicated, partitioned), expected_grads):
+        assert torch.allclose(p.grad, expected_grad)
+
+
+@pytest.mark.dist
+@rerun_if_address_is_in_use()
+def test_clip_grad_norm_tensor_parallel():
+    world_size = 2
+    run_func = partial(run_tensor_parallel_clip, world_size=world_size, port=free_port())
+    mp.spawn(run_func, nprocs=world_size)
+
+
+if __name__ == '__main__':
+    test_clip_grad_norm_local()
+    test_clip_grad_norm_tensor_parallel()
@@ -54,6 +54,15 @@ def run_pipelinable(rank):
 
     assert layers_count_in_part_0 + layers_count_in_part_1 == pipelinable.layers_count
 
+    pipelinable.load_policy("profiled")
+    pipelinable.profile_layers(torch.randn(8, 256), num_microbatches=4)
+    assert len(pipelinable.layer_profiles) == pipelinable.layers_count
+    pipeline_model_part_0 = pipelinable.partition(NUM_CHUNKS, PIPELINE_SIZE, 0)
+    pipeline_model_part_1 = pipelinable.partition(NUM_CHUNKS, PIPELINE_SIZE, 1)
+    assert len(pipeline_model_part_0._module_list) + len(pipeline_model_part_1._module_list) == \
+        pipelinable.layers_count
+    assert 0 < pipelinable.predicted_bubble < 1
+
 
 @rerun_on_exception(exception_type=mp.ProcessRaisedException, pattern=".*Address already in use.*")
 def test_pipelinable():
@@ -7,6 +7,7 @@ import colossalai
 import pytest
 import torch
 import torch.multiprocessing as mp
+import torch.nn as nn
 from colossalai.logging import get_dist_logger
 from colossalai.testing import parameterize, rerun_if_address_is_in_use
 from colossalai.utils import free_port
@@ -15,7 +16,9 @@ from colossalai.gemini.memory_tracer.model_data_memtracer import \
     colo_model_mem_usage
 from colossalai.utils.memory import colo_device_memory_used
 from colossalai.zero.init_ctx import ZeroInitContext
+from colossalai.zero.init_ctx.lazy_init import LazyInitRecorder
 from colossalai.zero.shard_utils import (BucketTensorShardStrategy, TensorShardStrategy)
+from colossalai.zero.shard_utils.commons import get_shard
 from tests.components_to_test.registry import non_distributed_component_funcs
 
 from common import CONFIG
@@ -23,7 +26,8 @@ from common import CONFIG
 
 @parameterize("init_device_type", ['cpu', 'cuda'])
 @parameterize("shard_strategy_class", [TensorShardStrategy, BucketTensorShardStrategy])
-def run_model_test(init_device_type, shard_strategy_class):
+@parameterize("lazy_init", [False, True])
+def run_model_test(init_device_type, shard_strategy_class, lazy_init):
     logger = get_dist_logger("test_zero_init")
 
     for get_components_func in non_distributed_component_funcs:
@@ -39,13 +43,15 @@ def run_model_test(init_device_type, shard_strategy_class):
         with ZeroInitContext(target_device=init_device,
                              shard_strategy=shard_strategy_class(),
                              shard_param=True,
-                             model_numel_tensor=model_numel_tensor):
+                             model_numel_tensor=model_numel_tensor,
+                             lazy_init=lazy_init):
             model = model_builder(checkpoint=True)
 
         for param in model.parameters():
             assert hasattr(param, 'colo_attr')
             assert param.colo_attr.sharded_data_tensor.dtype == torch.half
             assert param.colo_attr.sharded_data_tensor.is_sharded
+            assert not param.is_meta
             assert param.colo_attr.data_payload.device.type == init_device.type, \
                 f'{param.colo_attr.data_payload.device.type} vs. {init_device.type}'
 
@@ -70,5 +76,71 @@ def test_zero_init_context(world_size):
     mp.spawn(run_func, nprocs=world_size)
 
 
+def _lazy_init_params(world_size, rank, block_size, seed_rank=None):
+    recorder = LazyInitRecorder(seed=1024, block_size=block_size)
+    recorder.enable()
+    try:
+        linear = nn.Linear(5, 9)
+        norm = nn.LayerNorm(9)
+        embedding = nn.Embedding(6, 4)
+        embedding.weight.data.normal_(mean=0.0, std=0.02)
+        # assigning a slice makes the param materialized as a whole
+        partial_param = nn.Parameter(torch.empty(4, 4))
+        partial_param.data.fill_(1.)
+        partial_param.data[1] = 5.
+        params = [linear.weight, linear.bias, norm.weight, norm.bias, embedding.weight, partial_param]
+        assert all(p.is_meta for p in params)
+        return [recorder.materialize(p, rank, world_size, seed_rank) for p in params]
+    finally:
+        recorder.disable()
+
+
+@pytest.mark.cpu
+@pytest.mark.parametrize("world_size", [2, 3])
+@pytest.mark.parametrize("block_size", [7, 2**20])
+def test_lazy_init_recorder(world_size, block_size):
+    full_params = _lazy_init_params(1, 0, block_size)
+    assert torch.equal(full_params[2], torch.ones(9))
+    assert torch.equal(full_params[3], torch.zeros(9))
+    assert torch.equal(full_params[5][1], torch.full((4,), 5.))
+    assert full_params[0].abs().max() <= 1 / 5**0.5
+
+    for rank in range(world_size):
+        shards = _lazy_init_params(world_size, rank, block_size)
+        for full_param, shard in zip(full_params, shards):
+            assert torch.equal(shard, get_shard(full_param, rank, world_size)[0])
+
+
+
+@pytest.mark.cpu
+def test_lazy_init_seed_rank():
+    # params which are not replicated are initialized differently on each rank
+    params = _lazy_init_params(1, 0, 7, seed_rank=0)
+    other_params = _lazy_init_params(1, 0, 7, seed_rank=1)
+    assert not torch.equal(params[0], other_params[0])
+    assert not torch.equal(params[4], other_params[4])
+    assert torch.equal(params[2], other_params[2])
+    assert torch.equal(params[0], _lazy_init_params(1, 0, 7, seed_rank=0)[0])
+
+
+@pytest.mark.cpu
+def test_lazy_init_unrecorded_op():
+    recorder = LazyInitRecorder(seed=1024)
+    recorder.enable()
+    try:
+        linear = nn.Linear(5, 9)
+        with torch.no_grad():
+            linear.weight += 1.
+            # a recorded op afterwards doesn't hide the unrecorded one
+            linear.weight.mul_(2.)
+            torch.nn.init.eye_(linear.bias.view(3, 3))
+        with pytest.raises(RuntimeError):
+            recorder.materialize(linear.weight, 0, 1)
+        with pytest.raises(RuntimeError):
+            recorder.materialize(linear.bias, 0, 1)
+    finally:
+        recorder.disable()
+
+
 if __name__ == '__main__':
     test_zero_init_context(4)
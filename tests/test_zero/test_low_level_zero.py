@@ -0,0 +1,153 @@
+import copy
+from functools import partial
+
+import colossalai
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+from colossalai.testing import parameterize, rerun_if_address_is_in_use
+from colossalai.utils import free_port
+from colossalai.zero.sharded_optim import LowLevelZeroOptimizer
+
+CONFIG = dict(parallel=dict(pipeline=dict(size=1), tensor=dict(size=1, mode=None)))
+
+
+class MlpModel(nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.linear1 = nn.Linear(32, 64)
+        self.linear2 = nn.Linear(64, 16)
+        self.linear3 = nn.Linear(16, 8)
+
+    def forward(self, x):
+        return self.linear3(torch.relu(self.linear2(torch.relu(self.linear1(x)))))
+
+
+@parameterize("partition_grad", [False, True])
+@parameterize("reduce_bucket_size", [64, 2**24])
+def run_low_level_zero(partition_grad, reduce_bucket_size):
+    rank = dist.get_rank()
+    world_size = dist.get_world_size()
+
+    torch.manual_seed(42)
+    torch_model = MlpModel().cuda()
+    zero_model = copy.deepcopy(torch_model)
+    torch_optim = torch.optim.Adam(torch_model.parameters(), lr=1e-2)
+    zero_optim = LowLevelZeroOptimizer(torch.optim.Adam(zero_model.parameters(), lr=1e-2),
+                                       initial_scale=32,
+                                       reduce_bucket_size=reduce_bucket_size,
+                                       partition_grad=partition_grad)
+
+    for _ in range(3):
+        # accumulate gradients of 2 micro batches
+        for _ in range(2):
+            data = torch.randn(4, 32, device='cuda')
+            local_data = data + rank
+            zero_optim.backward(zero_model(local_data).sum())
+            # the reference averages gradients of all ranks
+            for r in range(world_size):
+                (torch_model(data + r).sum() / world_size).backward()
+        zero_optim.step()
+        zero_optim.zero_grad()
+        torch_optim.step()
+        torch_optim.zero_grad()
+
+        for torch_param, zero_param in zip(torch_model.parameters(), zero_model.parameters()):
+            assert zero_param.grad is None
+            assert torch.allclose(torch_param, zero_param, atol=1e-5)
+
+
+@parameterize("partition_grad", [False, True])
+def run_fp16_master_weights(partition_grad):
+    rank = dist.get_rank()
+    world_size = dist.get_world_size()
+
+    # the reference keeps fp32 master weights of fp16 params by hand
+    torch.manual_seed(42)
+    torch_model = MlpModel().cuda().half()
+    zero_model = copy.deepcopy(torch_model)
+    master_params = [p.detach().float().requires_grad_() for p in torch_model.parameters()]
+    torch_optim = torch.optim.SGD(master_params, lr=1e-2, momentum=0.9)
+    zero_optim = LowLevelZeroOptimizer(torch.optim.SGD(zero_model.parameters(), lr=1e-2, momentum=0.9),
+                                       initial_scale=32,
+                                       reduce_bucket_size=64,
+                                       partition_grad=partition_grad)
+    # master weights are fp32 copies of the fp16 params owned by this rank
+    for fp32_flat in zero_optim._fp32_flat_params:
+        assert fp32_flat.dtype == torch.float
+
+    for _ in range(3):
+        data = torch.randn(4, 32, device='cuda', dtype=torch.half)
+        zero_optim.backward(zero_model(data + rank).sum())
+        for r in range(world_size):
+            (torch_model(data + r).float().sum() / world_size).backward()
+        zero_optim.step()
+        zero_optim.zero_grad()
+        for p, master_p in zip(torch_model.parameters(), master_params):
+            master_p.grad = p.grad.float()
+            p.grad = None
+        torch_optim.step()
+        torch_optim.zero_grad()
+        for p, master_p in zip(torch_model.parameters(), master_params):
+            p.data.copy_(master_p.data)
+
+        for torch_param, zero_param in zip(torch_model.parameters(), zero_model.parameters()):
+            assert zero_param.dtype == torch.half
+            assert torch.allclose(torch_param, zero_param, atol=1e-2)
+
+
+@parameterize("partition_grad", [False, True])
+def run_overflow(partition_grad):
+    rank = dist.get_rank()
+
+    torch.manual_seed(42)
+    zero_model = MlpModel().cuda().half()
+    origin_params = [p.detach().clone() for p in zero_model.parameters()]
+    zero_optim = LowLevelZeroOptimizer(torch.optim.Adam(zero_model.parameters(), lr=1e-2),
+                                       initial_scale=32,
+                                       hysteresis=1,
+                                       reduce_bucket_size=64,
+                                       partition_grad=partition_grad)
+
+    data = torch.randn(4, 32, device='cuda', dtype=torch.half)
+    if rank == 0:
+        # overflow on one rank skips the step on all ranks
+        data[0, 0] = float('inf')
+    zero_optim.backward(zero_model(data).sum())
+    zero_optim.step()
+
+    assert zero_optim.loss_scale == 16
+    for p, origin_p in zip(zero_model.parameters(), origin_params):
+        assert p.grad is None
+        assert torch.equal(p, origin_p)
+    for fp32_flat in zero_optim._fp32_flat_params:
+        assert fp32_flat.grad is None
+
+    # the next step without overflow updates params
+    zero_optim.backward(zero_model(torch.randn(4, 32, device='cuda', dtype=torch.half)).sum())
+    zero_optim.step()
+    zero_optim.zero_grad()
+    assert zero_optim.loss_scale == 16
+    assert any(not torch.equal(p, origin_p) for p, origin_p in zip(zero_model.parameters(), origin_params))
+
+
+def run_dist(rank, world_size, port):
+    colossalai.launch(config=CONFIG, rank=rank, world_size=world_size, host='localhost', port=port, backend='nccl')
+    run_low_level_zero()
+    run_fp16_master_weights()
+    run_overflow()
+
+
+@pytest.mark.dist
+@pytest.mark.parametrize("world_size", [1, 2])
+@rerun_if_address_is_in_use()
+def test_low_level_zero(world_size):
+    run_func = partial(run_dist, world_size=world_size, port=free_port())
+    mp.spawn(run_func, nprocs=world_size)
+
+
+if __name__ == '__main__':
+    test_low_level_zero(2)
@@ -0,0 +1,100 @@
+from functools import partial
+
+import colossalai
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from colossalai.context.parallel_mode import ParallelMode
+from colossalai.core import global_context as gpc
+from colossalai.testing import parameterize, rerun_if_address_is_in_use
+from colossalai.utils import free_port
+from colossalai.zero.sharded_model._utils import chunk_and_pad
+from colossalai.zero.sharded_model.reduce_scatter import CompressedReduceScatterBucketer, ReduceScatterBucketer
+
+CONFIG = dict(parallel=dict(data=dict(intra_node_size=2), pipeline=dict(size=1), tensor=dict(size=1, mode=None)))
+
+
+@parameterize("bucket_size_mb", [0, 1])
+def run_hierarchical_reduce_scatter(bucket_size_mb):
+    world_size = dist.get_world_size()
+    intra_node_group = gpc.get_group(ParallelMode.DATA_INTRA_NODE)
+    inter_node_group = gpc.get_group(ParallelMode.DATA_INTER_NODE)
+    assert intra_node_group.size() == 2
+    assert inter_node_group.size() == world_size // 2
+
+    torch.manual_seed(dist.get_rank())
+    grads = [torch.randn(shape) for shape in [(7, 5), (3,), (1,), (64, 33)]]
+
+    flat_results, hierarchical_results = {}, {}
+    reducer = ReduceScatterBucketer(bucket_size_mb)
+    for i, grad in enumerate(grads):
+        reducer.reduce_scatter_async(chunk_and_pad(grad, world_size),
+                                     group=gpc.get_group(ParallelMode.DATA),
+                                     callback_fn=partial(flat_results.__setitem__, i))
+        reducer.hierarchical_reduce_scatter_async(chunk_and_pad(grad, world_size),
+                                                  intra_node_group=intra_node_group,
+                                                  inter_node_group=inter_node_group,
+                                                  callback_fn=partial(hierarchical_results.__setitem__, i))
+    reducer.flush()
+    reducer.free()
+
+    for i, grad in enumerate(grads):
+        full_grad = grad.clone()
+        dist.all_reduce(full_grad)
+        expected = chunk_and_pad(full_grad, world_size)[dist.get_rank()]
+        assert torch.allclose(flat_results[i], expected, atol=1e-5)
+        assert torch.allclose(hierarchical_results[i], expected, atol=1e-5)
+
+
+@parameterize("bucket_size_mb", [0, 1])
+def run_compressed_reduce_scatter(bucket_size_mb):
+    world_size = dist.get_world_size()
+    rank = dist.get_rank()
+    group = gpc.get_group(ParallelMode.DATA)
+
+    torch.manual_seed(rank)
+    grads = [torch.randn(shape) for shape in [(7, 5), (3,), (1,), (64, 33)]]
+    residuals = [torch.zeros(world_size, chunk_and_pad(grad, world_size)[0].numel()) for grad in grads]
+
+    reducer = CompressedReduceScatterBucketer(bucket_size_mb, block_size=16)
+    for step in range(3):
+        results = {}
+        compensated_grads = [torch.stack(chunk_and_pad(grad, world_size)) + res for grad, res in zip(grads, residuals)]
+        for i, grad in enumerate(grads):
+            reducer.reduce_scatter_async(chunk_and_pad(grad, world_size),
+                                         group=group,
+                                         callback_fn=partial(results.__setitem__, i),
+                                         residual=residuals[i])
+        reducer.flush()
+        reducer.free()
+
+        for i, grad in enumerate(grads):
+            full_grad = grad.clone()
+            dist.all_reduce(full_grad)
+            expected = chunk_and_pad(full_grad, world_size)[rank]
+            assert torch.allclose(results[i], expected, atol=0.1 * world_size)
+            # error feedback: compensated input equals the reduced output plus new quantization errors
+            compensated_sum = compensated_grads[i].clone()
+            dist.all_reduce(compensated_sum)
+            residual_sum = residuals[i].clone()
+            dist.all_reduce(residual_sum)
+            assert torch.allclose(results[i] + residual_sum[rank], compensated_sum[rank], atol=1e-5)
+
+
+def run_dist(rank, world_size, port):
+    colossalai.launch(config=CONFIG, rank=rank, world_size=world_size, host='localhost', port=port, backend='gloo')
+    run_hierarchical_reduce_scatter()
+    run_compressed_reduce_scatter()
+
+
+@pytest.mark.dist
+@pytest.mark.parametrize("world_size", [2, 4])
+@rerun_if_address_is_in_use()
+def test_reduce_scatter(world_size):
+    run_func = partial(run_dist, world_size=world_size, port=free_port())
+    mp.spawn(run_func, nprocs=world_size)
+
+
+if __name__ == '__main__':
+    test_reduce_scatter(4)
@@ -1,12 +1,14 @@
 #!/usr/bin/env python
 # -*- encoding: utf-8 -*-
 
+import copy
 from functools import partial
 
 import colossalai
 import pytest
 import torch
 import torch.multiprocessing as mp
+from colossalai.gemini.tensor_utils import colo_model_data_tensor_move_inline
 from colossalai.testing import parameterize, rerun_if_address_is_in_use
 from colossalai.utils import free_port
 from colossalai.zero.init_ctx import ZeroInitContext
@@ -22,34 +24,92 @@ from common import CONFIG, check_grads_padding, run_fwd_bwd
 
 @parameterize("enable_autocast", [True])
 @parameterize("shard_strategy_class", [BucketTensorShardStrategy])
-def run_model_test(enable_autocast, shard_strategy_class):
+@parameterize("grad_buffer_config", [
+    dict(persistent_grad_buffer=False),
+    dict(persistent_grad_buffer=True),
+    dict(persistent_grad_buffer=True, flat_grad_buffer=True)
+])
+def run_model_test(enable_autocast, shard_strategy_class, grad_buffer_config):
     test_models = ['repeated_computed_layers', 'resnet18', 'bert', 'no_leaf_module']
-    shard_strategy = shard_strategy_class()
     for model_name in test_models:
-        get_components_func = non_distributed_component_funcs.get_callable(model_name)
-        model_builder, train_dataloader, _, _, criterion = get_components_func()
-
-        with ZeroInitContext(target_device=torch.device('cuda', torch.cuda.current_device()),
-                             shard_strategy=shard_strategy,
-                             shard_param=True):
-            zero_model = model_builder(checkpoint=True)
-        zero_model = ShardedModelV2(zero_model, shard_strategy)
-
-        model = model_builder(checkpoint=True).half()
-        col_model_deepcopy(zero_model, model)
-        model = model.cuda()
-
-        model = DDP(model, device_ids=[torch.cuda.current_device()])
-
-        for i, (data, label) in enumerate(train_dataloader):
-            if i > 5:
-                break
-
-            data, label = cast_tensor_to_fp16(data).cuda(), label.cuda()
-            run_fwd_bwd(model, data, label, criterion, enable_autocast)
-            run_fwd_bwd(zero_model, data, label, criterion, enable_autocast)
-
-            check_grads_padding(model, zero_model, loose=True)
+        check_model(model_name, enable_autocast, shard_strategy_class(), **grad_buffer_config)
+
+
+def check_model(model_name, enable_autocast, shard_strategy, **zero_model_kwargs):
+    get_components_func = non_distributed_component_funcs.get_callable(model_name)
+    model_builder, train_dataloader, _, _, criterion = get_components_func()
+
+    with ZeroInitContext(target_device=torch.device('cuda', torch.cuda.current_device()),
+                         shard_strategy=shard_strategy,
+                         shard_param=True):
+        zero_model = model_builder(checkpoint=True)
+    zero_model = ShardedModelV2(zero_model, shard_strategy, **zero_model_kwargs)
+
+    model = model_builder(checkpoint=True).half()
+    col_model_deepcopy(zero_model, model)
+    model = model.cuda()
+
+    model = DDP(model, device_ids=[torch.cuda.current_device()])
+
+    for i, (data, label) in enumerate(train_dataloader):
+        if i > 5:
+            break
+
+        data, label = cast_tensor_to_fp16(data).cuda(), label.cuda()
+        run_fwd_bwd(model, data, label, criterion, enable_autocast)
+        run_fwd_bwd(zero_model, data, label, criterion, enable_autocast)
+
+        check_grads_padding(model, zero_model, loose=True)
+
+    if zero_model.persistent_grad_buffer:
+        # moving a saved gradient doesn't replace its persistent buffer
+        for param, grad_buffer in zero_model._grad_buffers.items():
+            if param.colo_attr.saved_grad.is_null():
+                continue
+            buffer_ptr, buffer_device = grad_buffer.data_ptr(), grad_buffer.device
+            assert param.colo_attr.grad_payload.data_ptr() == buffer_ptr
+            colo_model_data_tensor_move_inline(param.colo_attr.saved_grad, torch.device('cpu'))
+            assert grad_buffer.data_ptr() == buffer_ptr and grad_buffer.device == buffer_device
+
+
+def check_secondary_shards_without_backward(model_name, shard_strategy):
+    get_components_func = non_distributed_component_funcs.get_callable(model_name)
+    model_builder, train_dataloader, _, _, criterion = get_components_func()
+
+    with ZeroInitContext(target_device=torch.device('cuda', torch.cuda.current_device()),
+                         shard_strategy=shard_strategy,
+                         shard_param=True):
+        zero_model = model_builder(checkpoint=False)
+    zero_model = ShardedModelV2(zero_model, shard_strategy, intra_node_param_partition=True)
+    data, label = next(iter(train_dataloader))
+    data, label = cast_tensor_to_fp16(data).cuda(), label.cuda()
+
+    def forward():
+        return zero_model(data) if criterion else zero_model(data, label)
+
+    # eval and no-grad forwards keep no secondary shards
+    with torch.no_grad():
+        forward()
+    assert len(zero_model._zero_hook._secondary_shards) == 0
+    zero_model.eval()
+    forward()
+    assert len(zero_model._zero_hook._secondary_shards) == 0
+
+    # shards of a training forward without backward are dropped by the next forward
+    zero_model.train()
+    forward()
+    assert len(zero_model._zero_hook._secondary_shards) > 0
+    with torch.no_grad():
+        forward()
+    assert len(zero_model._zero_hook._secondary_shards) == 0
+
+
+@parameterize("shard_strategy_class", [TensorShardStrategy, BucketTensorShardStrategy])
+def run_intra_node_partition_test(shard_strategy_class):
+    # backward gathers params from secondary shards within the node
+    for model_name in ['repeated_computed_layers', 'bert']:
+        check_model(model_name, True, shard_strategy_class(), intra_node_param_partition=True)
+        check_secondary_shards_without_backward(model_name, shard_strategy_class())
 
 
 def run_dist(rank, world_size, port):
@@ -57,6 +117,13 @@ def run_dist(rank, world_size, port):
     run_model_test()
 
 
+def run_dist_intra_node(rank, world_size, port):
+    config = copy.deepcopy(CONFIG)
+    config['parallel']['data'] = dict(intra_node_size=2)
+    colossalai.launch(config=config, rank=rank, world_size=world_size, host='localhost', port=port, backend='nccl')
+    run_intra_node_partition_test()
+
+
 @pytest.mark.dist
 @pytest.mark.parametrize("world_size", [1, 2])
 @rerun_if_address_is_in_use()
@@ -65,5 +132,13 @@ def test_shard_model_v2(world_size):
     mp.spawn(run_func, nprocs=world_size)
 
 
+@pytest.mark.dist
+@pytest.mark.parametrize("world_size", [4])
+@rerun_if_address_is_in_use()
+def test_shard_model_v2_intra_node_partition(world_size):
+    run_func = partial(run_dist_intra_node, world_size=world_size, port=free_port())
+    mp.spawn(run_func, nprocs=world_size)
+
+
 if __name__ == '__main__':
     test_shard_model_v2(world_size=2)
@@ -29,6 +29,52 @@ def run_shard_tensor_with_strategy(shard_strategy_class, world_size):
     assert list(t.shape) == [world_size * 2, 3], f"{list(t.shape)} vs {[world_size * 2, 3]}"
 
 
+@parameterize("shard_strategy_class", [TensorShardStrategy, BucketTensorShardStrategy])
+@parameterize("dtype", [torch.float, torch.half])
+def run_quantized_gather(shard_strategy_class, dtype):
+    torch.manual_seed(42)
+    tensors = [torch.randn(shape).to(dtype) for shape in [(33, 17), (5,), (1000,)]]
+    ref = [ShardedTensor(tensor=t.clone()) for t in tensors]
+    quantized = [ShardedTensor(tensor=t.clone()) for t in tensors]
+
+    shard_strategy_class().shard(ref)
+    shard_strategy = shard_strategy_class(quantized_gather=True, quantize_block_size=64)
+    shard_strategy.shard(quantized)
+    local_shards = [t.payload.clone() for t in quantized]
+
+    shard_strategy_class().gather(ref)
+    shard_strategy.gather(quantized, quantize=True)
+    for t, r, q in zip(tensors, ref, quantized):
+        assert q.shape == r.shape and q.dtype == r.dtype
+        assert torch.equal(r.payload, t)
+        # int8 quantization error is at most half a step of absmax / 127 in each block
+        max_abs = t.float().abs().max().item()
+        assert torch.allclose(q.payload.float(), t.float(), atol=max_abs / 127 + 1e-3)
+
+    # the local shard is exact after gather and shard
+    shard_strategy.shard(quantized)
+    for q, local_shard in zip(quantized, local_shards):
+        assert torch.equal(q.payload, local_shard)
+
+    # gathers not for computation are exact
+    shard_strategy.gather(quantized)
+    for t, q in zip(tensors, quantized):
+        assert torch.equal(q.payload, t)
+
+
+def _run_quantized_gather(rank, world_size, port):
+    colossalai.launch(config=CONFIG, rank=rank, world_size=world_size, host='localhost', port=port, backend='gloo')
+    run_quantized_gather()
+
+
+@pytest.mark.dist
+@pytest.mark.parametrize("world_size", [1, 2, 3])
+@rerun_if_address_is_in_use()
+def test_quantized_gather(world_size):
+    run_func = partial(_run_quantized_gather, world_size=world_size, port=free_port())
+    mp.spawn(run_func, nprocs=world_size)
+
+
 def _run_shard_tensor(rank, world_size, port):
     colossalai.launch(config=CONFIG, rank=rank, world_size=world_size, host='localhost', port=port, backend='nccl')
     run_shard_tensor_with_strategy(world_size=world_size)
@@ -0,0 +1,201 @@
+from functools import partial
+
+import colossalai
+import pytest
+import torch
+import torch.multiprocessing as mp
+from colossalai.nn.optimizer import HybridAdam
+from colossalai.nn.optimizer.utils import (QUANTIZED_ADAM_STATES, dequantize_dynamic_blockwise,
+                                           quantize_dynamic_blockwise)
+from colossalai.testing import parameterize, rerun_if_address_is_in_use
+from colossalai.utils import free_port
+from colossalai.utils.cuda import get_current_device
+from colossalai.zero.init_ctx import ZeroInitContext
+from colossalai.zero.shard_utils import TensorShardStrategy
+from colossalai.zero.shard_utils.commons import get_shard
+from colossalai.zero.sharded_model import ShardedModelV2
+from colossalai.zero.sharded_optim import ShardedOptimizerV2
+from colossalai.zero.sharded_optim.utils import reshard_optimizer_state_dicts
+from tests.components_to_test.registry import non_distributed_component_funcs
+from tests.test_zero.test_sharded_optim_v2 import _run_step
+
+from common import CONFIG
+
+
+def _build_zero(model_builder, cpu_offload):
+    shard_strategy = TensorShardStrategy()
+    with ZeroInitContext(target_device=torch.device('cpu') if cpu_offload else get_current_device(),
+                         shard_strategy=shard_strategy,
+                         shard_param=True):
+        zero_model = model_builder(checkpoint=True)
+    zero_model = ShardedModelV2(zero_model, shard_strategy, tensor_placement_policy='cpu' if cpu_offload else 'cuda')
+    optim = HybridAdam(zero_model.parameters(), lr=1e-3)
+    return zero_model, ShardedOptimizerV2(zero_model, optim, initial_scale=2**5)
+
+
+@parameterize("cpu_offload", [True, False])
+def run_optim_state_dict(cpu_offload):
+    get_components_func = non_distributed_component_funcs.get_callable('repeated_computed_layers')
+    model_builder, train_dataloader, _, _, criterion = get_components_func()
+
+    zero_model, zero_optim = _build_zero(model_builder, cpu_offload)
+    for i, (data, label) in enumerate(train_dataloader):
+        if i > 1:
+            break
+        _run_step(zero_model, zero_optim, data.cuda(), label.cuda(), criterion)
+    state_dict = zero_optim.state_dict()
+
+    new_model, new_optim = _build_zero(model_builder, cpu_offload)
+    new_optim.load_state_dict(state_dict)
+
+    for p, new_p in zip(zero_optim.optim.param_groups[0]['params'], new_optim.optim.param_groups[0]['params']):
+        assert torch.equal(zero_optim.master_params[p].payload, new_optim.master_params[new_p].payload)
+        assert torch.equal(p.colo_attr.data_payload, new_p.colo_attr.data_payload)
+        for k, v in zero_optim.optim.state[p].items():
+            new_v = new_optim.optim.state[new_p][k]
+            if torch.is_tensor(v):
+                assert torch.equal(v, new_v)
+            else:
+                assert v == new_v
+    assert zero_optim.loss_scale == new_optim.loss_scale
+
+
+def run_dist(rank, world_size, port):
+    colossalai.launch(config=CONFIG, rank=rank, world_size=world_size, host='localhost', port=port, backend='nccl')
+    run_optim_state_dict()
+
+
+@pytest.mark.dist
+@pytest.mark.parametrize("world_size", [1, 2])
+@rerun_if_address_is_in_use()
+def test_sharded_optim_state_dict(world_size):
+    run_func = partial(run_dist, world_size=world_size, port=free_port())
+    mp.spawn(run_func, nprocs=world_size)
+
+
+@pytest.mark.cpu
+@pytest.mark.parametrize("old_world_size, new_world_size", [(2, 3), (4, 1), (3, 2)])
+def test_reshard_optimizer_state_dicts(old_world_size, new_world_size):
+    # the last param is replicated but not sharded, e.g. created by `no_shard_zero_context`
+    full_tensors = [torch.randn(7, 5), torch.randn(3), torch.randn(4, 2)]
+    is_sharded = [True, True, False]
+
+    def build_state_dict(world_size, rank):
+        masters = {
+            idx: get_shard(t, rank, world_size)[0] if sharded else t.clone()
+            for idx, (t, sharded) in enumerate(zip(full_tensors, is_sharded))
+        }
+        return {
+            'optim_state_dict': {
+                'state': {idx: dict(step=3, exp_avg=2 * m, exp_avg_sq=m * m) for idx, m in masters.items()},
+                'param_groups': [dict(lr=1e-3, params=list(masters.keys()))]
+            },
+            'master_params': masters,
+            'grad_scaler': dict(scale=torch.tensor([32.])),
+            'shard_metadata': {
+                'rank': rank,
+                'world_size': world_size,
+                'params': {
+                    idx: dict(origin_shape=t.shape, is_sharded=sharded, is_replicated=True)
+                    for idx, (t, sharded) in enumerate(zip(full_tensors, is_sharded))
+                }
+            }
+        }
+
+    old_state_dicts = [build_state_dict(old_world_size, rank) for rank in range(old_world_size)]
+    new_state_dicts = reshard_optimizer_state_dicts(old_state_dicts, new_world_size)
+    expected_state_dicts = [build_state_dict(new_world_size, rank) for rank in range(new_world_size)]
+
+    for new_sd, expected_sd in zip(new_state_dicts, expected_state_dicts):
+        assert new_sd['shard_metadata']['rank'] == expected_sd['shard_metadata']['rank']
+        assert new_sd['shard_metadata']['world_size'] == new_world_size
+        for idx in range(len(full_tensors)):
+            assert torch.equal(new_sd['master_params'][idx], expected_sd['master_params'][idx])
+            new_state = new_sd['optim_state_dict']['state'][idx]
+            expected_state = expected_sd['optim_state_dict']['state'][idx]
+            assert new_state['step'] == expected_state['step']
+            assert torch.equal(new_state['exp_avg'], expected_state['exp_avg'])
+            assert torch.equal(new_state['exp_avg_sq'], expected_state['exp_avg_sq'])
+
+
+@pytest.mark.cpu
+@pytest.mark.parametrize("old_world_size, new_world_size", [(2, 3), (3, 2)])
+def test_reshard_quantized_states(old_world_size, new_world_size):
+    full_tensor = torch.randn(37)
+    block_size = 4
+
+    def build_state_dict(world_size, rank):
+        master = get_shard(full_tensor, rank, world_size)[0]
+        state = dict(step=3)
+        for name, signed in QUANTIZED_ADAM_STATES.items():
+            value = master if signed else master.abs()
+            state[name], state[f'{name}_absmax'] = quantize_dynamic_blockwise(value, block_size, signed)
+        return {
+            'optim_state_dict': {
+                'state': {
+                    0: state
+                },
+                'param_groups': [dict(lr=1e-3, params=[0])]
+            },
+            'master_params': {
+                0: master
+            },
+            'grad_scaler': dict(scale=torch.tensor([32.])),
+            'shard_metadata': {
+                'rank': rank,
+                'world_size': world_size,
+                'params': {
+                    0: dict(origin_shape=full_tensor.shape, is_sharded=True, is_replicated=True)
+                }
+            }
+        }
+
+    old_state_dicts = [build_state_dict(old_world_size, rank) for rank in range(old_world_size)]
+    new_state_dicts = reshard_optimizer_state_dicts(old_state_dicts, new_world_size)
+
+    def dequantize_full(state_dicts):
+        values = {name: [] for name in QUANTIZED_ADAM_STATES}
+        for sd in state_dicts:
+            state, numel = sd['optim_state_dict']['state'][0], sd['master_params'][0].numel()
+            for name, signed in QUANTIZED_ADAM_STATES.items():
+                values[name].append(
+                    dequantize_dynamic_blockwise(state[name], state[f'{name}_absmax'], numel, signed))
+        return {name: torch.cat(shards)[:full_tensor.numel()] for name, shards in values.items()}
+
+    old_values, new_values = dequantize_full(old_state_dicts), dequantize_full(new_state_dicts)
+    for sd in new_state_dicts:
+        state = sd['optim_state_dict']['state'][0]
+        assert state['step'] == 3
+        assert state['exp_avg'].shape[-1] == block_size
+    for name in QUANTIZED_ADAM_STATES:
+        # states are requantized with new blocks, so only the quantization error is added
+        assert torch.allclose(new_values[name], old_values[name], rtol=0.1, atol=1e-2)
+
+
+@pytest.mark.cpu
+def test_reshard_unmatched_states():
+    state_dicts = [{
+        'optim_state_dict': {
+            'state': {
+                0: dict(step=1, unknown=torch.zeros(2))
+            },
+            'param_groups': [dict(lr=1e-3, params=[0])]
+        },
+        'master_params': {
+            0: torch.zeros(4)
+        },
+        'grad_scaler': {},
+        'shard_metadata': {
+            'rank': rank,
+            'world_size': 2,
+            'params': {
+                0: dict(origin_shape=torch.Size([8]), is_sharded=True, is_replicated=True)
+            }
+        }
+    } for rank in range(2)]
+    with pytest.raises(RuntimeError):
+        reshard_optimizer_state_dicts(state_dicts, 1)
+
+
+if __name__ == '__main__':
+    test_sharded_optim_state_dict(2)
@@ -15,7 +15,7 @@ from colossalai.zero.shard_utils import (BucketTensorShardStrategy, TensorShardS
 from colossalai.zero.sharded_model import ShardedModelV2
 from colossalai.zero.sharded_model.utils import col_model_deepcopy
 from colossalai.zero.sharded_optim import ShardedOptimizerV2
-from colossalai.zero.sharded_optim._utils import has_inf_or_nan
+from colossalai.zero.sharded_optim._utils import has_inf_or_nan, knapsack
 from tests.components_to_test.registry import non_distributed_component_funcs
 from torch.nn.parallel import DistributedDataParallel as DDP
 
@@ -44,7 +44,9 @@ def _run_step(model, optimizer, data, label, criterion, enable_autocast=False):
 @parameterize("use_cpuadam", [True, False])
 @parameterize("shard_strategy_class", [TensorShardStrategy, BucketTensorShardStrategy])
 @parameterize("gpu_margin_mem_ratio", [0.0, 0.7])
-def _run_test_sharded_optim_v2(cpu_offload, shard_strategy_class, use_cpuadam, gpu_margin_mem_ratio):
+@parameterize("pipeline_step_chunk_size", [0, 1024])
+def _run_test_sharded_optim_v2(cpu_offload, shard_strategy_class, use_cpuadam, gpu_margin_mem_ratio,
+                               pipeline_step_chunk_size):
     test_models = ['repeated_computed_layers', 'resnet18', 'bert', 'no_leaf_module']
     shard_strategy = shard_strategy_class()
 
@@ -52,6 +54,8 @@ def _run_test_sharded_optim_v2(cpu_offload, shard_strategy_class, use_cpuadam, g
         return
     if gpu_margin_mem_ratio > 0.0 and not (cpu_offload and use_cpuadam):
         return
+    if pipeline_step_chunk_size > 0 and not cpu_offload:
+        return
 
     for model_name in test_models:
         get_components_func = non_distributed_component_funcs.get_callable(model_name)
@@ -79,7 +83,8 @@ def _run_test_sharded_optim_v2(cpu_offload, shard_strategy_class, use_cpuadam, g
         sharded_optim = ShardedOptimizerV2(zero_model,
                                            sharded_optim,
                                            initial_scale=2**5,
-                                           gpu_margin_mem_ratio=gpu_margin_mem_ratio)
+                                           gpu_margin_mem_ratio=gpu_margin_mem_ratio,
+                                           pipeline_step_chunk_size=pipeline_step_chunk_size)
 
         amp_config = dict(opt_level='O2', keep_batchnorm_fp32=False)
         apex_model, apex_optimizer = convert_to_apex_amp(model, optim, amp_config)
@@ -97,9 +102,44 @@ def _run_test_sharded_optim_v2(cpu_offload, shard_strategy_class, use_cpuadam, g
                 assert not has_inf_or_nan(param)
 
 
+def _run_test_pipelined_step_growing_scale():
+    get_components_func = non_distributed_component_funcs.get_callable('repeated_computed_layers')
+    model_builder, train_dataloader, _, _, criterion = get_components_func()
+    shard_strategy = TensorShardStrategy()
+
+    zero_models, sharded_optims = [], []
+    for pipeline_step_chunk_size in [0, 1024]:
+        with ZeroInitContext(target_device=torch.device('cpu'), shard_strategy=shard_strategy, shard_param=True):
+            zero_model = model_builder(checkpoint=True)
+        zero_model = ShardedModelV2(zero_model, shard_strategy, tensor_placement_policy='cpu')
+        if len(zero_models) > 0:
+            for p, src_p in zip(zero_model.parameters(), zero_models[0].parameters()):
+                p.colo_attr.sharded_data_tensor.payload.copy_(src_p.colo_attr.sharded_data_tensor.payload)
+        # the loss scale grows on every step, grads must be unscaled by the scale used in backward
+        sharded_optim = ShardedOptimizerV2(zero_model,
+                                           CPUAdam(zero_model.parameters(), lr=1e-3),
+                                           initial_scale=2**5,
+                                           growth_interval=1,
+                                           pipeline_step_chunk_size=pipeline_step_chunk_size)
+        zero_models.append(zero_model)
+        sharded_optims.append(sharded_optim)
+
+    for i, (data, label) in enumerate(train_dataloader):
+        if i > 3:
+            break
+        data, label = data.cuda(), label.cuda()
+        for zero_model, sharded_optim in zip(zero_models, sharded_optims):
+            _run_step(zero_model, sharded_optim, data, label, criterion, False)
+        assert sharded_optims[0].loss_scale == sharded_optims[1].loss_scale == 2**(6 + i)
+        for p, pipelined_p in zip(zero_models[0].parameters(), zero_models[1].parameters()):
+            assert torch.allclose(sharded_optims[0].master_params[p].payload,
+                                  sharded_optims[1].master_params[pipelined_p].payload)
+
+
 def _run_dist(rank, world_size, port):
     colossalai.launch(config=CONFIG, rank=rank, world_size=world_size, host='localhost', port=port, backend='nccl')
     _run_test_sharded_optim_v2()
+    _run_test_pipelined_step_growing_scale()
 
 
 # use_cpuadam = True can be used with cpu_offload = False
@@ -111,5 +151,16 @@ def test_sharded_optim_v2(world_size):
     mp.spawn(run_func, nprocs=world_size)
 
 
+@pytest.mark.cpu
+def test_knapsack():
+    # greedy placement in order would only take the first shard
+    assert knapsack([60, 50, 50], [60, 50, 50], 100) == [1, 2]
+    assert knapsack([5, 3, 4, 0], [10, 4, 7, 1], 7) == [1, 2, 3]
+    assert knapsack([5, 3], [5, 3], 0) == []
+    # weights are rounded up to units, so the selection never exceeds the capacity
+    selected = knapsack([333, 334, 335], [333, 334, 335], 1000, num_units=10)
+    assert sum([333, 334, 335][i] for i in selected) <= 1000
+
+
 if __name__ == '__main__':
     test_sharded_optim_v2(world_size=2)
@@ -1,19 +1,23 @@
 #!/usr/bin/env python
 # -*- encoding: utf-8 -*-
 
+import os
+import tempfile
 from copy import deepcopy
 from functools import partial
 
 import colossalai
 import pytest
 import torch
+import torch.distributed as dist
 import torch.multiprocessing as mp
 from colossalai.testing import parameterize, rerun_if_address_is_in_use
 from colossalai.utils import free_port
 from colossalai.zero.init_ctx import ZeroInitContext
 from colossalai.zero.shard_utils import (BucketTensorShardStrategy, TensorShardStrategy)
 from colossalai.zero.sharded_model import ShardedModelV2
-from colossalai.zero.sharded_model.utils import col_model_deepcopy
+from colossalai.zero.sharded_model.utils import (col_model_deepcopy, load_state_dict_streaming,
+                                                 save_state_dict_streaming)
 from tests.components_to_test.registry import non_distributed_component_funcs
 
 from common import CONFIG
@@ -42,9 +46,80 @@ def run_zero_state_dict(shard_strategy_class):
             assert torch.equal(val, zero_state_dict[key])
 
 
+@parameterize("shard_strategy_class", [TensorShardStrategy, BucketTensorShardStrategy])
+def run_zero_sharded_state_dict(shard_strategy_class):
+    test_models = ['repeated_computed_layers', 'resnet18']
+    shard_strategy = shard_strategy_class()
+    for model_name in test_models:
+        get_components_func = non_distributed_component_funcs.get_callable(model_name)
+        model_builder, train_dataloader, test_dataloader, optimizer, criterion = get_components_func()
+
+        with ZeroInitContext(target_device=torch.device('cuda', torch.cuda.current_device()),
+                             shard_strategy=shard_strategy,
+                             shard_param=True):
+            zero_model = model_builder(checkpoint=True)
+        zero_model = ShardedModelV2(zero_model, shard_strategy)
+        full_state_dict = zero_model.state_dict()
+
+        # sharded state dict only holds local shards
+        sharded_state_dict = zero_model.sharded_state_dict()
+        for name, p in zero_model.named_parameters():
+            if p.colo_attr.param_is_sharded:
+                assert name in sharded_state_dict._shard_metadata
+                assert sharded_state_dict[name].numel() == p.colo_attr.sharded_data_tensor.payload.numel()
+            sharded_state_dict[name] = sharded_state_dict[name].clone()
+            p.colo_attr.sharded_data_tensor.payload.zero_()
+        zero_model.load_state_dict(sharded_state_dict)
+        for key, val in zero_model.state_dict().items():
+            assert torch.equal(val, full_state_dict[key])
+
+        # streaming export and load
+        checkpoint_dir = os.path.join(tempfile.gettempdir(), f'zero_state_dict_{model_name}')
+        save_state_dict_streaming(zero_model, checkpoint_dir, max_file_size_mb=0)
+        dist.barrier()
+        for p in zero_model.parameters():
+            p.colo_attr.sharded_data_tensor.payload.zero_()
+        load_state_dict_streaming(zero_model, checkpoint_dir)
+        for key, val in zero_model.state_dict().items():
+            assert torch.equal(val, full_state_dict[key])
+        dist.barrier()
+
+
+@parameterize("shard_strategy_class", [TensorShardStrategy, BucketTensorShardStrategy])
+def run_zero_state_dict_quantized_gather(shard_strategy_class):
+    get_components_func = non_distributed_component_funcs.get_callable('repeated_computed_layers')
+    model_builder, train_dataloader, test_dataloader, optimizer, criterion = get_components_func()
+    # only gathers for computation are quantized
+    shard_strategy = shard_strategy_class(quantized_gather=True)
+    with ZeroInitContext(target_device=torch.device('cuda', torch.cuda.current_device()),
+                         shard_strategy=shard_strategy,
+                         shard_param=True):
+        zero_model = model_builder(checkpoint=True)
+    zero_model = ShardedModelV2(zero_model, shard_strategy)
+
+    world_size = dist.get_world_size()
+    expected_state_dict = {}
+    for name, p in zero_model.named_parameters():
+        t = p.colo_attr.sharded_data_tensor
+        shards = [torch.empty_like(t.payload) for _ in range(world_size)]
+        dist.all_gather(shards, t.payload)
+        expected_state_dict[name] = torch.cat(shards)[:t.origin_numel].view(t.origin_shape)
+
+    zero_state_dict = zero_model.state_dict()
+    model = model_builder(checkpoint=True).half()
+    col_model_deepcopy(zero_model, model)
+    model = model.cuda()
+    model_state_dict = model.state_dict()
+    for name, val in expected_state_dict.items():
+        assert torch.equal(val, zero_state_dict[name])
+        assert torch.equal(val, model_state_dict[name])
+
+
 def run_dist(rank, world_size, port):
     colossalai.launch(config=CONFIG, rank=rank, world_size=world_size, host='localhost', port=port, backend='nccl')
     run_zero_state_dict()
+    run_zero_sharded_state_dict()
+    run_zero_state_dict_quantized_gather()
 
 
 @pytest.mark.dist